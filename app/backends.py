@@ -0,0 +1,149 @@
+"""
+Optimized CPU inference backends for the ResNet50 backbone
+
+Only the conv backbone (conv1 through layer4) is swapped out. The avgpool/fc
+head always stays in eager fp32 so the fused Grad-CAM path can still
+backpropagate from the logits to the layer4 activations.
+"""
+import copy
+import os
+
+import torch
+import torch.nn as nn
+
+from .utils.preprocessing import load_image_from_bytes, preprocess_batch, MODEL_INPUT_SIZE
+
+INFERENCE_BACKENDS = ("eager", "channels_last", "torchscript", "compile", "static_int8")
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+class ResNetBackbone(nn.Module):
+    """ResNet forward up to (and including) layer4, sharing the model's modules"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.conv1 = model.conv1
+        self.bn1 = model.bn1
+        self.relu = model.relu
+        self.maxpool = model.maxpool
+        self.layer1 = model.layer1
+        self.layer2 = model.layer2
+        self.layer3 = model.layer3
+        self.layer4 = model.layer4
+
+    def forward(self, x):
+        x = self.maxpool(self.relu(self.bn1(self.conv1(x))))
+        x = self.layer1(x)
+        x = self.layer2(x)
+        x = self.layer3(x)
+        return self.layer4(x)
+
+
+class ExplainableResNet(nn.Module):
+    """
+    ResNet returning logits plus a Grad-CAM map for every class
+
+    With a global-average-pooled linear head, d(logit_c)/d(A_k) is W_ck / (H*W)
+    at every location, so Grad-CAM reduces to a weighted sum of the layer4
+    activations. Exporting this wrapper lets runtimes without autograd
+    (ONNX Runtime) explain predictions; apply ReLU to the selected class map.
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.backbone = ResNetBackbone(model)
+        self.avgpool = model.avgpool
+        self.fc = model.fc
+
+    def forward(self, x):
+        features = self.backbone(x)
+        logits = self.fc(torch.flatten(self.avgpool(features), 1))
+        n, k, h, w = features.shape
+        cams = torch.matmul(self.fc.weight, features.reshape(n, k, h * w)) / (h * w)
+        return logits, cams.reshape(n, -1, h, w)
+
+
+class ChannelsLastBackbone(nn.Module):
+    """Runs the backbone in NHWC memory format, which oneDNN convolutions prefer on CPU"""
+
+    def __init__(self, backbone):
+        super().__init__()
+        self.backbone = backbone.to(memory_format=torch.channels_last)
+
+    def forward(self, x):
+        return self.backbone(x.contiguous(memory_format=torch.channels_last)).contiguous()
+
+
+def load_calibration_batches(data_dir, max_images=64, batch_size=16):
+    """Preprocessed image batches from data_dir (searched recursively) for int8 calibration"""
+    paths = []
+    for root, _, files in sorted(os.walk(data_dir)):
+        paths.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(IMAGE_EXTENSIONS))
+    paths = paths[:max_images]
+
+    batches = []
+    for start in range(0, len(paths), batch_size):
+        images = []
+        for path in paths[start:start + batch_size]:
+            with open(path, "rb") as f:
+                images.append(load_image_from_bytes(f.read(), target_size=MODEL_INPUT_SIZE))
+        batches.append(preprocess_batch(images))
+    return batches
+
+
+def _quantize_static(backbone, calibration_batches, example):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    if not calibration_batches:
+        raise ValueError("static_int8 needs calibration images (see BLADEGUARD_QUANT_CALIBRATION_DIR)")
+
+    engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "qnnpack"
+    torch.backends.quantized.engine = engine
+
+    # Work on a copy so the fp32 model (used for reference/fallback) stays untouched
+    prepared = prepare_fx(copy.deepcopy(backbone), get_default_qconfig_mapping(engine), (example,))
+    with torch.no_grad():
+        for batch in calibration_batches:
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+def build_backbone(model, backend="eager", calibration_batches=None, device="cpu"):
+    """
+    Build the layer4 feature extractor for the selected backend
+
+    Args:
+        model: fp32 torchvision ResNet in eval mode
+        backend: One of INFERENCE_BACKENDS
+        calibration_batches: Input batches for static_int8 calibration
+        device: Device the model lives on (int8 is CPU only)
+
+    Returns:
+        Callable mapping a (N, 3, 224, 224) tensor to layer4 activations
+    """
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {INFERENCE_BACKENDS}")
+
+    backbone = ResNetBackbone(model).eval()
+    example = torch.randn(1, 3, *MODEL_INPUT_SIZE, device=device)
+
+    if backend == "eager":
+        return backbone
+
+    if backend == "channels_last":
+        return ChannelsLastBackbone(copy.deepcopy(backbone)).eval()
+
+    if backend == "torchscript":
+        with torch.no_grad():
+            traced = torch.jit.trace(backbone, example)
+        return torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+    if backend == "compile":
+        return torch.compile(backbone)
+
+    # static_int8
+    if device != "cpu":
+        raise ValueError("static_int8 is only supported on CPU")
+    return _quantize_static(backbone, calibration_batches, example)
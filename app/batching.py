@@ -0,0 +1,150 @@
+"""
+Dynamic micro-batching for model inference
+
+Concurrent callers submit single-image tensors. A background worker groups
+them into one batch (bounded by size and wait time), runs the model once and
+hands each caller back its own result.
+"""
+import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+
+
+_STOP = object()
+
+# The worker thread does not survive a fork; forked children (e.g. gunicorn
+# workers) start their own on first submit. Held weakly so that retired
+# schedulers and the models they reference can be freed.
+_schedulers = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for scheduler in list(_schedulers):
+        scheduler._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class BatchScheduler:
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=5.0):
+        """
+        Args:
+            batch_fn: Callable taking a (N, C, H, W) tensor and returning a
+                list of N per-image results
+            max_batch_size: Maximum number of images per forward pass
+            max_wait_ms: Maximum time to wait for a batch to fill after the
+                first image arrives
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._closed = False
+        _schedulers.add(self)
+
+    def _reset_after_fork(self):
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+
+    @property
+    def queue_depth(self):
+        """Images waiting to be picked up for a batch"""
+        return self._queue.qsize()
+
+    def submit(self, tensor):
+        """Queue a (1, C, H, W) tensor and return a Future for its result"""
+        future = Future()
+        with self._submit_lock:
+            if not self._closed:
+                self._ensure_worker()
+                self._queue.put((tensor, future))
+                return future
+        # Late callers of a retired scheduler (e.g. a model swapped out
+        # while their request was in flight) run unbatched
+        future.set_running_or_notify_cancel()
+        self._process([(tensor, future)])
+        return future
+
+    def predict(self, tensor):
+        """Blocking helper: run one image through the batcher"""
+        if self.max_batch_size <= 1:
+            return self.batch_fn(tensor)[0]
+        return self.submit(tensor).result()
+
+    def close(self):
+        """Stop the worker thread once queued work is done; later submits run inline"""
+        with self._submit_lock:
+            self._closed = True
+            self._queue.put(_STOP)
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="bladeguard-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _collect(self):
+        """
+        Block for the first item, then gather more until size or time limit
+
+        Returns (batch, stop); stop is True once close() has been called and
+        everything queued before it is in this batch.
+        """
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._collect()
+            # Drop callers that gave up before we got to them
+            batch = [(t, f) for t, f in batch if f.set_running_or_notify_cancel()]
+            if batch:
+                self._process(batch)
+
+    def _process(self, batch):
+        import torch
+
+        try:
+            results = self.batch_fn(torch.cat([t for t, _ in batch], dim=0))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+        if len(results) < len(batch):
+            # zip() stops at the shorter list; never leave a caller waiting forever
+            error = RuntimeError(f"batch_fn returned {len(results)} results for a batch of {len(batch)}")
+            for _, future in batch[len(results):]:
+                future.set_exception(error)
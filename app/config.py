@@ -0,0 +1,143 @@
+"""
+Runtime configuration for the BladeGuard API
+
+Every setting can be overridden with a BLADEGUARD_* environment variable,
+e.g. BLADEGUARD_MAX_BATCH_SIZE=16 uvicorn app.main:app
+"""
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+# Micro-batching (app/batching.py)
+# Concurrent requests are grouped into one forward pass of up to
+# MAX_BATCH_SIZE images, waiting at most MAX_BATCH_WAIT_MS for the batch to fill.
+# A batch size of 1 disables batching.
+MAX_BATCH_SIZE = _env_int("BLADEGUARD_MAX_BATCH_SIZE", 8)
+MAX_BATCH_WAIT_MS = _env_float("BLADEGUARD_MAX_BATCH_WAIT_MS", 5.0)
+
+# Inference worker pool (app/executor.py)
+# Blocking decode/inference/Grad-CAM work runs on INFERENCE_WORKERS threads.
+# Up to MAX_QUEUE_DEPTH further requests may wait for a worker; beyond that
+# the API answers 503 with a Retry-After header.
+# Each request holds its worker while it waits in the micro-batcher, so at
+# most INFERENCE_WORKERS images can share a forward pass: the default is
+# MAX_BATCH_SIZE, and a smaller value caps the effective batch size.
+INFERENCE_WORKERS = _env_int("BLADEGUARD_INFERENCE_WORKERS", MAX_BATCH_SIZE)
+MAX_QUEUE_DEPTH = _env_int("BLADEGUARD_MAX_QUEUE_DEPTH", 32)
+RETRY_AFTER_SECONDS = _env_int("BLADEGUARD_RETRY_AFTER_SECONDS", 1)
+
+# Heatmap generation (app/heatmap_cache.py)
+# "eager" renders and saves the Grad-CAM overlay (see app/heatmap_writer.py).
+# "lazy" only returns a heatmap handle; the CAM is computed and rendered the
+# first time /view-heatmap/{handle} is requested, then kept in an LRU cache.
+# "cam" returns the low-res Grad-CAM itself as a compact uint8/float16 array
+# (HEATMAP_CAM_SIZE x HEATMAP_CAM_SIZE, 0 = the model's 7x7 grid) for the
+# client to colorize; /view-heatmap colorizes it at ?width=&height= on request.
+HEATMAP_MODE = os.environ.get("BLADEGUARD_HEATMAP_MODE", "eager").lower()
+LAZY_HEATMAP_SOURCE_MB = _env_float("BLADEGUARD_LAZY_HEATMAP_SOURCE_MB", 256.0)
+HEATMAP_CACHE_MB = _env_float("BLADEGUARD_HEATMAP_CACHE_MB", 128.0)
+HEATMAP_CAM_DTYPE = os.environ.get("BLADEGUARD_HEATMAP_CAM_DTYPE", "uint8").lower()
+HEATMAP_CAM_SIZE = _env_int("BLADEGUARD_HEATMAP_CAM_SIZE", 0)
+CAM_CACHE_MB = _env_float("BLADEGUARD_CAM_CACHE_MB", 16.0)
+
+# Upload limits (app/utils/uploads.py)
+# Uploads larger than MAX_UPLOAD_MB are rejected with 413 before any decoding;
+# images whose header declares more than MAX_IMAGE_PIXELS pixels are rejected
+# before their pixels are decompressed (decompression-bomb protection).
+MAX_UPLOAD_MB = _env_float("BLADEGUARD_MAX_UPLOAD_MB", 100.0)
+MAX_IMAGE_PIXELS = _env_int("BLADEGUARD_MAX_IMAGE_PIXELS", 100_000_000)
+
+# Tiled inference (app/tiling.py)
+# With TILED_INFERENCE=1 (or tiled=true on /analyze-blade) the photo is
+# downsized to TILE_MAX_SIDE and cut into overlapping 224 px tiles
+# (TILE_OVERLAP of a tile) instead of being squashed to 224x224 whole.
+# Tiles whose luminance standard deviation (grey levels) is below
+# TILE_MIN_TEXTURE are treated as sky/background and skipped; at most
+# TILE_MAX_TILES of the most textured tiles are classified, TILE_BATCH_SIZE
+# per forward pass. A damage class found on a tile with at least
+# TILE_MIN_CONFIDENCE decides the image verdict.
+TILED_INFERENCE = _env_int("BLADEGUARD_TILED_INFERENCE", 0)
+TILE_MAX_SIDE = _env_int("BLADEGUARD_TILE_MAX_SIDE", 2048)
+TILE_OVERLAP = _env_float("BLADEGUARD_TILE_OVERLAP", 0.25)
+TILE_MIN_TEXTURE = _env_float("BLADEGUARD_TILE_MIN_TEXTURE", 4.0)
+TILE_MAX_TILES = _env_int("BLADEGUARD_TILE_MAX_TILES", 64)
+TILE_BATCH_SIZE = _env_int("BLADEGUARD_TILE_BATCH_SIZE", 16)
+TILE_MIN_CONFIDENCE = _env_float("BLADEGUARD_TILE_MIN_CONFIDENCE", 0.6)
+
+# Batch inspection endpoint (/analyze-blades/batch)
+# Images are decoded and run through the model BATCH_CHUNK_SIZE at a time.
+BATCH_CHUNK_SIZE = _env_int("BLADEGUARD_BATCH_CHUNK_SIZE", 16)
+MAX_BATCH_IMAGES = _env_int("BLADEGUARD_MAX_BATCH_IMAGES", 500)
+
+# Result cache (app/result_cache.py)
+# Results are keyed on the SHA-256 of the uploaded bytes plus the model
+# checkpoint, so re-uploads skip decode, inference and Grad-CAM.
+# RESULT_CACHE_ENTRIES=0 disables the cache; RESULT_CACHE_DIR enables an
+# on-disk tier that survives restarts. A background thread keeps that tier
+# within RESULT_CACHE_DISK_MB and RESULT_CACHE_DISK_ENTRIES (0 disables a
+# limit) by deleting the oldest entries, every RESULT_CACHE_PRUNE_INTERVAL_SECONDS.
+RESULT_CACHE_ENTRIES = _env_int("BLADEGUARD_RESULT_CACHE_ENTRIES", 4096)
+RESULT_CACHE_TTL_SECONDS = _env_float("BLADEGUARD_RESULT_CACHE_TTL_SECONDS", 3600.0)
+RESULT_CACHE_DIR = os.environ.get("BLADEGUARD_RESULT_CACHE_DIR", "")
+RESULT_CACHE_DISK_MB = _env_float("BLADEGUARD_RESULT_CACHE_DISK_MB", 256.0)
+RESULT_CACHE_DISK_ENTRIES = _env_int("BLADEGUARD_RESULT_CACHE_DISK_ENTRIES", 100000)
+RESULT_CACHE_PRUNE_INTERVAL_SECONDS = _env_float("BLADEGUARD_RESULT_CACHE_PRUNE_INTERVAL_SECONDS", 300.0)
+
+# Inference backend (app/backends.py)
+# eager | channels_last | torchscript | compile | static_int8 | onnxruntime
+# static_int8 calibrates on up to QUANT_CALIBRATION_IMAGES images from
+# QUANT_CALIBRATION_DIR. Check accuracy against fp32 with
+# python evaluate_model.py --backend <name> before switching in production.
+INFERENCE_BACKEND = os.environ.get("BLADEGUARD_INFERENCE_BACKEND", "eager").lower()
+QUANT_CALIBRATION_DIR = os.environ.get("BLADEGUARD_QUANT_CALIBRATION_DIR", os.path.join("data", "val"))
+QUANT_CALIBRATION_IMAGES = _env_int("BLADEGUARD_QUANT_CALIBRATION_IMAGES", 64)
+
+# ONNX Runtime serving (app/onnx_backend.py)
+# Selected with BLADEGUARD_INFERENCE_BACKEND=onnxruntime; export the model
+# first with python export_onnx.py. ORT_INTRA_OP_THREADS=0 lets ORT decide.
+ONNX_MODEL_PATH = os.environ.get("BLADEGUARD_ONNX_MODEL_PATH", os.path.join("models", "blade_resnet50.onnx"))
+ORT_INTRA_OP_THREADS = _env_int("BLADEGUARD_ORT_INTRA_OP_THREADS", 0)
+
+# Model startup (app/model_loader.py)
+# The model is loaded lazily. With MODEL_WARMUP=1 the API loads it and runs a
+# dummy batch in a background thread at startup; /readyz reports 200 once
+# that has finished. MODEL_WARMUP=0 defers loading to the first request.
+MODEL_WARMUP = _env_int("BLADEGUARD_MODEL_WARMUP", 1)
+
+# Multi-process serving (uvicorn --workers N / gunicorn)
+# MODEL_MMAP=1 memory-maps the checkpoint's CPU weights read-only, so all
+# worker processes on a node share one copy through the page cache.
+# TORCH_THREADS caps each process's intra-op threads (0 = torch default);
+# with N workers, about cores / N avoids oversubscribing the CPU.
+MODEL_MMAP = _env_int("BLADEGUARD_MODEL_MMAP", 1)
+TORCH_THREADS = _env_int("BLADEGUARD_TORCH_THREADS", 0)
+
+# Model registry (app/model_registry.py)
+# JSON manifest of named/versioned checkpoints and blade_type routes; when the
+# file does not exist, models/blade_resnet50.pth is served as the only model.
+# POST /models/reload applies manifest changes without a restart.
+MODEL_REGISTRY_PATH = os.environ.get("BLADEGUARD_MODEL_REGISTRY", os.path.join("models", "registry.json"))
+
+# Heatmap persistence (app/heatmap_writer.py)
+# Eager heatmaps are rendered, encoded and written by a background thread.
+# HEATMAP_FORMAT is jpeg, webp or png; HEATMAP_MAX_SIDE downsizes the saved
+# overlay (0 = full resolution). Retention deletes the oldest heatmaps once
+# they exceed the age, total size or count limit (0 disables a limit).
+HEATMAP_DIR = os.environ.get("BLADEGUARD_HEATMAP_DIR", "results")
+HEATMAP_FORMAT = os.environ.get("BLADEGUARD_HEATMAP_FORMAT", "jpeg").lower()
+HEATMAP_QUALITY = _env_int("BLADEGUARD_HEATMAP_QUALITY", 85)
+HEATMAP_MAX_SIDE = _env_int("BLADEGUARD_HEATMAP_MAX_SIDE", 1280)
+HEATMAP_WRITE_QUEUE = _env_int("BLADEGUARD_HEATMAP_WRITE_QUEUE", 64)
+HEATMAP_RETENTION_HOURS = _env_float("BLADEGUARD_HEATMAP_RETENTION_HOURS", 72.0)
+HEATMAP_RETENTION_MB = _env_float("BLADEGUARD_HEATMAP_RETENTION_MB", 2048.0)
+HEATMAP_RETENTION_FILES = _env_int("BLADEGUARD_HEATMAP_RETENTION_FILES", 50000)
+HEATMAP_PRUNE_INTERVAL_SECONDS = _env_float("BLADEGUARD_HEATMAP_PRUNE_INTERVAL_SECONDS", 300.0)
@@ -0,0 +1,179 @@
+"""
+Maintenance decisions for classified blade images
+
+Pure functions with no model or cache state, so offline tools such as
+bulk_inspect.py can apply the API's rules without building the serving
+singletons in app/inference.py (which re-exports them).
+"""
+
+
+# Most to least urgent; used to order streamed results and pick the headline action for a turbine
+ACTION_PRIORITY = ["shutdown_and_investigate", "investigate", "monitor", "no_action"]
+
+
+def decide_action(blade_type: str, severity: str, confidence: float):
+
+    blade_type = (blade_type or "UNKNOWN").upper()
+
+
+
+    if severity == "healthy":
+
+        return {
+
+            "recommended_action": "no_action",
+
+            "needs_shutdown": False,
+
+            "needs_investigation": False,
+
+            "action_reason": "No visible damage detected."
+
+        }
+
+
+
+    if severity == "minor_damage":
+
+        if confidence >= 0.8:
+
+            return {
+
+                "recommended_action": "investigate",
+
+                "needs_shutdown": False,
+
+                "needs_investigation": True,
+
+                "action_reason": "Minor damage with high confidence – schedule closer inspection."
+
+            }
+
+        else:
+
+            return {
+
+                "recommended_action": "monitor",
+
+                "needs_shutdown": False,
+
+                "needs_investigation": False,
+
+                "action_reason": "Possible minor damage with low confidence – monitor and recheck with clearer imagery."
+
+            }
+
+
+
+    if severity == "severe_damage":
+
+        # Different thresholds for TPI vs LM if you want to be stricter
+
+        if blade_type == "TPI" and confidence >= 0.75:
+
+            shutdown = True
+
+        elif blade_type == "LM" and confidence >= 0.85:
+
+            shutdown = True
+
+        else:
+
+            shutdown = False
+
+
+
+        if shutdown:
+
+            return {
+
+                "recommended_action": "shutdown_and_investigate",
+
+                "needs_shutdown": True,
+
+                "needs_investigation": True,
+
+                "action_reason": f"High-confidence severe damage on {blade_type} blade – recommend immediate shutdown and inspection."
+
+            }
+
+        else:
+
+            return {
+
+                "recommended_action": "investigate",
+
+                "needs_shutdown": False,
+
+                "needs_investigation": True,
+
+                "action_reason": f"Severe damage detected on {blade_type} blade but below shutdown confidence threshold – investigate before taking action."
+
+            }
+
+
+
+    # Fallback
+
+    return {
+
+        "recommended_action": "investigate",
+
+        "needs_shutdown": False,
+
+        "needs_investigation": True,
+
+        "action_reason": "Ambiguous result – human review recommended."
+
+    }
+
+
+def update_inspection_summary(turbines, result):
+
+    """Fold one per-image result into the per-turbine summaries (see summarize_inspection)"""
+
+    summary = turbines.setdefault(result.get("turbine_id", "UNKNOWN"), {
+        "images": 0,
+        "failed_images": 0,
+        "severity_counts": {},
+        "action_counts": {},
+        "recommended_action": "no_action",
+        "needs_shutdown": False,
+        "needs_investigation": False,
+        "flagged_images": [],
+    })
+
+    summary["images"] += 1
+
+    if "error" in result:
+        summary["failed_images"] += 1
+        return turbines
+
+    severity = result["severity"]
+    action = result["recommended_action"]
+    summary["severity_counts"][severity] = summary["severity_counts"].get(severity, 0) + 1
+    summary["action_counts"][action] = summary["action_counts"].get(action, 0) + 1
+    summary["needs_shutdown"] = summary["needs_shutdown"] or result["needs_shutdown"]
+    summary["needs_investigation"] = summary["needs_investigation"] or result["needs_investigation"]
+
+    if ACTION_PRIORITY.index(action) < ACTION_PRIORITY.index(summary["recommended_action"]):
+        summary["recommended_action"] = action
+
+    if action != "no_action":
+        summary["flagged_images"].append(result["filename"])
+
+    return turbines
+
+
+
+def summarize_inspection(results):
+
+    """Roll per-image decide_action outputs up into one summary per turbine"""
+
+    turbines = {}
+
+    for result in results:
+
+        update_inspection_summary(turbines, result)
+
+    return turbines
@@ -0,0 +1,131 @@
+"""
+Bounded worker pool for the blocking inference pipeline
+
+PIL decode, model inference, Grad-CAM and PNG encoding are CPU-bound and
+must not run on the asyncio event loop. Jobs are handed to a fixed-size
+thread pool; once every worker is busy and the wait queue is full, new jobs
+are rejected immediately so the API can answer 503 instead of piling up.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when the worker pool and its wait queue are full"""
+
+
+class InferenceExecutor:
+    def __init__(self, max_workers=4, max_queue_depth=32):
+        """
+        Args:
+            max_workers: Number of worker threads running jobs
+            max_queue_depth: Number of jobs allowed to wait for a free worker
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue_depth = max(0, int(max_queue_depth))
+        self.capacity = self.max_workers + self.max_queue_depth
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="bladeguard-worker"
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self):
+        """Jobs currently running or waiting for a worker"""
+        return self._pending
+
+    @property
+    def queue_depth(self):
+        """Jobs waiting for a worker"""
+        return max(0, self._pending - self.max_workers)
+
+    def _reserve(self):
+        with self._lock:
+            if self._pending >= self.capacity:
+                raise ExecutorSaturatedError(
+                    f"Inference pool saturated ({self._pending} jobs in flight, "
+                    f"capacity {self.capacity})"
+                )
+            self._pending += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, fn, *args, **kwargs):
+        """Submit a job, returning a concurrent Future; raises ExecutorSaturatedError when full"""
+        self._reserve()
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking job on the pool and await its result"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stream(self, iter_fn, *args, buffer_size=8, **kwargs):
+        """
+        Run a blocking generator on the pool and return an async iterator over its items
+
+        The pool slot is reserved immediately, so saturation raises
+        ExecutorSaturatedError here (before any response has been sent).
+        At most buffer_size items are held between producer and consumer;
+        if the consumer stops early the producer is told to stop too.
+        """
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue(maxsize=max(2, int(buffer_size)))
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            try:
+                future = asyncio.run_coroutine_threadsafe(items.put(item), loop)
+            except RuntimeError:  # event loop already closed
+                return
+            while True:
+                try:
+                    return future.result(timeout=0.1)
+                except FutureTimeoutError:
+                    if stop.is_set():
+                        future.cancel()
+                        return
+
+        def produce():
+            try:
+                for item in iter_fn(*args, **kwargs):
+                    put((None, item))
+                    if stop.is_set():
+                        return
+            except Exception as e:
+                put((e, None))
+            finally:
+                if not stop.is_set():
+                    put((None, done))
+
+        self.submit(produce)
+
+        async def consume():
+            try:
+                while True:
+                    error, item = await items.get()
+                    if error is not None:
+                        raise error
+                    if item is done:
+                        return
+                    yield item
+            finally:
+                # Unblock a producer waiting on a full buffer so it can see the stop flag
+                stop.set()
+                while not items.empty():
+                    items.get_nowait()
+
+        return consume()
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,114 @@
+"""
+On-demand Grad-CAM heatmaps
+
+In lazy mode the analysis response only carries a heatmap handle. The
+uploaded image bytes are kept (size-bounded) until the handle is first
+requested; the CAM is then computed, rendered to PNG and kept in a
+size-bounded LRU cache for repeat views.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+
+
+class LRUBytesCache:
+    """Thread-safe LRU mapping of key -> bytes, bounded by total size in bytes"""
+
+    def __init__(self, max_bytes, sizeof=len):
+        """
+        Args:
+            max_bytes: Budget for the sum of sizeof(value) over all entries
+            sizeof: Size of a stored value in bytes (len for plain bytes)
+        """
+        self.max_bytes = int(max_bytes)
+        self.sizeof = sizeof
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size_bytes(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """Store value, evicting least recently used entries; returns False if it can never fit"""
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= self.sizeof(old)
+            self._items[key] = value
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= self.sizeof(evicted)
+        return True
+
+    def pop(self, key):
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value is not None:
+                self._size -= self.sizeof(value)
+            return value
+
+
+class LazyHeatmapStore:
+    def __init__(self, render_fn, max_source_bytes, max_cache_bytes, extension="png"):
+        """
+        Args:
+            render_fn: Callable taking the original image bytes (plus any
+                keyword context given to register) and returning encoded image bytes
+            max_source_bytes: Budget for image bytes kept for not-yet-rendered handles
+            max_cache_bytes: Budget for rendered images
+            extension: File extension of handles, matching render_fn's format
+        """
+        self.render_fn = render_fn
+        self.extension = extension
+        # (image_bytes, context) per handle, sized by the image bytes
+        self._sources = LRUBytesCache(max_source_bytes, sizeof=lambda source: len(source[0]))
+        self._rendered = LRUBytesCache(max_cache_bytes)
+
+    def new_handle(self):
+        return f"heatmap_{uuid.uuid4().hex}.{self.extension}"
+
+    def register(self, image_bytes, handle=None, **context):
+        """
+        Remember an image for later rendering and return its heatmap handle
+
+        context is passed to render_fn as keyword arguments, e.g. the model
+        that classified the image.
+        """
+        handle = handle or self.new_handle()
+        self._sources.put(handle, (bytes(image_bytes), context))
+        return handle
+
+    def __contains__(self, handle):
+        return handle in self._rendered or handle in self._sources
+
+    def get(self, handle):
+        """Rendered image bytes for a handle, computing them on first use; None if unknown/evicted"""
+        png = self._rendered.get(handle)
+        if png is not None:
+            return png
+        source = self._sources.get(handle)
+        if source is None:
+            return None
+        image_bytes, context = source
+        png = self.render_fn(image_bytes, **context)
+        self._rendered.put(handle, png)
+        return png
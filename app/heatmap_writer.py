@@ -0,0 +1,241 @@
+"""
+Background heatmap persistence with retention
+
+Blending the Grad-CAM overlay and encoding it used to happen on the request
+path, as a full-resolution PNG per image that was never deleted. Here the
+caller only downscales the image to preview size and queues the job; a
+writer thread renders, encodes (JPEG/WebP/PNG) and saves it, and
+periodically prunes the heatmap directory by age, total size and file count.
+
+The heatmap path is returned to the client immediately. wait() lets
+/view-heatmap serve a file whose write is still queued.
+"""
+import io
+import os
+import queue
+import threading
+import time
+import uuid
+import weakref
+
+from PIL import Image
+
+from .metrics import STAGE_SECONDS
+from .retention import prune_oldest, remove_files
+
+# Pillow format name, file extension and media type per configurable format
+HEATMAP_FORMATS = {
+    "jpeg": ("JPEG", "jpg", "image/jpeg"),
+    "webp": ("WEBP", "webp", "image/webp"),
+    "png": ("PNG", "png", "image/png"),
+}
+
+MEDIA_TYPES = {extension: media_type for _, extension, media_type in HEATMAP_FORMATS.values()}
+
+_STOP = object()
+
+# The writer thread does not survive a fork; children start their own
+_writers = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for writer in list(_writers):
+        writer._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@STAGE_SECONDS.time(stage="encode")
+def encode_image(image, image_format="jpeg", quality=85):
+    """Encode a PIL image in one of HEATMAP_FORMATS and return the bytes"""
+    pil_format = HEATMAP_FORMATS[image_format][0]
+    buffer = io.BytesIO()
+    if pil_format == "PNG":
+        image.save(buffer, format=pil_format)
+    else:
+        image.save(buffer, format=pil_format, quality=quality)
+    return buffer.getvalue()
+
+
+def preview(pil_image, max_side):
+    """Downscaled copy whose longer side is at most max_side (0 = unchanged)"""
+    if not max_side or max(pil_image.size) <= max_side:
+        return pil_image
+    scale = max_side / max(pil_image.size)
+    size = (max(1, round(pil_image.width * scale)), max(1, round(pil_image.height * scale)))
+    return pil_image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+
+
+class _Job:
+    def __init__(self, path, render_fn):
+        self.path = path
+        self.render_fn = render_fn
+        self.done = threading.Event()
+
+
+class HeatmapWriter:
+    def __init__(self, directory="results", image_format="jpeg", quality=85, max_side=1280,
+                 max_pending=64, max_age_seconds=0, max_bytes=0, max_files=0, prune_interval_seconds=300):
+        """
+        Args:
+            directory: Where heatmaps are written (created once, when the writer starts)
+            image_format: "jpeg", "webp" or "png"
+            quality: JPEG/WebP quality
+            max_side: Longer side of saved heatmaps in pixels (0 = full resolution)
+            max_pending: Queued writes before submit() writes inline (backpressure)
+            max_age_seconds: Delete heatmaps older than this (0 = keep)
+            max_bytes: Delete the oldest heatmaps beyond this total size (0 = unbounded)
+            max_files: Delete the oldest heatmaps beyond this count (0 = unbounded)
+            prune_interval_seconds: How often the writer thread applies retention
+        """
+        if image_format not in HEATMAP_FORMATS:
+            raise ValueError(f"heatmap format must be one of {tuple(HEATMAP_FORMATS)}, got {image_format!r}")
+        self.directory = directory
+        self.image_format = image_format
+        self.extension = HEATMAP_FORMATS[image_format][1]
+        self.quality = int(quality)
+        self.max_side = int(max_side)
+        self.max_age_seconds = float(max_age_seconds)
+        self.max_bytes = int(max_bytes)
+        self.max_files = int(max_files)
+        self.prune_interval = float(prune_interval_seconds)
+        self._max_pending = max(1, int(max_pending))
+        self._queue = queue.Queue(maxsize=self._max_pending)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._worker = None
+        self._last_prune = time.monotonic()
+        self.written = 0
+        self.failed = 0
+        self.pruned = 0
+        _writers.add(self)
+
+    def _reset_after_fork(self):
+        self._queue = queue.Queue(maxsize=self._max_pending)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def new_path(self):
+        return os.path.join(self.directory, f"heatmap_{uuid.uuid4().hex}.{self.extension}")
+
+    def submit(self, render_fn, pil_image, path=None):
+        """
+        Queue a heatmap and return the path it will be written to
+
+        Args:
+            render_fn: Callable taking the (preview-sized) image and returning
+                the overlay as a PIL image; runs on the writer thread
+            pil_image: Image to overlay; downscaled to max_side right away
+                so queued jobs stay small
+            path: Destination (default: a new unique name in directory)
+        """
+        image = preview(pil_image, self.max_side)
+        job = _Job(path or self.new_path(), lambda: render_fn(image))
+        with self._lock:
+            self._pending[job.path] = job
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            # Writer is behind: do this one on the caller's thread rather than queue without bound
+            self._write(job)
+        return job.path
+
+    def is_pending(self, path):
+        return path in self._pending
+
+    def wait(self, path, timeout=None):
+        """Block until a queued heatmap has been written; True if it is on disk"""
+        job = self._pending.get(path)
+        if job is not None:
+            job.done.wait(timeout)
+        return os.path.exists(path)
+
+    def flush(self, timeout=None):
+        """Wait for every queued heatmap to be written"""
+        for job in list(self._pending.values()):
+            job.done.wait(timeout)
+
+    def close(self):
+        """Write what is queued, then stop the writer thread"""
+        if self._worker is not None:
+            self._queue.put(_STOP)
+            self._worker.join()
+            self._worker = None
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._worker = threading.Thread(target=self._run, name="bladeguard-heatmap-writer", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                job = self._queue.get(timeout=self.prune_interval or None)
+            except queue.Empty:
+                job = None
+            if job is _STOP:
+                return
+            if job is not None:
+                self._write(job)
+            if self.prune_interval and time.monotonic() - self._last_prune >= self.prune_interval:
+                self.prune()
+
+    def _write(self, job):
+        try:
+            data = encode_image(job.render_fn(), self.image_format, self.quality)
+            tmp_path = f"{job.path}.tmp"
+            with STAGE_SECONDS.time(stage="save"):
+                try:
+                    with open(tmp_path, "wb") as f:
+                        f.write(data)
+                except FileNotFoundError:
+                    # Directory removed underneath us (e.g. manual cleanup)
+                    os.makedirs(self.directory, exist_ok=True)
+                    with open(tmp_path, "wb") as f:
+                        f.write(data)
+                os.replace(tmp_path, job.path)
+            self.written += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"Heatmap write failed for {job.path}: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop(job.path, None)
+            job.done.set()
+
+    def prune(self):
+        """Apply the retention policy to the heatmap directory; returns the number of files deleted"""
+        self._last_prune = time.monotonic()
+        if not (self.max_age_seconds or self.max_bytes or self.max_files):
+            return 0
+
+        files = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    # .tmp files are writes in progress
+                    if entry.name.startswith("heatmap_") and not entry.name.endswith(".tmp") and entry.is_file():
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            return 0
+        deleted = remove_files(prune_oldest(files, self.max_age_seconds, self.max_bytes, self.max_files))
+        self.pruned += deleted
+        return deleted
+
+    def stats(self):
+        return {
+            "format": self.image_format,
+            "pending": len(self._pending),
+            "written": self.written,
+            "failed": self.failed,
+            "pruned": self.pruned,
+        }
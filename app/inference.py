@@ -1,184 +1,489 @@
+import base64
+
+import os
+
 import uuid
 
-from .utils.visualization import create_gradcam_heatmap
+import numpy as np
+
+from PIL import Image
+
+from .utils.visualization import (
+    draw_dummy_overlay,
+    blend_cam_overlay,
+    compact_cam,
+    colorize_cam,
+)
+
+from .utils.preprocessing import (
+    UploadTooLargeError,
+    load_image_from_bytes,
+    preprocess_for_model,
+    preprocess_batch,
+    MODEL_INPUT_SIZE,
+)
+
+from .model_registry import model_registry
+
+from .heatmap_cache import LazyHeatmapStore, LRUBytesCache
+
+from .heatmap_writer import HeatmapWriter, encode_image, preview
+
+from .result_cache import ResultCache
+
+from .tiling import tiled_predict
+
+from .metrics import RESULTS, IMAGE_ERRORS
+
+from .decisions import ACTION_PRIORITY, decide_action, summarize_inspection, update_inspection_summary
+
+from .config import (
+    HEATMAP_MODE,
+    LAZY_HEATMAP_SOURCE_MB,
+    HEATMAP_CACHE_MB,
+    BATCH_CHUNK_SIZE,
+    RESULT_CACHE_ENTRIES,
+    RESULT_CACHE_TTL_SECONDS,
+    RESULT_CACHE_DIR,
+    RESULT_CACHE_DISK_MB,
+    RESULT_CACHE_DISK_ENTRIES,
+    RESULT_CACHE_PRUNE_INTERVAL_SECONDS,
+    HEATMAP_DIR,
+    HEATMAP_FORMAT,
+    HEATMAP_QUALITY,
+    HEATMAP_MAX_SIDE,
+    HEATMAP_WRITE_QUEUE,
+    HEATMAP_RETENTION_HOURS,
+    HEATMAP_RETENTION_MB,
+    HEATMAP_RETENTION_FILES,
+    HEATMAP_PRUNE_INTERVAL_SECONDS,
+    HEATMAP_CAM_DTYPE,
+    HEATMAP_CAM_SIZE,
+    CAM_CACHE_MB,
+    TILED_INFERENCE,
+    TILE_MAX_SIDE,
+    TILE_OVERLAP,
+    TILE_MIN_TEXTURE,
+    TILE_MAX_TILES,
+    TILE_BATCH_SIZE,
+    TILE_MIN_CONFIDENCE,
+)
+
+HEATMAP_MODES = ("eager", "lazy", "cam")
+
+
+
+# Each registered model version has two micro-batchers (see model_registry.ModelVersion):
+# prediction_batcher groups concurrent requests into one forward pass that also
+# yields Grad-CAM; classification_batcher skips Grad-CAM for lazy heatmaps.
+
+
+# Renders, encodes and saves eager heatmaps off the request path, and prunes old ones
+heatmap_writer = HeatmapWriter(
+    directory=HEATMAP_DIR,
+    image_format=HEATMAP_FORMAT,
+    quality=HEATMAP_QUALITY,
+    max_side=HEATMAP_MAX_SIDE,
+    max_pending=HEATMAP_WRITE_QUEUE,
+    max_age_seconds=HEATMAP_RETENTION_HOURS * 3600,
+    max_bytes=HEATMAP_RETENTION_MB * 1024 * 1024,
+    max_files=HEATMAP_RETENTION_FILES,
+    prune_interval_seconds=HEATMAP_PRUNE_INTERVAL_SECONDS,
+)
+
+# Heatmaps are only drawn at HEATMAP_MAX_SIDE, so JPEGs needn't be decoded beyond that
+OVERLAY_DECODE_SIZE = (HEATMAP_MAX_SIDE, HEATMAP_MAX_SIDE) if HEATMAP_MAX_SIDE > 0 else None
+
+# Tiled inference works on the image downsized to TILE_MAX_SIDE
+TILE_DECODE_SIZE = (TILE_MAX_SIDE, TILE_MAX_SIDE) if TILE_MAX_SIDE > 0 else None
+
+
+def _render_overlay(cam, pil_image):
+    """Grad-CAM overlay as a PIL image (dummy overlay if the model is not available)"""
+    if cam is None:
+        return draw_dummy_overlay(pil_image)
+    try:
+        return blend_cam_overlay(cam, pil_image)
+    except Exception as e:
+        print(f"Grad-CAM failed (falling back to dummy): {e}")
+        return draw_dummy_overlay(pil_image)
+
+
+def render_heatmap(image_bytes: bytes, model_version: str = None) -> bytes:
+    """Compute the Grad-CAM overlay for an image and return it encoded in HEATMAP_FORMAT"""
+    try:
+        served = model_registry.resolve(model_version=model_version)
+    except ValueError:
+        # The version that classified the image has since been removed; use the model's current one
+        served = model_registry.resolve(model_version=(model_version or "").partition("@")[0] or None)
+    pil_image = load_image_from_bytes(image_bytes, target_size=OVERLAY_DECODE_SIZE)
+    _, _, cam = served.prediction_batcher.predict(preprocess_for_model(pil_image))
+    overlay = _render_overlay(cam, preview(pil_image, HEATMAP_MAX_SIDE))
+    return encode_image(overlay, HEATMAP_FORMAT, HEATMAP_QUALITY)
+
+
+lazy_heatmaps = LazyHeatmapStore(
+    render_heatmap,
+    max_source_bytes=LAZY_HEATMAP_SOURCE_MB * 1024 * 1024,
+    max_cache_bytes=HEATMAP_CACHE_MB * 1024 * 1024,
+    extension=heatmap_writer.extension,
+)
+
+# "cam" mode keeps only the compact low-res CAM (tens of bytes per image); it is
+# returned inline for client-side colorization and kept here so /view-heatmap
+# can colorize it at a requested size
+cam_store = LRUBytesCache(CAM_CACHE_MB * 1024 * 1024, sizeof=lambda cam: cam.nbytes)
+
+
+def _cam_payload(cam):
+    return {
+        "shape": list(cam.shape),
+        "dtype": str(cam.dtype),
+        "data": base64.b64encode(cam.tobytes()).decode("ascii"),
+    }
 
-from .utils.preprocessing import load_image_from_bytes, preprocess_for_model
 
-from .model_loader import model_loader
+def _cam_from_payload(payload):
+    data = base64.b64decode(payload["data"])
+    return np.frombuffer(data, dtype=payload["dtype"]).reshape(payload["shape"])
 
 
+def _register_cam(cam):
+    """Store a compact CAM; returns (heatmap path, inline payload)"""
+    compact = compact_cam(cam if cam is not None else np.zeros((7, 7), np.float32),
+                          dtype=HEATMAP_CAM_DTYPE, size=HEATMAP_CAM_SIZE)
+    handle = f"cam_{uuid.uuid4().hex}.{heatmap_writer.extension}"
+    cam_store.put(handle, compact)
+    return os.path.join(HEATMAP_DIR, handle), _cam_payload(compact)
 
-def decide_action(blade_type: str, severity: str, confidence: float):
 
-    blade_type = (blade_type or "UNKNOWN").upper()
+def render_cam_image(handle, width=None, height=None):
+    """Colorize a stored compact CAM at width x height (default: 224x224), encoded in HEATMAP_FORMAT; None if unknown"""
+    cam = cam_store.get(handle)
+    if cam is None:
+        return None
+    image = Image.fromarray(colorize_cam(cam, width or height or 224, height or width or 224))
+    return encode_image(image, HEATMAP_FORMAT, HEATMAP_QUALITY)
 
 
+# Re-uploads of identical bytes (retries, resubmissions) skip the whole pipeline
+result_cache = ResultCache(
+    max_entries=RESULT_CACHE_ENTRIES,
+    ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+    disk_dir=RESULT_CACHE_DIR,
+    max_disk_bytes=RESULT_CACHE_DISK_MB * 1024 * 1024,
+    max_disk_entries=RESULT_CACHE_DISK_ENTRIES,
+    prune_interval_seconds=RESULT_CACHE_PRUNE_INTERVAL_SECONDS,
+)
 
-    if severity == "healthy":
 
-        return {
+def _heatmap_available(cached):
+    path = cached["heatmap_path"]
+    return os.path.exists(path) or heatmap_writer.is_pending(path) or os.path.basename(path) in lazy_heatmaps
 
-            "recommended_action": "no_action",
 
-            "needs_shutdown": False,
+def _cache_key(image_bytes, heatmap_mode, served, tiled=False):
+    return result_cache.make_key(image_bytes, served.loader.checkpoint_id, f"{heatmap_mode}:tiled" if tiled else heatmap_mode)
 
-            "needs_investigation": False,
 
-            "action_reason": "No visible damage detected."
+def _lookup_cached(cache_key):
+    """Cached (severity, confidence, heatmap_path, cam, tiling) whose heatmap is still servable, or None"""
+    # Compact CAMs travel inside the cached result, so those are always servable
+    cached = result_cache.get(cache_key, validate=lambda c: c.get("cam") is not None or _heatmap_available(c))
+    if cached is None:
+        return None
+    cam = cached.get("cam")
+    handle = os.path.basename(cached["heatmap_path"])
+    if cam is not None and handle not in cam_store:
+        cam_store.put(handle, _cam_from_payload(cam))
+    return cached["severity"], cached["confidence"], cached["heatmap_path"], cam, cached.get("tiling")
 
-        }
 
+def _store_cached(cache_key, severity, confidence, heatmap_filename, cam=None, tiling=None):
+    entry = {
+        "severity": severity,
+        "confidence": float(confidence),
+        "heatmap_path": heatmap_filename,
+    }
+    if cam is not None:
+        entry["cam"] = cam
+    if tiling is not None:
+        entry["tiling"] = tiling
+    result_cache.put(cache_key, entry)
 
 
-    if severity == "minor_damage":
 
-        if confidence >= 0.8:
+def _resolve_heatmap_mode(heatmap_mode):
 
-            return {
+    heatmap_mode = (heatmap_mode or HEATMAP_MODE).lower()
 
-                "recommended_action": "investigate",
+    if heatmap_mode not in HEATMAP_MODES:
 
-                "needs_shutdown": False,
+        raise ValueError(f"heatmap_mode must be one of {HEATMAP_MODES}, got {heatmap_mode!r}")
 
-                "needs_investigation": True,
+    return heatmap_mode
 
-                "action_reason": "Minor damage with high confidence – schedule closer inspection."
 
-            }
 
-        else:
+def _save_heatmap(cam, pil_image):
 
-            return {
+    """Queue the Grad-CAM overlay for writing to HEATMAP_DIR and return its path"""
 
-                "recommended_action": "monitor",
+    return heatmap_writer.submit(lambda image: _render_overlay(cam, image), pil_image)
 
-                "needs_shutdown": False,
 
-                "needs_investigation": False,
 
-                "action_reason": "Possible minor damage with low confidence – monitor and recheck with clearer imagery."
+def _build_result(blade_type, severity, confidence, heatmap_filename, cam=None, tiling=None, model_version=None):
 
-            }
+    damage_detected = severity != "healthy"
 
+    confidence = round(float(confidence), 2)
 
+    action_info = decide_action(blade_type, severity, confidence)
 
-    if severity == "severe_damage":
+    RESULTS.inc(severity=severity, recommended_action=action_info["recommended_action"], model_version=model_version)
 
-        # Different thresholds for TPI vs LM if you want to be stricter
 
-        if blade_type == "TPI" and confidence >= 0.75:
 
-            shutdown = True
+    return {
 
-        elif blade_type == "LM" and confidence >= 0.85:
+        "blade_type": blade_type,
 
-            shutdown = True
+        "damage_detected": damage_detected,
 
-        else:
+        "severity": severity,
 
-            shutdown = False
+        "confidence": confidence,
 
+        "heatmap_path": heatmap_filename,
 
+        "heatmap_url": f"/view-heatmap/{os.path.basename(heatmap_filename)}",
 
-        if shutdown:
+        "model_version": model_version,
 
-            return {
+        **({"cam": cam} if cam is not None else {}),
 
-                "recommended_action": "shutdown_and_investigate",
+        **({"tiling": tiling} if tiling is not None else {}),
 
-                "needs_shutdown": True,
+        **action_info,
 
-                "needs_investigation": True,
+    }
 
-                "action_reason": f"High-confidence severe damage on {blade_type} blade – recommend immediate shutdown and inspection."
 
-            }
 
+def analyze_blade_image(image_bytes: bytes, blade_type: str = "UNKNOWN", heatmap_mode: str = None, model_version: str = None, tiled: bool = None):
+
+    heatmap_mode = _resolve_heatmap_mode(heatmap_mode)
+
+    tiled = bool(TILED_INFERENCE) if tiled is None else tiled
+
+    # Explicit "name" / "name@version", else the model routed for this blade type
+    served = model_registry.resolve(blade_type, model_version)
+
+    cache_key = _cache_key(image_bytes, heatmap_mode, served, tiled)
+
+    cached = _lookup_cached(cache_key)
+
+    if cached is not None:
+
+        return _build_result(blade_type, *cached, model_version=served.ref)
+
+    tiling = None
+
+    if tiled:
+
+        # Overlapping 224 px tiles at TILE_MAX_SIDE instead of one squashed 224x224 image.
+        # The per-tile damage grid stands in for the Grad-CAM map: eager mode overlays it,
+        # lazy and cam modes return it as a compact CAM (it is already computed).
+
+        pil_image = load_image_from_bytes(image_bytes, target_size=TILE_DECODE_SIZE)
+
+        severity, confidence, grid, tiling = tiled_predict(
+            pil_image,
+            served.loader.predict_batch,
+            max_side=TILE_MAX_SIDE,
+            overlap=TILE_OVERLAP,
+            min_texture=TILE_MIN_TEXTURE,
+            max_tiles=TILE_MAX_TILES,
+            batch_size=TILE_BATCH_SIZE,
+            min_confidence=TILE_MIN_CONFIDENCE,
+        )
+
+        if heatmap_mode == "eager":
+            heatmap_filename, cam_payload = _save_heatmap(grid, pil_image), None
         else:
+            heatmap_filename, cam_payload = _register_cam(grid)
 
-            return {
+    elif heatmap_mode == "lazy":
 
-                "recommended_action": "investigate",
+        # Classify only; the CAM is computed when the heatmap handle is first viewed.
+        # No overlay is drawn now, so JPEGs can be decoded near model resolution.
 
-                "needs_shutdown": False,
+        pil_image = load_image_from_bytes(image_bytes, target_size=MODEL_INPUT_SIZE)
 
-                "needs_investigation": True,
+        severity, confidence = served.classification_batcher.predict(preprocess_for_model(pil_image))
 
-                "action_reason": f"Severe damage detected on {blade_type} blade but below shutdown confidence threshold – investigate before taking action."
+        heatmap_filename = os.path.join(HEATMAP_DIR, lazy_heatmaps.register(image_bytes, model_version=served.ref))
 
-            }
+        cam_payload = None
 
+    elif heatmap_mode == "cam":
 
+        # Keep only the compact low-res CAM; nothing is rendered or written,
+        # so the image is decoded near model resolution as in lazy mode.
 
-    # Fallback
+        pil_image = load_image_from_bytes(image_bytes, target_size=MODEL_INPUT_SIZE)
 
-    return {
+        severity, confidence, cam = served.prediction_batcher.predict(preprocess_for_model(pil_image))
 
-        "recommended_action": "investigate",
+        heatmap_filename, cam_payload = _register_cam(cam)
 
-        "needs_shutdown": False,
+    else:
 
-        "needs_investigation": True,
+        # REAL prediction now - the same forward pass also yields the Grad-CAM map.
+        # Decoded at heatmap resolution, since the overlay is drawn on this image.
 
-        "action_reason": "Ambiguous result – human review recommended."
+        pil_image = load_image_from_bytes(image_bytes, target_size=OVERLAY_DECODE_SIZE)
 
-    }
+        severity, confidence, cam = served.prediction_batcher.predict(preprocess_for_model(pil_image))
 
+        heatmap_filename = _save_heatmap(cam, pil_image)
 
+        cam_payload = None
 
+    _store_cached(cache_key, severity, confidence, heatmap_filename, cam_payload, tiling)
 
 
-def analyze_blade_image(image_bytes: bytes, blade_type: str = "UNKNOWN"):
 
-    pil_image = load_image_from_bytes(image_bytes)
+    return _build_result(blade_type, severity, confidence, heatmap_filename, cam_payload, tiling, model_version=served.ref)
 
-    tensor = preprocess_for_model(pil_image)
 
 
+def iter_blade_batch(items, heatmap_mode: str = None, chunk_size: int = BATCH_CHUNK_SIZE):
 
-    # REAL prediction now
+    """
+    Analyze an inspection set with real tensor batches, yielding results as they are ready
 
-    severity, confidence = model_loader.predict(tensor)
+    Images are decoded and classified chunk_size at a time. Within each chunk
+    the most urgent findings are rendered and yielded first, so severe damage
+    reaches the operator before healthy frames.
 
-    damage_detected = severity != "healthy"
+    Args:
+        items: List of dicts with "filename", "image_bytes", "blade_type" and
+            "turbine_id", plus an optional "model_version" (see analyze_blade_image)
+        heatmap_mode: "eager", "lazy" or "cam" (None = BLADEGUARD_HEATMAP_MODE)
+        chunk_size: Images decoded and run through the model at once
 
-    confidence = round(float(confidence), 2)
+    Yields:
+        (index into items, result dict). Images that fail to decode get an
+        "error" entry instead of failing the whole set.
+    """
 
-    # Get class index for Grad-CAM
-    target_class_idx = None
-    if model_loader.model is not None and model_loader.class_names:
-        try:
-            target_class_idx = model_loader.class_names.index(severity)
-        except ValueError:
-            target_class_idx = None
-
-    heatmap_filename = f"results/heatmap_{uuid.uuid4().hex}.png"
-
-    # Create real Grad-CAM heatmap (falls back to dummy if model not available)
-    create_gradcam_heatmap(
-        model_loader.model,
-        tensor,
-        pil_image,
-        heatmap_filename,
-        target_class_idx=target_class_idx
-    )
+    heatmap_mode = _resolve_heatmap_mode(heatmap_mode)
 
-    action_info = decide_action(blade_type, severity, confidence)
+    # Lazy and cam modes draw no overlay now, so decode near model resolution
+    decode_size = MODEL_INPUT_SIZE if heatmap_mode in ("lazy", "cam") else OVERLAY_DECODE_SIZE
 
+    for start in range(0, len(items), chunk_size):
 
+        # Decode one chunk at a time so memory stays bounded for large sets
+        decoded = []
 
-    return {
+        failed = []
 
-        "blade_type": blade_type,
+        # (index, severity, confidence, cam, pil_image, heatmap_filename, cam_payload);
+        # heatmap_filename (and cam_payload in cam mode) already set for cache hits
+        ranked = []
 
-        "damage_detected": damage_detected,
+        cache_keys = {}
 
-        "severity": severity,
+        # Model version serving each image, routed by its blade_type / model_version
+        served_by = {}
 
-        "confidence": confidence,
+        for index in range(start, min(start + chunk_size, len(items))):
 
-        "heatmap_path": heatmap_filename,
+            item = items[index]
 
-        **action_info,
+            served_by[index] = model_registry.resolve(item["blade_type"], item.get("model_version"))
 
-    }
+            cache_keys[index] = _cache_key(item["image_bytes"], heatmap_mode, served_by[index])
+
+            cached = _lookup_cached(cache_keys[index])
+
+            if cached is not None:
+                severity, confidence, heatmap_filename, cam_payload, _ = cached
+                ranked.append((index, severity, confidence, None, None, heatmap_filename, cam_payload))
+                continue
+
+            try:
+                decoded.append((index, load_image_from_bytes(item["image_bytes"], target_size=decode_size)))
+            except Exception as e:
+                IMAGE_ERRORS.inc(reason="too_large" if isinstance(e, UploadTooLargeError) else "decode")
+                failed.append((index, {
+                    "filename": item["filename"],
+                    "turbine_id": item["turbine_id"],
+                    "blade_type": item["blade_type"],
+                    "error": f"Could not decode image: {e}",
+                }))
+
+        # One forward pass per model among this chunk's images
+        groups = {}
+
+        for index, pil_image in decoded:
+            groups.setdefault(served_by[index], []).append((index, pil_image))
+
+        for served, group in groups.items():
+
+            batch = preprocess_batch([pil_image for _, pil_image in group])
+
+            if heatmap_mode == "lazy":
+                predictions = [(label, conf, None) for label, conf in served.loader.predict_batch(batch)]
+            else:
+                predictions = served.loader.predict_and_explain_batch(batch)
+
+            for (index, pil_image), (severity, confidence, cam) in zip(group, predictions):
+                ranked.append((index, severity, confidence, cam, pil_image if heatmap_mode == "eager" else None, None, None))
+
+        def urgency(entry):
+            index, severity, confidence = entry[:3]
+            action = decide_action(items[index]["blade_type"], severity, round(float(confidence), 2))
+            return ACTION_PRIORITY.index(action["recommended_action"]), -confidence
+
+        for index, severity, confidence, cam, pil_image, heatmap_filename, cam_payload in sorted(ranked, key=urgency):
+
+            item = items[index]
+
+            model_version = served_by[index].ref
+
+            if heatmap_filename is None:
+
+                if heatmap_mode == "lazy":
+                    heatmap_filename = os.path.join(HEATMAP_DIR, lazy_heatmaps.register(item["image_bytes"], model_version=model_version))
+                elif heatmap_mode == "cam":
+                    heatmap_filename, cam_payload = _register_cam(cam)
+                else:
+                    heatmap_filename = _save_heatmap(cam, pil_image)
+
+                _store_cached(cache_keys[index], severity, confidence, heatmap_filename, cam_payload)
+
+            yield index, {
+                "filename": item["filename"],
+                "turbine_id": item["turbine_id"],
+                **_build_result(item["blade_type"], severity, confidence, heatmap_filename, cam_payload, model_version=model_version),
+            }
+
+        yield from failed
+
+
+
+def analyze_blade_batch(items, heatmap_mode: str = None, chunk_size: int = BATCH_CHUNK_SIZE):
+
+    """Analyze a whole inspection set (see iter_blade_batch) and return results in input order"""
+
+    results = [None] * len(items)
+
+    for index, result in iter_blade_batch(items, heatmap_mode=heatmap_mode, chunk_size=chunk_size):
+
+        results[index] = result
+
+    return results
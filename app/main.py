@@ -1,13 +1,151 @@
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query
+from fastapi.responses import HTMLResponse, FileResponse, Response, StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 import os
+import json
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from .inference import (
+    analyze_blade_image,
+    analyze_blade_batch,
+    iter_blade_batch,
+    summarize_inspection,
+    update_inspection_summary,
+    lazy_heatmaps,
+    cam_store,
+    render_cam_image,
+    heatmap_writer,
+    result_cache,
+    HEATMAP_MODES,
+)
+from .model_registry import model_registry
+from .executor import InferenceExecutor, ExecutorSaturatedError
+from .heatmap_writer import MEDIA_TYPES
+from .metrics import metrics, REQUEST_SECONDS, IMAGE_ERRORS, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .utils.archives import is_archive, extract_images
+from .utils.uploads import upload_buffer, UploadTooLargeError
+from .utils.preprocessing import ImageDecodeError
+from .config import (
+    INFERENCE_WORKERS,
+    MAX_QUEUE_DEPTH,
+    RETRY_AFTER_SECONDS,
+    MAX_BATCH_IMAGES,
+    MAX_BATCH_SIZE,
+    MODEL_WARMUP,
+    HEATMAP_DIR,
+    MAX_UPLOAD_MB,
+)
+
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load and warm up the active models off the startup path so uvicorn
+    # binds immediately; /readyz turns 200 once this has finished
+    if MODEL_WARMUP:
+        threading.Thread(
+            target=model_registry.warm_up,
+            kwargs={"batch_sizes": (1, MAX_BATCH_SIZE)},
+            name="bladeguard-warmup",
+            daemon=True,
+        ).start()
+    yield
+    # Let queued heatmaps reach disk before the process exits
+    heatmap_writer.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Blocking model work runs here so the event loop stays free for other requests
+inference_executor = InferenceExecutor(
+    max_workers=INFERENCE_WORKERS,
+    max_queue_depth=MAX_QUEUE_DEPTH,
+)
 
-from .inference import analyze_blade_image
 
+def _saturated(e):
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
 
 
-app = FastAPI()
+async def run_inference(fn, *args, **kwargs):
+    """Run a blocking pipeline job on the worker pool, answering 503 when saturated"""
+    try:
+        return await inference_executor.run(fn, *args, **kwargs)
+    except ExecutorSaturatedError as e:
+        raise _saturated(e)
+
+
+# Scrape-time gauges for the queues in front of the model (see app/metrics.py)
+metrics.gauge(
+    "bladeguard_inference_jobs",
+    "Inference pool jobs running or waiting for a worker",
+    lambda: inference_executor.pending,
+)
+metrics.gauge(
+    "bladeguard_inference_queue_depth",
+    "Inference pool jobs waiting for a worker",
+    lambda: inference_executor.queue_depth,
+)
+metrics.gauge(
+    "bladeguard_batcher_queue_depth",
+    "Images waiting for a micro-batch, per active model version",
+    lambda: [
+        ((served.ref, kind), batcher.queue_depth)
+        for served in model_registry.active_versions()
+        for kind, batcher in (("predict_explain", served.prediction_batcher), ("predict", served.classification_batcher))
+    ],
+    labelnames=["model_version", "kind"],
+)
+metrics.gauge(
+    "bladeguard_model_ready",
+    "1 once an active model version is loaded and warmed up",
+    lambda: [((ref,), int(status["ready"])) for ref, status in model_registry.status()["models"].items()],
+    labelnames=["model_version"],
+)
+metrics.gauge(
+    "bladeguard_heatmap_write_queue_depth",
+    "Heatmaps queued for the writer thread",
+    lambda: heatmap_writer.stats()["pending"],
+)
+metrics.counter_callback(
+    "bladeguard_heatmap_writes_total",
+    "Heatmap writer outcomes",
+    lambda: [((outcome,), heatmap_writer.stats()[outcome]) for outcome in ("written", "failed", "pruned")],
+    labelnames=["outcome"],
+)
+metrics.counter_callback(
+    "bladeguard_result_cache_lookups_total",
+    "Result cache lookups by outcome",
+    lambda: [(("hit",), result_cache.hits), (("miss",), result_cache.misses)],
+    labelnames=["outcome"],
+)
+
+
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024)
+
+# Images unpacked from archives count against this per batch request, so a
+# small, highly compressed upload cannot expand into unbounded memory
+MAX_UNPACKED_BATCH_BYTES = 4 * MAX_UPLOAD_BYTES
+
+
+async def _read_upload(upload):
+    """
+    Upload contents as a buffer over the spooled file (see utils/uploads.py), 413 when too large
+
+    The seek/read/mmap of the spooled file blocks, so it runs on Starlette's threadpool.
+    """
+    try:
+        return await run_in_threadpool(upload_buffer, upload.file, MAX_UPLOAD_BYTES)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=f"{upload.filename}: {e}")
 
 
 
@@ -25,13 +163,97 @@ app.add_middleware(
 
 
 
+@app.middleware("http")
+async def record_request_latency(request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route template (e.g. /view-heatmap/{heatmap_filename}) keeps the label set small
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, route=route, status=status)
+
+
+
 @app.get("/")
 
 def root():
 
-    return {"status": "BladeGuard API running"}
+    return {
+        "status": "BladeGuard API running",
+        "inference_pending": inference_executor.pending,
+        "inference_capacity": inference_executor.capacity,
+    }
+
+
+
+@app.get("/healthz")
+def healthz():
+    """Liveness probe: the process is up and answering"""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness probe: 200 once the active models are loaded and warmed up, 503 until then"""
+    status = model_registry.status()
+    if "error" in status:
+        return JSONResponse(status_code=503, content={"status": "failed", **status})
+    # Without warm-up the first request loads the model, so there is nothing to wait for
+    if status["ready"] or not MODEL_WARMUP:
+        return {"status": "ready", **status}
+    return JSONResponse(status_code=503, content={"status": "loading", **status})
+
+
+def _check_heatmap_mode(heatmap_mode):
+    if heatmap_mode is not None and heatmap_mode.lower() not in HEATMAP_MODES:
+        raise HTTPException(status_code=400, detail=f"heatmap_mode must be one of {HEATMAP_MODES}")
+
+
+def _check_model_version(blade_type, model_version):
+    try:
+        model_registry.resolve(blade_type, model_version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
+@app.get("/models")
+def list_models():
+    """Registered models, their versions, blade_type routes and load state"""
+    return model_registry.describe()
+
+
+@app.post("/models/reload")
+def reload_models():
+    """
+    Apply changes to the model registry manifest without a restart
+
+    New or retrained active models are warmed up before they take traffic;
+    on failure the current models keep serving.
+    """
+    try:
+        return model_registry.reload(batch_sizes=(1, MAX_BATCH_SIZE))
+    except (ValueError, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid model registry manifest: {e}")
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=f"{e}; previous models still serving")
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Stage timings, result counts by severity/action, queue depths and latency histograms (Prometheus text format)"""
+    # Set as a header so Starlette does not append a second charset
+    return Response(content=metrics.render(), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+
+@app.get("/cache-stats")
+def cache_stats():
+    """Hit/miss counters of the content-hash result cache"""
+    return result_cache.stats()
+
 
 @app.post("/analyze-blade")
 
@@ -39,23 +261,194 @@ async def analyze_blade(
 
     file: UploadFile = File(...),
 
-    blade_type: str = Form("UNKNOWN")  # "TPI" or "LM" preferred
+    blade_type: str = Form("UNKNOWN"),  # "TPI" or "LM" preferred
+
+    heatmap_mode: Optional[str] = Form(None),  # "eager", "lazy" or "cam"; defaults to BLADEGUARD_HEATMAP_MODE
+
+    model_version: Optional[str] = Form(None),  # "name" or "name@version"; defaults to the blade_type route
+
+    tiled: Optional[bool] = Form(None)  # overlapping-tile inference for high-res photos; defaults to BLADEGUARD_TILED_INFERENCE
 
 ):
 
-    image_bytes = await file.read()
+    _check_heatmap_mode(heatmap_mode)
+
+    _check_model_version(blade_type, model_version)
 
-    result = analyze_blade_image(image_bytes, blade_type=blade_type)
+    # Decoded straight from the spooled upload; no full copy of the body is made
+    image_bytes = await _read_upload(file)
+
+    # Off the event loop; concurrent uploads on the pool share a model batch
+    try:
+        result = await run_inference(
+            analyze_blade_image, image_bytes, blade_type=blade_type, heatmap_mode=heatmap_mode, model_version=model_version,
+            tiled=tiled,
+        )
+    except UploadTooLargeError as e:
+        IMAGE_ERRORS.inc(reason="too_large")
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImageDecodeError as e:
+        IMAGE_ERRORS.inc(reason="decode")
+        raise HTTPException(status_code=400, detail=f"Could not decode image: {e}")
 
     return result
 
 
+async def _collect_batch_items(files, blade_type, turbine_id, image_meta, model_version=None):
+    """Expand uploads (plain images or zip/tar archives) into per-image work items"""
+    try:
+        meta = json.loads(image_meta) if image_meta else {}
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"image_meta is not valid JSON: {e}")
+    if not isinstance(meta, dict):
+        raise HTTPException(status_code=400, detail="image_meta must be a JSON object keyed by filename")
+
+    images = []
+    unpacked_bytes = 0
+    for upload in files:
+        data = await _read_upload(upload)
+        if is_archive(upload.filename):
+            try:
+                members = extract_images(
+                    upload.filename, data, max_images=MAX_BATCH_IMAGES - len(images),
+                    max_total_bytes=MAX_UNPACKED_BATCH_BYTES - unpacked_bytes,
+                )
+                unpacked_bytes += sum(len(member) for _, member in members)
+                images.extend(members)
+            except ValueError as e:
+                raise HTTPException(status_code=413, detail=str(e))
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"Could not read archive {upload.filename}: {e}")
+        else:
+            images.append((upload.filename, data))
+        if len(images) > MAX_BATCH_IMAGES:
+            raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_IMAGES} images per batch")
+
+    items = []
+    for filename, data in images:
+        # Per-image overrides may be keyed by full archive path or bare filename
+        overrides = meta.get(filename) or meta.get(os.path.basename(filename)) or {}
+        item = {
+            "filename": filename,
+            "image_bytes": data,
+            "blade_type": overrides.get("blade_type", blade_type),
+            "turbine_id": overrides.get("turbine_id", turbine_id),
+            "model_version": overrides.get("model_version", model_version),
+        }
+        _check_model_version(item["blade_type"], item["model_version"])
+        items.append(item)
+    return items
+
+
+@app.post("/analyze-blades/batch")
+async def analyze_blades_batch(
+    files: List[UploadFile] = File(...),  # images and/or zip/tar archives of images
+    blade_type: str = Form("UNKNOWN"),
+    turbine_id: str = Form("UNKNOWN"),
+    image_meta: Optional[str] = Form(None),  # JSON: {"<filename>": {"blade_type": "LM", "turbine_id": "T07", "model_version": "lm@v3"}}
+    heatmap_mode: Optional[str] = Form(None),
+    model_version: Optional[str] = Form(None)
+):
+    """Analyze a whole inspection set in batched forward passes, with a per-turbine summary"""
+    _check_heatmap_mode(heatmap_mode)
+    items = await _collect_batch_items(files, blade_type, turbine_id, image_meta, model_version)
+    if not items:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+
+    results = await run_inference(analyze_blade_batch, items, heatmap_mode=heatmap_mode)
+    return {
+        "image_count": len(results),
+        "results": results,
+        "turbines": summarize_inspection(results),
+    }
+
+
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def _encode_event(stream_format, event, payload):
+    data = json.dumps(payload)
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {data}\n\n"
+    return json.dumps({"event": event, **payload}) + "\n"
+
+
+@app.post("/analyze-blades/stream")
+async def analyze_blades_stream(
+    files: List[UploadFile] = File(...),  # images and/or zip/tar archives of images
+    blade_type: str = Form("UNKNOWN"),
+    turbine_id: str = Form("UNKNOWN"),
+    image_meta: Optional[str] = Form(None),  # same format as /analyze-blades/batch
+    heatmap_mode: Optional[str] = Form(None),
+    stream_format: str = Form("ndjson"),  # "ndjson" or "sse"
+    model_version: Optional[str] = Form(None)
+):
+    """
+    Streaming variant of /analyze-blades/batch
+
+    Emits one "result" event per image as soon as it is ready (most urgent
+    findings of each model batch first, with "index" giving its position in
+    the upload), then a final "summary" event with the per-turbine summary.
+    """
+    _check_heatmap_mode(heatmap_mode)
+    stream_format = stream_format.lower()
+    if stream_format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"stream_format must be one of {tuple(STREAM_FORMATS)}")
+    items = await _collect_batch_items(files, blade_type, turbine_id, image_meta, model_version)
+    if not items:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+
+    try:
+        results = inference_executor.stream(iter_blade_batch, items, heatmap_mode=heatmap_mode)
+    except ExecutorSaturatedError as e:
+        raise _saturated(e)
+
+    async def events():
+        turbines = {}
+        try:
+            async for index, result in results:
+                update_inspection_summary(turbines, result)
+                yield _encode_event(stream_format, "result", {"index": index, **result})
+        except Exception as e:
+            yield _encode_event(stream_format, "error", {"error": str(e)})
+            return
+        yield _encode_event(stream_format, "summary", {"image_count": len(items), "turbines": turbines})
+
+    return StreamingResponse(events(), media_type=STREAM_FORMATS[stream_format])
+
+
+MAX_CAM_RENDER_SIDE = 4096
+
+
 @app.get("/view-heatmap/{heatmap_filename}")
-async def view_heatmap(heatmap_filename: str):
-    """Serve heatmap image file"""
-    heatmap_path = os.path.join("results", heatmap_filename)
+async def view_heatmap(
+    heatmap_filename: str,
+    width: Optional[int] = Query(None, ge=1, le=MAX_CAM_RENDER_SIDE),  # cam heatmaps only
+    height: Optional[int] = Query(None, ge=1, le=MAX_CAM_RENDER_SIDE)
+):
+    """
+    Serve heatmap image file, waiting for queued writes and rendering lazy heatmaps on first request
+
+    Heatmaps from heatmap_mode="cam" are colorized on the fly at width x height
+    (default 224x224) for overlaying on the original image client-side.
+    """
+    heatmap_path = os.path.join(HEATMAP_DIR, heatmap_filename)
+    media_type = MEDIA_TYPES.get(os.path.splitext(heatmap_filename)[1].lstrip("."), "application/octet-stream")
+    if heatmap_filename in cam_store:
+        image = await run_inference(render_cam_image, heatmap_filename, width, height)
+        if image is not None:
+            return Response(content=image, media_type=media_type)
+    if heatmap_writer.is_pending(heatmap_path):
+        await run_inference(heatmap_writer.wait, heatmap_path, 30)
     if os.path.exists(heatmap_path):
-        return FileResponse(heatmap_path, media_type="image/png")
+        return FileResponse(heatmap_path, media_type=media_type)
+    if heatmap_filename in lazy_heatmaps:
+        image = await run_inference(lazy_heatmaps.get, heatmap_filename)
+        if image is not None:
+            return Response(content=image, media_type=media_type)
     return {"error": "Heatmap not found"}
 
 
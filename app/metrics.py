@@ -0,0 +1,255 @@
+"""
+In-process latency and throughput metrics, exported at /metrics
+
+A small dependency-free subset of the Prometheus client: counters,
+histograms and metrics read from callbacks at scrape time, rendered in the
+Prometheus text exposition format. The pipeline records per-stage timings
+into STAGE_SECONDS, e.g.
+
+    @STAGE_SECONDS.time(stage="decode")
+    def load_image_from_bytes(...): ...
+
+    with STAGE_SECONDS.time(stage="save"):
+        ...
+
+Values are per process. Behind `uvicorn --workers N` each scrape sees the
+worker that answered it, so scrape workers individually (or run one worker
+per container) when exact totals matter.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; spans a cached hit (~1 ms) to a multi-second full-resolution heatmap
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+_local = threading.local()
+
+
+@contextmanager
+def paused():
+    """Record nothing from this thread inside the block, e.g. during model warm-up"""
+    _local.paused = True
+    try:
+        yield
+    finally:
+        _local.paused = False
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        if getattr(_local, "paused", False):
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in values]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if getattr(_local, "paused", False):
+            return
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [per-bucket counts..., +Inf count], sum
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts = entry[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of a block; also usable as a function decorator"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def collect(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """
+    Gauge (or counter kept elsewhere, e.g. cache hits) read from a callback at scrape time
+
+    fn returns a number, or for labelled metrics an iterable of
+    (label values tuple, number) pairs.
+    """
+
+    def __init__(self, name, documentation, fn, labelnames=(), type_name="gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+        self.type_name = type_name
+
+    def collect(self):
+        try:
+            values = self.fn()
+        except Exception as e:
+            print(f"Metric {self.name} unavailable: {e}")
+            return []
+        if not self.labelnames:
+            values = [((), values)]
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in values]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, fn, labelnames=()):
+        return self._register(CallbackMetric(name, documentation, fn, labelnames))
+
+    def counter_callback(self, name, documentation, fn, labelnames=()):
+        return self._register(CallbackMetric(name, documentation, fn, labelnames, type_name="counter"))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        for metric in self._metrics.values():
+            metric.reset()
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+metrics = MetricsRegistry()
+
+# Stages may nest: predict_explain covers gradcam_forward + gradcam_backward,
+# overlay covers colormap, tiling covers the predict calls for its tiles
+STAGE_SECONDS = metrics.histogram(
+    "bladeguard_stage_seconds",
+    "Wall time per pipeline stage (decode, preprocess, predict, predict_explain, "
+    "gradcam_forward, gradcam_backward, overlay, colormap, encode, save, tiling)",
+    ["stage"],
+)
+
+BATCH_SIZE = metrics.histogram(
+    "bladeguard_model_batch_size",
+    "Images per model forward pass",
+    ["kind"],
+    buckets=BATCH_SIZE_BUCKETS,
+)
+
+RESULTS = metrics.counter(
+    "bladeguard_results_total",
+    "Per-image results returned, by severity, recommended action and model version",
+    ["severity", "recommended_action", "model_version"],
+)
+
+IMAGE_ERRORS = metrics.counter(
+    "bladeguard_image_errors_total",
+    "Images that could not be analyzed, by reason",
+    ["reason"],
+)
+
+REQUEST_SECONDS = metrics.histogram(
+    "bladeguard_http_request_seconds",
+    "HTTP request latency until the response starts, by route and status",
+    ["method", "route", "status"],
+)
+
+
+if hasattr(os, "register_at_fork"):
+    # A forked worker reports its own traffic, not what the parent had counted
+    os.register_at_fork(after_in_child=metrics.reset)
@@ -1,43 +1,323 @@
-import torch
-from torchvision import models
 import os
+import threading
+import time
+import weakref
+
+from .utils.visualization import explain_and_classify
+from .metrics import STAGE_SECONDS, BATCH_SIZE, paused as metrics_paused
+from .config import (
+    INFERENCE_BACKEND,
+    QUANT_CALIBRATION_DIR,
+    QUANT_CALIBRATION_IMAGES,
+    MODEL_MMAP,
+    TORCH_THREADS,
+)
+
+# torch, torchvision and app.backends are imported where they are used: the
+# API imports this module at startup, long before the model is needed
 
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 MODEL_PATH = os.path.join("models", "blade_resnet50.pth")
 
+def get_device():
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def _load_mmap(path):
+    """
+    torch.load with every tensor backed by a read-only mapping of the file
+
+    The mapping is private copy-on-write, but the weights are never written,
+    so all processes that load the same file share its page-cache pages
+    instead of each holding a ~100 MB copy.
+    """
+    import torch
+
+    try:
+        return torch.load(path, map_location="cpu", mmap=True)
+    except RuntimeError as e:
+        # Checkpoints in the pre-1.6 (non-zip) format cannot be mapped
+        print(f"Could not memory-map {path} (falling back to a private copy): {e}")
+        return None
+
+def load_checkpoint(path, device=None, mmap=None):
+    """
+    Build the fp32 ResNet50 from a train_model.py checkpoint; returns (model, class_names)
+
+    Args:
+        path: Checkpoint saved by train_model.py
+        device: Target device (None = CUDA if available, else CPU)
+        mmap: Keep CPU weights memory-mapped from the file rather than
+            copying them into process memory (None = BLADEGUARD_MODEL_MMAP)
+    """
+    import torch
+    from torchvision import models
+
+    device = device or get_device()
+    mmap = MODEL_MMAP if mmap is None else mmap
+    checkpoint = _load_mmap(path) if mmap and device == "cpu" else None
+    mapped = checkpoint is not None
+    if not mapped:
+        checkpoint = torch.load(path, map_location=device)
+    class_names = checkpoint["class_names"]
+
+    # With mapped weights, build the module on the meta device and adopt the
+    # loaded tensors as parameters (assign=True) instead of allocating random
+    # weights and copying the checkpoint into them
+    with torch.device("meta" if mapped else device):
+        model = models.resnet50(weights=None)
+        num_ftrs = model.fc.in_features
+        model.fc = torch.nn.Linear(num_ftrs, len(class_names))
+    model.load_state_dict(checkpoint["model_state_dict"], assign=mapped)
+    model.eval()
+    model.to(device)
+    return model, class_names
+
 class ModelLoader:
-    def __init__(self):
+    def __init__(self, backend=None, model_path=None):
+        """
+        Args:
+            backend: Inference backend for the conv backbone (see app/backends.py);
+                None = BLADEGUARD_INFERENCE_BACKEND
+            model_path: Checkpoint to load; None = MODEL_PATH, with a
+                placeholder model if that does not exist
+        """
+        backend = (backend or INFERENCE_BACKEND).lower()
+        self.device = get_device()
+        if TORCH_THREADS > 0:
+            import torch
+            torch.set_num_threads(TORCH_THREADS)
+
+        if model_path is not None and not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model checkpoint not found at {model_path}")
+        model_path = model_path or MODEL_PATH
+
         # Check if model exists, otherwise use placeholder
-        if not os.path.exists(MODEL_PATH):
+        if not os.path.exists(model_path):
             self.model = None
+            self.backbone = None
+            self.backend = "eager"
             self.class_names = ["healthy", "minor_damage", "severe_damage"]
+            self.checkpoint_id = "placeholder"
             return
-        
-        checkpoint = torch.load(MODEL_PATH, map_location=DEVICE)
-        class_names = checkpoint["class_names"]
 
-        model = models.resnet50(weights=None)
-        num_ftrs = model.fc.in_features
-        model.fc = torch.nn.Linear(num_ftrs, len(class_names))
-        model.load_state_dict(checkpoint["model_state_dict"])
-        model.eval()
-        model.to(DEVICE)
+        # Identifies the loaded weights, e.g. for caching results per checkpoint
+        stat = os.stat(model_path)
+        checkpoint_id = f"{os.path.basename(model_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+        model, class_names = load_checkpoint(model_path, self.device)
 
         self.model = model
         self.class_names = class_names
+        self.backbone, self.backend = self._build_backbone(model, backend)
+        self.checkpoint_id = f"{checkpoint_id}:{self.backend}"
+
+    @property
+    def is_loaded(self):
+        """False when no checkpoint was found and placeholder predictions are returned"""
+        return self.model is not None
+
+    def _build_backbone(self, model, backend):
+        """Optimized backbone for the requested backend, falling back to eager fp32"""
+        from .backends import build_backbone, load_calibration_batches
+
+        try:
+            calibration = None
+            if backend == "static_int8":
+                calibration = load_calibration_batches(QUANT_CALIBRATION_DIR, QUANT_CALIBRATION_IMAGES)
+            return build_backbone(model, backend, calibration_batches=calibration, device=self.device), backend
+        except Exception as e:
+            print(f"Inference backend {backend!r} unavailable (falling back to eager): {e}")
+            return build_backbone(model, "eager"), "eager"
+
+    def forward_logits(self, tensor):
+        """Raw class logits for a (N, C, H, W) batch through the selected backend"""
+        import torch
 
-    def predict(self, tensor):
-        # Fallback to placeholder if model not loaded
-        if self.model is None:
-            return "healthy", 0.95
-        
-        tensor = tensor.to(DEVICE)
         with torch.no_grad():
-            outputs = self.model(tensor)
-            probs = torch.softmax(outputs, dim=1)
-            conf, preds = torch.max(probs, 1)
-        label = self.class_names[preds.item()]
-        confidence = conf.item()
+            features = self.backbone(tensor.to(self.device))
+            return self.model.fc(torch.flatten(self.model.avgpool(features), 1))
+
+    def predict(self, tensor):
+        label, confidence = self.predict_batch(tensor)[0]
         return label, confidence
 
-model_loader = ModelLoader()
+    def predict_batch(self, tensor):
+        """Run a (N, C, H, W) batch and return a list of N (label, confidence) pairs"""
+        # Fallback to placeholder if model not loaded
+        if not self.is_loaded:
+            return [("healthy", 0.95)] * tensor.shape[0]
+
+        import torch
+
+        probs = torch.softmax(self.forward_logits(tensor), dim=1)
+        conf, preds = torch.max(probs, 1)
+        return [
+            (self.class_names[p], c)
+            for p, c in zip(preds.tolist(), conf.tolist())
+        ]
+
+    def predict_and_explain_batch(self, tensor):
+        """
+        Classify a (N, C, H, W) batch and compute each image's Grad-CAM in one forward pass
+
+        Returns a list of N (label, confidence, cam) tuples; cam is a low-res
+        numpy array, or None when the placeholder model is in use.
+        """
+        if not self.is_loaded:
+            return [("healthy", 0.95, None)] * tensor.shape[0]
+
+        probs, cams = explain_and_classify(self.model, tensor, features_fn=self.backbone)
+        conf, preds = probs.max(dim=1)
+        return [
+            (self.class_names[p], c, cam)
+            for p, c, cam in zip(preds.tolist(), conf.tolist(), cams)
+        ]
+
+def create_model_loader(backend=None, model_path=None):
+    """
+    ModelLoader for the configured backend; "onnxruntime" serves an exported ONNX graph
+
+    model_path selects a checkpoint other than MODEL_PATH / ONNX_MODEL_PATH.
+    A .onnx path is always served with ONNX Runtime, a .pth path with PyTorch.
+    """
+    backend = (backend or INFERENCE_BACKEND).lower()
+    if model_path is not None:
+        if model_path.endswith(".onnx"):
+            from .onnx_backend import OnnxModelLoader
+            return OnnxModelLoader(model_path)
+        if backend == "onnxruntime":
+            backend = "eager"
+    elif backend == "onnxruntime":
+        from .onnx_backend import OnnxModelLoader
+        try:
+            return OnnxModelLoader()
+        except Exception as e:
+            print(f"Inference backend 'onnxruntime' unavailable (falling back to eager): {e}")
+            backend = "eager"
+    return ModelLoader(backend, model_path)
+
+# A fork while another thread holds a loader's lock would leave the child's
+# copy locked forever (e.g. gunicorn --preload during warm-up). Held weakly
+# so that swapped-out models can be freed.
+_lazy_loaders = weakref.WeakSet()
+
+def _reset_locks_after_fork():
+    for lazy in list(_lazy_loaders):
+        lazy._reset_lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_locks_after_fork)
+
+class LazyModelLoader:
+    """
+    Stand-in for the model loader that builds it on first use
+
+    Importing the API stays cheap: torch is imported and the checkpoint
+    loaded either by warm_up() (started in the background when the API
+    starts) or by the first request that needs the model, whichever comes
+    first. Attribute access is forwarded to the real loader.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._loader = None
+        self._lock = threading.Lock()
+        _lazy_loaders.add(self)
+        self.ready = False
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._loader is not None
+
+    def get(self):
+        """The real loader, building it on the first call"""
+        if self._loader is None:
+            with self._lock:
+                if self._loader is None:
+                    start = time.perf_counter()
+                    loader = self._factory()
+                    self.load_seconds = time.perf_counter() - start
+                    self._loader = loader
+        return self._loader
+
+    def warm_up(self, batch_sizes=(1,)):
+        """
+        Load the model and run a dummy batch of each size through it
+
+        The first forward pass allocates buffers and picks kernels (and
+        traces/compiles for the torchscript/compile backends), so doing it
+        here keeps that cost out of the first real request. Sets ready, or
+        error if loading fails.
+        """
+        from PIL import Image
+        from .utils.preprocessing import MODEL_INPUT_SIZE, preprocess_batch
+
+        try:
+            loader = self.get()
+            start = time.perf_counter()
+            blank = Image.new("RGB", MODEL_INPUT_SIZE)
+            # Dummy batches would skew the latency histograms
+            with metrics_paused():
+                for batch_size in sorted(set(batch_sizes)):
+                    loader.predict_and_explain_batch(preprocess_batch([blank] * batch_size))
+            self.warmup_seconds = time.perf_counter() - start
+            self.ready = True
+        except Exception as e:
+            self.error = str(e)
+            print(f"Model warm-up failed: {e}")
+
+    def status(self):
+        """Readiness details for the /readyz probe"""
+        status = {
+            "ready": self.ready,
+            "loaded": self.loaded,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+        }
+        if self.loaded:
+            status["backend"] = self._loader.backend
+            status["checkpoint_id"] = self._loader.checkpoint_id
+        if self.error:
+            status["error"] = self.error
+        return status
+
+    # Explicit forwards so that binding e.g. model_loader.predict_batch at
+    # import time (app/inference.py) does not trigger the load. Every model
+    # call goes through here, so this is also where it is timed (app/metrics.py)
+    def forward_logits(self, tensor):
+        loader = self.get()
+        BATCH_SIZE.observe(tensor.shape[0], kind="predict")
+        with STAGE_SECONDS.time(stage="predict"):
+            return loader.forward_logits(tensor)
+
+    def predict(self, tensor):
+        loader = self.get()
+        BATCH_SIZE.observe(tensor.shape[0], kind="predict")
+        with STAGE_SECONDS.time(stage="predict"):
+            return loader.predict(tensor)
+
+    def predict_batch(self, tensor):
+        loader = self.get()
+        BATCH_SIZE.observe(tensor.shape[0], kind="predict")
+        with STAGE_SECONDS.time(stage="predict"):
+            return loader.predict_batch(tensor)
+
+    def predict_and_explain_batch(self, tensor):
+        loader = self.get()
+        BATCH_SIZE.observe(tensor.shape[0], kind="predict_explain")
+        with STAGE_SECONDS.time(stage="predict_explain"):
+            return loader.predict_and_explain_batch(tensor)
+
+    def __getattr__(self, name):
+        # Only reached for attributes not defined above (model, class_names, ...)
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+model_loader = LazyModelLoader(create_model_loader)
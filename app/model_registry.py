@@ -0,0 +1,256 @@
+"""
+Registry of named, versioned models with hot swap
+
+Several checkpoints can be served side by side, e.g. one model per blade
+manufacturer (TPI vs LM), each with one or more versions. Requests are
+routed by an explicit "name" or "name@version", else by blade_type, else to
+the default model.
+
+The registry is described by a JSON manifest (BLADEGUARD_MODEL_REGISTRY):
+
+    {
+      "default": "general",
+      "routes": {"TPI": "tpi", "LM": "lm"},
+      "models": {
+        "general": {"active": "v1", "versions": {"v1": "models/blade_resnet50.pth"}},
+        "lm": {
+          "active": "2024-06",
+          "backend": "static_int8",
+          "versions": {"2024-05": "models/lm_2024-05.pth", "2024-06": "models/lm_2024-06.pth"}
+        }
+      }
+    }
+
+reload() re-reads the manifest. New or retrained checkpoints are loaded and
+warmed up first; the routing table is then replaced in a single assignment,
+so requests already in flight finish on the model they started with and
+later requests see only warm models. Without a manifest the registry serves
+the single checkpoint at MODEL_PATH.
+"""
+import json
+import os
+import threading
+
+from .batching import BatchScheduler
+from .model_loader import LazyModelLoader, create_model_loader, model_loader, MODEL_PATH
+from .config import MAX_BATCH_SIZE, MAX_BATCH_WAIT_MS, MODEL_REGISTRY_PATH
+
+DEFAULT_MODEL_NAME = "default"
+DEFAULT_MODEL_VERSION = "v1"
+
+
+def _file_signature(path):
+    """Changes when a checkpoint is replaced in place, e.g. by a retraining run"""
+    try:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return None
+
+
+class ModelVersion:
+    """One checkpoint of a named model, loaded lazily, with its own micro-batchers"""
+
+    def __init__(self, name, version, path, backend=None, loader=None, loader_factory=create_model_loader):
+        """
+        Args:
+            name: Model name, e.g. "lm"
+            version: Version label, e.g. "2024-06"
+            path: Checkpoint (.pth) or exported ONNX graph (.onnx)
+            backend: Inference backend (None = BLADEGUARD_INFERENCE_BACKEND)
+            loader: Existing LazyModelLoader to reuse instead of creating one
+            loader_factory: Callable (backend, model_path) -> model loader
+        """
+        self.name = name
+        self.version = version
+        self.path = path
+        self.backend = backend
+        self.signature = _file_signature(path)
+        self.loader = loader or LazyModelLoader(lambda: loader_factory(backend, path))
+        self.prediction_batcher = BatchScheduler(
+            self.loader.predict_and_explain_batch,
+            max_batch_size=MAX_BATCH_SIZE,
+            max_wait_ms=MAX_BATCH_WAIT_MS,
+        )
+        self.classification_batcher = BatchScheduler(
+            self.loader.predict_batch,
+            max_batch_size=MAX_BATCH_SIZE,
+            max_wait_ms=MAX_BATCH_WAIT_MS,
+        )
+
+    @property
+    def ref(self):
+        return f"{self.name}@{self.version}"
+
+    def same_checkpoint(self, path, backend):
+        return path == self.path and backend == self.backend and _file_signature(path) == self.signature
+
+    def retire(self):
+        """Stop the batcher threads; callers still holding this version run unbatched"""
+        self.prediction_batcher.close()
+        self.classification_batcher.close()
+
+    def describe(self):
+        return {"path": self.path, "backend": self.backend, **self.loader.status()}
+
+
+class _Snapshot:
+    """Immutable routing state; replaced as a whole on reload"""
+
+    def __init__(self, versions, active, routes, default):
+        self.versions = versions  # {(name, version): ModelVersion}
+        self.active = active  # {name: version}
+        self.routes = routes  # {BLADE_TYPE: name}
+        self.default = default
+
+
+class ModelRegistry:
+    def __init__(self, manifest_path=None, loader_factory=create_model_loader, default_loader=None):
+        """
+        Args:
+            manifest_path: JSON manifest (see module docstring); None or a
+                missing file serves MODEL_PATH as the only model
+            loader_factory: Callable (backend, model_path) -> model loader
+            default_loader: LazyModelLoader for MODEL_PATH when there is no manifest
+        """
+        self.manifest_path = manifest_path
+        self.loader_factory = loader_factory
+        self.default_loader = default_loader
+        self._reload_lock = threading.Lock()
+        self._snapshot = self._build(self._read_manifest(), _Snapshot({}, {}, {}, None))
+
+    def _read_manifest(self):
+        """Parsed manifest, or None when serving MODEL_PATH alone"""
+        if self.manifest_path and os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        return None
+
+    def _build(self, manifest, current):
+        """New snapshot from a manifest, reusing unchanged versions of the current one"""
+        # Without a manifest, MODEL_PATH keeps its placeholder fallback
+        builtin = manifest is None
+        if builtin:
+            manifest = {
+                "default": DEFAULT_MODEL_NAME,
+                "models": {DEFAULT_MODEL_NAME: {
+                    "active": DEFAULT_MODEL_VERSION,
+                    "versions": {DEFAULT_MODEL_VERSION: MODEL_PATH},
+                }},
+            }
+        models = manifest.get("models") or {}
+        if not models:
+            raise ValueError("Model registry manifest lists no models")
+        default = manifest.get("default") or next(iter(models))
+        routes = {blade_type.upper(): name for blade_type, name in (manifest.get("routes") or {}).items()}
+        for name in [default, *routes.values()]:
+            if name not in models:
+                raise ValueError(f"Model registry routes to unknown model {name!r}")
+
+        versions, active = {}, {}
+        for name, entry in models.items():
+            backend = entry.get("backend")
+            if not entry.get("versions"):
+                raise ValueError(f"Model {name!r} has no versions")
+            for version, path in entry["versions"].items():
+                existing = current.versions.get((name, version))
+                if existing is not None and existing.same_checkpoint(path, backend):
+                    versions[name, version] = existing
+                    continue
+                if not builtin and not os.path.exists(path):
+                    raise FileNotFoundError(f"Checkpoint for {name}@{version} not found at {path}")
+                # The process-wide model_loader serves MODEL_PATH until it is retrained
+                reuse_default = builtin and not current.versions
+                versions[name, version] = ModelVersion(
+                    name, version, path, backend,
+                    loader=self.default_loader if reuse_default else None,
+                    loader_factory=self.loader_factory,
+                )
+            active[name] = entry.get("active") or next(iter(entry["versions"]))
+            if (name, active[name]) not in versions:
+                raise ValueError(f"Active version {active[name]!r} of model {name!r} is not listed")
+        return _Snapshot(versions, active, routes, default)
+
+    def resolve(self, blade_type=None, model_version=None):
+        """
+        ModelVersion to serve a request
+
+        Args:
+            blade_type: Routed through the manifest's "routes" table
+            model_version: Explicit "name" (its active version) or "name@version";
+                takes precedence over blade_type
+
+        Raises:
+            ValueError: unknown model or version
+        """
+        snapshot = self._snapshot
+        if model_version:
+            name, _, version = model_version.partition("@")
+            if name not in snapshot.active:
+                raise ValueError(f"Unknown model {name!r}; available: {sorted(snapshot.active)}")
+            version = version or snapshot.active[name]
+            if (name, version) not in snapshot.versions:
+                raise ValueError(f"Unknown version {version!r} of model {name!r}")
+            return snapshot.versions[name, version]
+        name = snapshot.routes.get((blade_type or "").upper(), snapshot.default)
+        return snapshot.versions[name, snapshot.active[name]]
+
+    def active_versions(self, snapshot=None):
+        snapshot = snapshot or self._snapshot
+        return [snapshot.versions[name, version] for name, version in snapshot.active.items()]
+
+    def warm_up(self, batch_sizes=(1,)):
+        """Load and warm up every active version (see LazyModelLoader.warm_up)"""
+        for served in self.active_versions():
+            if not served.loader.ready:
+                served.loader.warm_up(batch_sizes=batch_sizes)
+
+    def reload(self, batch_sizes=(1,)):
+        """
+        Re-read the manifest and switch to it without downtime
+
+        Newly listed or retrained active versions are warmed up before the
+        switch; if any fails, the current models stay in service and the
+        error is raised. Versions no longer listed are retired.
+        """
+        with self._reload_lock:
+            current = self._snapshot
+            candidate = self._build(self._read_manifest(), current)
+            added = [v for key, v in candidate.versions.items() if current.versions.get(key) is not v]
+
+            for served in self.active_versions(candidate):
+                if not served.loader.ready:
+                    served.loader.warm_up(batch_sizes=batch_sizes)
+                    if not served.loader.ready:
+                        for version in added:
+                            version.retire()
+                        raise RuntimeError(f"Warm-up of {served.ref} failed: {served.loader.error}")
+
+            # Single attribute assignment: readers see the old or the new table, never a mix
+            self._snapshot = candidate
+
+            kept = set(map(id, candidate.versions.values()))
+            for version in current.versions.values():
+                if id(version) not in kept:
+                    version.retire()
+            return self.describe()
+
+    def status(self):
+        """Readiness of the active versions, for /readyz"""
+        active = {served.ref: served.loader.status() for served in self.active_versions()}
+        errors = {ref: status["error"] for ref, status in active.items() if "error" in status}
+        status = {"ready": all(s["ready"] for s in active.values()), "models": active}
+        if errors:
+            status["error"] = errors
+        return status
+
+    def describe(self):
+        snapshot = self._snapshot
+        models = {}
+        for (name, version), served in snapshot.versions.items():
+            entry = models.setdefault(name, {"active": snapshot.active[name], "versions": {}})
+            entry["versions"][version] = served.describe()
+        return {"default": snapshot.default, "routes": snapshot.routes, "models": models}
+
+
+model_registry = ModelRegistry(MODEL_REGISTRY_PATH, default_loader=model_loader)
@@ -0,0 +1,97 @@
+"""
+ONNX Runtime serving backend
+
+OnnxModelLoader exposes the same predict interface as ModelLoader, backed
+by an ONNX graph exported with export_onnx.py. The graph returns logits and
+per-class Grad-CAM maps (see backends.ExplainableResNet), so explanation
+works without autograd.
+"""
+import json
+import os
+
+import numpy as np
+
+# Optional onnxruntime import (only needed for the onnxruntime backend)
+try:
+    import onnxruntime as ort
+    ORT_AVAILABLE = True
+except ImportError:
+    ORT_AVAILABLE = False
+    ort = None
+
+from .config import ONNX_MODEL_PATH, ORT_INTRA_OP_THREADS
+
+
+def _to_numpy(tensor):
+    # Accept torch tensors without importing torch here
+    if hasattr(tensor, "detach"):
+        tensor = tensor.detach().cpu().numpy()
+    return np.ascontiguousarray(tensor, dtype=np.float32)
+
+
+def _softmax(logits):
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class OnnxModelLoader:
+    backend = "onnxruntime"
+
+    def __init__(self, model_path=None, intra_op_threads=None):
+        model_path = model_path or ONNX_MODEL_PATH
+        if not ORT_AVAILABLE:
+            raise ImportError("onnxruntime is required for the onnxruntime backend. Install with: pip install onnxruntime")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX model not found at {model_path}; run python export_onnx.py first")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = ORT_INTRA_OP_THREADS if intra_op_threads is None else intra_op_threads
+        if threads:
+            options.intra_op_num_threads = threads
+
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.class_names = json.loads(metadata["class_names"])
+
+        stat = os.stat(model_path)
+        self.checkpoint_id = f"{os.path.basename(model_path)}:{stat.st_size}:{stat.st_mtime_ns}:{self.backend}"
+
+    @property
+    def is_loaded(self):
+        """Always True: construction fails rather than falling back to a placeholder"""
+        return True
+
+    def _run(self, tensor):
+        logits, cams = self.session.run(None, {self.input_name: _to_numpy(tensor)})
+        return logits, cams
+
+    def forward_logits(self, tensor):
+        """Raw class logits, returned as the same array type as the input"""
+        logits, _ = self._run(tensor)
+        if hasattr(tensor, "detach"):
+            import torch
+            return torch.from_numpy(logits)
+        return logits
+
+    def predict(self, tensor):
+        label, confidence = self.predict_batch(tensor)[0]
+        return label, confidence
+
+    def predict_batch(self, tensor):
+        """Run a (N, C, H, W) batch and return a list of N (label, confidence) pairs"""
+        logits, _ = self._run(tensor)
+        probs = _softmax(logits)
+        preds = probs.argmax(axis=1)
+        return [(self.class_names[p], float(probs[i, p])) for i, p in enumerate(preds)]
+
+    def predict_and_explain_batch(self, tensor):
+        """Same contract as ModelLoader.predict_and_explain_batch: (label, confidence, 7x7 cam) per image"""
+        logits, cams = self._run(tensor)
+        probs = _softmax(logits)
+        preds = probs.argmax(axis=1)
+        return [
+            (self.class_names[p], float(probs[i, p]), np.maximum(cams[i, p], 0.0).astype(np.float32))
+            for i, p in enumerate(preds)
+        ]
@@ -0,0 +1,229 @@
+"""
+Content-hash cache for per-image analysis results
+
+Entries are keyed on the SHA-256 of the uploaded bytes plus the model
+checkpoint identity, and hold the prediction and heatmap reference (not the
+blade-type-dependent action, which is cheap to recompute). An in-memory LRU
+with TTL sits in front of an optional on-disk JSON tier that survives restarts.
+The disk tier is bounded by age, total size and entry count; a background
+thread evicts the oldest files (by mtime), off the request path.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from .retention import prune_oldest, remove_files
+
+# A prune is also requested after this many puts, so bursts are trimmed before the next interval
+PRUNE_EVERY_PUTS = 256
+
+# The pruning thread does not survive a fork; children start their own
+_caches = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for cache in list(_caches):
+        cache._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class ResultCache:
+    def __init__(self, max_entries=4096, ttl_seconds=3600.0, disk_dir=None, max_disk_bytes=0, max_disk_entries=0,
+                 prune_interval_seconds=300.0):
+        """
+        Args:
+            max_entries: In-memory LRU size (0 disables the cache)
+            ttl_seconds: Entries older than this are treated as misses and dropped
+            disk_dir: Optional directory for the persistent tier
+            max_disk_bytes: Disk tier size cap; oldest entries are evicted first (0 = no cap)
+            max_disk_entries: Disk tier entry cap (0 = no cap)
+            prune_interval_seconds: How often the background thread applies the disk limits
+        """
+        self.max_entries = int(max_entries)
+        self.ttl = float(ttl_seconds)
+        self.disk_dir = disk_dir or None
+        self.max_disk_bytes = int(max_disk_bytes)
+        self.max_disk_entries = int(max_disk_entries)
+        self.prune_interval = float(prune_interval_seconds)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._prune_requested = threading.Event()
+        self._pruner = None
+        self._puts = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+        _caches.add(self)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._prune_requested = threading.Event()
+        self._pruner = None
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(image_bytes, model_id, variant=""):
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        model = hashlib.sha256(f"{model_id}|{variant}".encode()).hexdigest()[:16]
+        return f"{model}-{digest}"
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[-2:], f"{key}.json")
+
+    def _expired(self, stored_at):
+        return self.ttl > 0 and time.time() - stored_at > self.ttl
+
+    def _read_disk(self, key):
+        try:
+            with open(self._disk_path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(entry["stored_at"]):
+            self._remove_disk(key)
+            return None
+        return entry
+
+    def _write_disk(self, key, entry):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def _remove_disk(self, key):
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    def get(self, key, validate=None):
+        """
+        Cached value for key, or None on a miss
+
+        Args:
+            validate: Optional callable; entries for which it returns False
+                (e.g. their heatmap file is gone) are dropped and count as misses
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._expired(entry["stored_at"]):
+                del self._memory[key]
+                entry = None
+            from_disk = False
+
+        if entry is None and self.disk_dir:
+            entry = self._read_disk(key)
+            from_disk = entry is not None
+
+        if entry is not None and validate is not None and not validate(entry["value"]):
+            self.invalidate(key)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if from_disk:
+                self.disk_hits += 1
+                self._store_memory(key, entry)
+            elif key in self._memory:
+                self._memory.move_to_end(key)
+        return entry["value"]
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        entry = {"stored_at": time.time(), "value": value}
+        with self._lock:
+            self._store_memory(key, entry)
+            self._puts += 1
+            prune = self._puts % PRUNE_EVERY_PUTS == 0
+        if self.disk_dir:
+            try:
+                self._write_disk(key, entry)
+            except OSError as e:
+                print(f"Result cache disk write failed: {e}")
+            self._ensure_pruner()
+            if prune:
+                self._prune_requested.set()
+
+    def invalidate(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+        if self.disk_dir:
+            self._remove_disk(key)
+
+    def _store_memory(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _ensure_pruner(self):
+        if self._pruner is not None:
+            return
+        with self._lock:
+            if self._pruner is None:
+                self._pruner = threading.Thread(target=self._run_pruner, name="bladeguard-result-cache-pruner",
+                                                daemon=True)
+                self._pruner.start()
+
+    def _run_pruner(self):
+        while True:
+            self._prune_requested.wait(timeout=self.prune_interval or None)
+            self._prune_requested.clear()
+            try:
+                self.prune_disk()
+            except Exception as e:
+                print(f"Result cache disk prune failed: {e}")
+
+    def prune_disk(self):
+        """Evict expired entries, then the oldest ones over the size/count caps; returns the number deleted"""
+        if not self.disk_dir or not (self.ttl > 0 or self.max_disk_bytes or self.max_disk_entries):
+            return 0
+
+        files = []
+        try:
+            with os.scandir(self.disk_dir) as shards:
+                for shard in shards:
+                    if not shard.is_dir():
+                        continue
+                    with os.scandir(shard.path) as entries:
+                        for entry in entries:
+                            # .tmp files are writes in progress
+                            if entry.name.endswith(".json") and entry.is_file():
+                                stat = entry.stat()
+                                files.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            return 0
+        deleted = remove_files(prune_oldest(files, max(self.ttl, 0), self.max_disk_bytes, self.max_disk_entries))
+        self.disk_evictions += deleted
+        return deleted
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._memory),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "disk_evictions": self.disk_evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,49 @@
+"""
+Oldest-first retention for directories of cache files
+
+Shared by the heatmap writer (app/heatmap_writer.py) and the result cache's
+disk tier (app/result_cache.py), so both apply the same age, size and count
+rules.
+"""
+import os
+import time
+
+
+def prune_oldest(entries, max_age_seconds=0, max_bytes=0, max_count=0, now=None):
+    """
+    Paths to delete, oldest first, so the rest satisfy every limit
+
+    Args:
+        entries: (mtime, size, path) tuples, in any order
+        max_age_seconds: Delete files older than this (0 = no age limit)
+        max_bytes: Keep the total size at or below this (0 = no size limit)
+        max_count: Keep at most this many files (0 = no count limit)
+        now: Current time.time(); defaults to now
+    """
+    if not (max_age_seconds or max_bytes or max_count):
+        return []
+    entries = sorted(entries)  # oldest first
+    now = time.time() if now is None else now
+    total = sum(size for _, size, _ in entries)
+    expired = 0
+    for mtime, size, _ in entries:
+        over_age = max_age_seconds and now - mtime > max_age_seconds
+        over_count = max_count and len(entries) - expired > max_count
+        over_size = max_bytes and total > max_bytes
+        if not (over_age or over_count or over_size):
+            break
+        expired += 1
+        total -= size
+    return [path for _, _, path in entries[:expired]]
+
+
+def remove_files(paths):
+    """Delete paths, ignoring ones already gone (e.g. removed by another worker process); returns the count deleted"""
+    deleted = 0
+    for path in paths:
+        try:
+            os.remove(path)
+            deleted += 1
+        except FileNotFoundError:
+            pass
+    return deleted
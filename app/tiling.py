@@ -0,0 +1,197 @@
+"""
+Tiled (sliding-window) inference for high-resolution blade photos
+
+Squashing a 20 MP drone still to 224x224 shrinks it ~24x, and small
+leading-edge erosion or pitting disappears in the process. Here the photo is
+downsized only to a working resolution (TILE_MAX_SIDE), cut into overlapping
+224 px tiles and the tiles are classified as batched tensors. A cheap
+texture prefilter drops sky and featureless background before any tile
+reaches the model, and the per-tile results are folded into one image
+verdict plus a coarse damage-location grid.
+"""
+import numpy as np
+from PIL import Image
+
+from .utils.preprocessing import MODEL_INPUT_SIZE, model_pixels, normalize_batch
+from .metrics import STAGE_SECONDS
+
+# Least to most severe; labels a checkpoint adds beyond these rank as most severe
+SEVERITY_ORDER = ["healthy", "minor_damage", "severe_damage"]
+
+# The prefilter measures texture on a copy reduced by this factor
+TEXTURE_REDUCE = 4
+
+
+def severity_rank(label):
+    return SEVERITY_ORDER.index(label) if label in SEVERITY_ORDER else len(SEVERITY_ORDER)
+
+
+def working_image(pil_image, max_side, tile_size=MODEL_INPUT_SIZE[0]):
+    """
+    Resize so the longer side is at most max_side (0 = unchanged) and the shorter at least one tile
+
+    Returns:
+        (image, scale) where original coordinates = working coordinates * scale
+    """
+    width, height = pil_image.size
+    factor = 1.0
+    if max_side and max(width, height) > max_side:
+        factor = max_side / max(width, height)
+    if min(width, height) * factor < tile_size:
+        factor = tile_size / min(width, height)
+    if factor == 1.0:
+        return pil_image, 1.0
+    size = (max(tile_size, round(width * factor)), max(tile_size, round(height * factor)))
+    return pil_image.resize(size, Image.BILINEAR, reducing_gap=2.0), width / size[0]
+
+
+def _starts(length, tile_size, stride):
+    if length <= tile_size:
+        return [0]
+    starts = list(range(0, length - tile_size + 1, stride))
+    if starts[-1] != length - tile_size:
+        starts.append(length - tile_size)  # last tile flush with the edge
+    return starts
+
+
+def plan_tiles(size, tile_size=MODEL_INPUT_SIZE[0], overlap=0.25):
+    """
+    Overlapping tile boxes covering an image
+
+    Args:
+        size: (width, height) of the working image
+        tile_size: Tile side in pixels
+        overlap: Fraction of a tile shared with its neighbour (0 <= overlap < 1)
+
+    Returns:
+        (boxes, rows, cols): (N, 4) int array of (x0, y0, x1, y1) in row-major
+        order over a rows x cols grid
+    """
+    stride = max(1, round(tile_size * (1.0 - overlap)))
+    xs = _starts(size[0], tile_size, stride)
+    ys = _starts(size[1], tile_size, stride)
+    boxes = np.array([(x, y, x + tile_size, y + tile_size) for y in ys for x in xs], dtype=np.int64)
+    return boxes, len(ys), len(xs)
+
+
+def texture_scores(pil_image, boxes):
+    """
+    Luminance standard deviation (grey levels) inside each box
+
+    Sky, haze and featureless background score a few grey levels; a blade
+    edge, surface texture or even a small dark erosion spot in a tile lifts it
+    well above that. Computed on a reduced greyscale copy with summed-area
+    tables of x and x^2, so scoring every tile costs about one small resize.
+    """
+    gray = np.asarray(pil_image.convert("L").reduce(TEXTURE_REDUCE), dtype=np.float64)
+    height, width = gray.shape
+    sums = np.zeros((2, height + 1, width + 1))
+    sums[0, 1:, 1:] = gray.cumsum(axis=0).cumsum(axis=1)
+    sums[1, 1:, 1:] = (gray * gray).cumsum(axis=0).cumsum(axis=1)
+
+    x0, y0, x1, y1 = np.clip(boxes // TEXTURE_REDUCE, 0, [width, height] * 2).T
+    area = np.maximum((x1 - x0) * (y1 - y0), 1)
+    total, total_sq = sums[:, y1, x1] - sums[:, y0, x1] - sums[:, y1, x0] + sums[:, y0, x0]
+    mean = total / area
+    return np.sqrt(np.maximum(total_sq / area - mean * mean, 0.0))
+
+
+def select_tiles(scores, min_texture, max_tiles):
+    """Indices of tiles passing the prefilter, most textured first, capped at max_tiles (0 = no cap)"""
+    kept = np.flatnonzero(scores >= min_texture)
+    kept = kept[np.argsort(-scores[kept], kind="stable")]
+    return kept[:max_tiles] if max_tiles else kept
+
+
+def aggregate(predictions, min_confidence):
+    """
+    Image verdict from per-tile (label, confidence) predictions
+
+    The most severe damage class predicted with at least min_confidence on
+    any tile wins, with the highest such confidence; one eroded tile is enough
+    to flag a blade. Otherwise the image is healthy, with the mean confidence
+    of its healthy tiles (or 1 - the strongest sub-threshold damage
+    confidence when no tile was classified healthy).
+    """
+    confident = [(label, conf) for label, conf in predictions if label != "healthy" and conf >= min_confidence]
+    if confident:
+        worst = max(severity_rank(label) for label, _ in confident)
+        label, confidence = max(((l, c) for l, c in confident if severity_rank(l) == worst), key=lambda p: p[1])
+        return label, float(confidence)
+    healthy = [conf for label, conf in predictions if label == "healthy"]
+    if healthy:
+        return "healthy", float(np.mean(healthy))
+    return "healthy", 1.0 - max(float(conf) for _, conf in predictions)
+
+
+def damage_score(label, confidence):
+    """0 for healthy, rising with severity rank and confidence; 1 = most severe with certainty"""
+    return severity_rank(label) / (len(SEVERITY_ORDER) - 1) * float(confidence)
+
+
+@STAGE_SECONDS.time(stage="tiling")
+def tiled_predict(
+    pil_image,
+    predict_batch,
+    max_side=2048,
+    overlap=0.25,
+    min_texture=4.0,
+    max_tiles=64,
+    batch_size=16,
+    min_confidence=0.6,
+):
+    """
+    Classify an image tile by tile
+
+    The whole image, resized to the model input as usual, is classified
+    alongside the tiles and takes part in the verdict, so damage that spans
+    the frame is not missed because no single tile holds enough of it.
+
+    Args:
+        pil_image: RGB PIL image, ideally decoded at (or above) max_side
+        predict_batch: Callable taking a normalized (N, 3, 224, 224) tensor
+            and returning N (label, confidence) pairs, e.g. a loader's
+            predict_batch
+        max_side, overlap, min_texture, max_tiles, batch_size, min_confidence:
+            See the TILE_* settings in app/config.py
+
+    Returns:
+        (severity, confidence, grid, report). grid is a (rows, cols) float32
+        damage map (see damage_score; 0 for skipped tiles). report is a
+        JSON-ready dict with the tile counts, the grid and the boxes of
+        damaged tiles in original-image pixels.
+    """
+    tile_size = MODEL_INPUT_SIZE[0]
+    image, scale = working_image(pil_image, max_side, tile_size)
+    boxes, rows, cols = plan_tiles(image.size, tile_size, overlap)
+    selected = select_tiles(texture_scores(image, boxes), min_texture, max_tiles)
+
+    # Whole image first, then the selected tiles, batch_size per forward pass
+    pixels = [model_pixels(pil_image)] + [np.asarray(image.crop(tuple(boxes[i])), dtype=np.uint8) for i in selected]
+    predictions = []
+    for start in range(0, len(pixels), batch_size):
+        chunk = pixels[start:start + batch_size]
+        predictions.extend(predict_batch(normalize_batch(np.stack(chunk))))
+
+    severity, confidence = aggregate(predictions, min_confidence)
+
+    grid = np.zeros(rows * cols, dtype=np.float32)
+    damaged = []
+    for i, (label, conf) in zip(selected, predictions[1:]):
+        grid[i] = damage_score(label, conf)
+        if label != "healthy" and conf >= min_confidence:
+            damaged.append({
+                "box": [round(float(v) * scale) for v in boxes[i]],
+                "severity": label,
+                "confidence": round(float(conf), 2),
+            })
+    grid = grid.reshape(rows, cols)
+
+    report = {
+        "tiles_total": int(len(boxes)),
+        "tiles_classified": int(len(selected)),
+        "tile_size": round(tile_size * scale),
+        "grid": np.round(grid, 2).tolist(),
+        "damaged_tiles": sorted(damaged, key=lambda t: (-severity_rank(t["severity"]), -t["confidence"])),
+    }
+    return severity, confidence, grid, report
@@ -0,0 +1,65 @@
+"""
+Unpack zip/tar inspection archives into (filename, image bytes) pairs
+"""
+import os
+import tarfile
+import zipfile
+
+from .uploads import BufferReader
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def is_archive(filename):
+    return (filename or "").lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def _is_image_member(name):
+    base = os.path.basename(name)
+    # Skip macOS resource forks and hidden files
+    if not base or base.startswith(".") or "__MACOSX" in name:
+        return False
+    return base.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def extract_images(filename, data, max_images=None, max_member_bytes=64 * 1024 * 1024, max_total_bytes=None):
+    """
+    Extract image members from a zip or tar archive
+
+    Args:
+        filename: Archive filename (used to pick the format)
+        data: Archive bytes, or any buffer (e.g. the mmap of a spooled upload)
+        max_images: Raise ValueError if the archive holds more images than this
+        max_member_bytes: Raise ValueError for any image larger than this when unpacked
+        max_total_bytes: Raise ValueError if the images add up to more than this when unpacked
+
+    Returns:
+        List of (member path, image bytes), in archive order
+    """
+    images = []
+    total_bytes = 0
+
+    def add(name, size, read):
+        nonlocal total_bytes
+        if max_images is not None and len(images) >= max_images:
+            raise ValueError(f"Archive {filename} holds more than {max_images} images")
+        if size > max_member_bytes:
+            raise ValueError(f"Archive member {name} exceeds {max_member_bytes} bytes")
+        total_bytes += size
+        if max_total_bytes is not None and total_bytes > max_total_bytes:
+            raise ValueError(f"Archive {filename} unpacks to more than {max_total_bytes} bytes")
+        images.append((name, read()))
+
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(BufferReader(data)) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _is_image_member(info.filename):
+                    add(info.filename, info.file_size, lambda: archive.read(info))
+    else:
+        with tarfile.open(fileobj=BufferReader(data), mode="r:*") as archive:
+            for member in archive:
+                if member.isfile() and _is_image_member(member.name):
+                    add(member.name, member.size, lambda: archive.extractfile(member).read())
+
+    return images
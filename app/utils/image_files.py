@@ -0,0 +1,36 @@
+"""
+Image files decoded to model-sized uint8 pixels, for DataLoader-based offline scoring
+
+Shared by bulk_inspect.py and evaluation.py. Decoding happens in the
+DataLoader workers (JPEG draft decode near 224x224), and undecodable files
+are reported per image instead of failing the batch.
+"""
+import numpy as np
+
+from .preprocessing import load_image_from_bytes, model_pixels, MODEL_INPUT_SIZE
+
+
+class ImageFileDataset:
+    """Map-style dataset of model-sized uint8 pixels; decode errors are returned, not raised"""
+
+    def __init__(self, paths):
+        self.paths = paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        try:
+            with open(self.paths[index], "rb") as f:
+                image = load_image_from_bytes(f.read(), target_size=MODEL_INPUT_SIZE)
+            return index, model_pixels(image), None
+        except Exception as e:
+            return index, None, f"Could not decode image: {e}"
+
+
+def collate(samples):
+    """Keep per-sample errors; stack the decodable images into one uint8 batch"""
+    ok = [(index, pixels) for index, pixels, error in samples if error is None]
+    failed = [(index, error) for index, _, error in samples if error is not None]
+    pixels = np.stack([p for _, p in ok]) if ok else None
+    return [index for index, _ in ok], pixels, failed
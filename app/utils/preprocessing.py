@@ -1,48 +1,131 @@
 from PIL import Image
 
-from io import BytesIO
+import numpy as np
 
-# Optional torchvision import (for future ML model)
-try:
-    import torchvision.transforms as T
-    TORCHVISION_AVAILABLE = True
-except ImportError:
-    TORCHVISION_AVAILABLE = False
-    T = None
+from .uploads import BufferReader, UploadTooLargeError
+
+from ..config import MAX_IMAGE_PIXELS
+
+from ..metrics import STAGE_SECONDS
+
+
+
+# Pillow's own bomb check (warning above the limit, error above twice it) follows ours
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS or None
+
+
+
+class ImageDecodeError(ValueError):
+    """The bytes are not an image Pillow can decode (unknown format, truncated or corrupt)"""
+
+
+
+# Model input size and ImageNet normalization stats
+
+MODEL_INPUT_SIZE = (224, 224)
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+# (x / 255 - mean) / std folded into a single multiply-subtract on the uint8 pixels
+_SCALE = np.array([1.0 / (255.0 * s) for s in IMAGENET_STD], dtype=np.float32).reshape(3, 1, 1)
+_SHIFT = np.array([m / s for m, s in zip(IMAGENET_MEAN, IMAGENET_STD)], dtype=np.float32).reshape(3, 1, 1)
 
 
 
 # Basic preprocessing to prepare input for a CNN
 
-def load_image_from_bytes(image_bytes: bytes):
+@STAGE_SECONDS.time(stage="decode")
+def load_image_from_bytes(image_bytes: bytes, target_size=None, max_pixels=MAX_IMAGE_PIXELS):
+
+    """
+    Decode image bytes to an RGB PIL image
+
+    Args:
+        image_bytes: Encoded image; bytes or any buffer such as a memoryview
+            or the mmap of a spooled upload, read in place without copying
+        target_size: Optional (width, height). JPEGs are then DCT-downscaled
+            while decoding (PIL draft mode) to the smallest size that is still
+            at least target_size, instead of materializing every pixel of a
+            20+ MP drone still. Use None when the full-resolution image is
+            needed, e.g. for the heatmap overlay.
+        max_pixels: Reject images whose header declares more pixels than
+            this, before decoding them (0 = unlimited)
+
+    Raises:
+        UploadTooLargeError: the image exceeds max_pixels
+        ImageDecodeError: the bytes could not be decoded
+    """
+
+    try:
+        image = Image.open(BufferReader(image_bytes))
+    except Image.DecompressionBombError as e:
+        raise UploadTooLargeError(str(e)) from e
+    except Exception as e:
+        raise ImageDecodeError(str(e)) from e
+
+    # Only the header has been read so far; refuse decompression bombs here
+    if max_pixels and image.width * image.height > max_pixels:
+        raise UploadTooLargeError(
+            f"Image is {image.width}x{image.height} pixels; the limit is {max_pixels}"
+        )
+
+    try:
+        if target_size is not None:
+            image.draft("RGB", target_size)
+
+        if image.mode == "RGB":
+            # convert() to the same mode would copy every pixel
+            image.load()
+            return image
+
+        return image.convert("RGB")
+    except Exception as e:
+        raise ImageDecodeError(str(e)) from e
+
+
+
+def _resize_for_model(pil_image: Image.Image):
+
+    if pil_image.size == MODEL_INPUT_SIZE:
+        return pil_image
+
+    # reducing_gap box-reduces large images by an integer factor before the
+    # final bilinear resample, which is much cheaper on multi-megapixel input
+    return pil_image.resize(MODEL_INPUT_SIZE, Image.BILINEAR, reducing_gap=2.0)
+
+
+
+def model_pixels(pil_image: Image.Image):
+
+    """Image resized to the model input, as a (224, 224, 3) uint8 array (cheap to pass between processes)"""
+
+    return np.asarray(_resize_for_model(pil_image), dtype=np.uint8)
+
+
+
+def normalize_batch(pixels):
+
+    """(N, 224, 224, 3) uint8 array -> normalized (N, 3, 224, 224) float tensor"""
+
+    import torch  # deferred: the API imports this module before the model is loaded
+
+    tensor = torch.from_numpy(pixels).permute(0, 3, 1, 2).float()
 
-    return Image.open(BytesIO(image_bytes)).convert("RGB")
+    return tensor.mul_(torch.from_numpy(_SCALE)).sub_(torch.from_numpy(_SHIFT)).contiguous()
 
 
 
-# Torch transforms (lazy initialization)
+@STAGE_SECONDS.time(stage="preprocess")
+def preprocess_batch(pil_images):
 
-_transform = None
+    """Resize and normalize a list of PIL images into one (N, 3, 224, 224) float tensor"""
 
-def _get_transform():
-    """Get or create the transform, only when needed"""
-    global _transform
-    if _transform is None:
-        if not TORCHVISION_AVAILABLE:
-            raise ImportError("torchvision is required for model preprocessing. Install with: pip install torch torchvision")
-        _transform = T.Compose([
-            T.Resize((224, 224)),
-            T.ToTensor(),
-            T.Normalize(
-                mean=[0.485, 0.456, 0.406], 
-                std=[0.229, 0.224, 0.225]
-            )
-        ])
-    return _transform
+    return normalize_batch(np.stack([model_pixels(img) for img in pil_images]))
 
 
 
 def preprocess_for_model(pil_image: Image.Image):
 
-    transform = _get_transform()
-    return transform(pil_image).unsqueeze(0)  # add batch dimension
+    return preprocess_batch([pil_image])  # (1, 3, 224, 224)
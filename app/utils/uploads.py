@@ -0,0 +1,88 @@
+"""
+Copy-free access to uploaded image bytes
+
+The multipart parser spools each upload into a temporary file, in memory up
+to 1 MB and on disk beyond that. Reading it with UploadFile.read() copied the
+whole body into a bytes object, and decoding wrapped that in a BytesIO
+holding yet another copy. Here a large upload is memory-mapped read-only
+instead: hashing, decoding and archive extraction all work on the mapped
+temp file, so a 50 MB drone still costs page cache rather than 100+ MB of
+private memory per concurrent request.
+"""
+import io
+import mmap
+import os
+
+
+class UploadTooLargeError(ValueError):
+    """An upload or image exceeds the configured size limits"""
+
+
+class BufferReader(io.RawIOBase):
+    """Read-only, seekable file over a buffer (bytes, memoryview or mmap) that does not copy it"""
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer).cast("B")
+        self._size = len(self._view)
+        self._pos = 0
+
+    def __repr__(self):
+        # Shows up in decode errors, e.g. PIL's "cannot identify image file ..."
+        return f"<{self._size}-byte buffer>"
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        # Release the buffer export so an underlying mmap can be closed
+        self._view.release()
+        super().close()
+
+
+def upload_buffer(file, max_bytes=0):
+    """
+    Uploaded bytes without copying them out of the spooled upload file
+
+    Args:
+        file: The upload's file object (UploadFile.file)
+        max_bytes: Raise UploadTooLargeError above this size (0 = unlimited)
+
+    Returns:
+        A read-only mmap of the temp file when the upload was spooled to disk,
+        else the (at most spool-sized) bytes. Either supports the buffer
+        protocol, so it can be hashed or wrapped in a BufferReader directly.
+    """
+    size = file.seek(0, os.SEEK_END)
+    file.seek(0)
+    if max_bytes and size > max_bytes:
+        raise UploadTooLargeError(f"Upload is {size} bytes; the limit is {max_bytes}")
+    # Same check Starlette's UploadFile uses: SpooledTemporaryFile._rolled
+    if size and getattr(file, "_rolled", True):
+        try:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, AttributeError):
+            pass  # not backed by a real file
+    return file.read()
@@ -1,23 +1,161 @@
 from PIL import Image, ImageDraw
 import os
-import torch
-import torch.nn.functional as F
 import numpy as np
 import cv2
 
-def create_dummy_heatmap(pil_image, output_path):
-    """Fallback dummy heatmap when model not available"""
+from ..metrics import STAGE_SECONDS
+
+# torch is imported inside the functions that need it, so importing the API
+# (and the rendering helpers) does not pay for loading torch
+
+def draw_dummy_overlay(pil_image):
+    """Red circle placeholder overlay, returned as a new PIL image"""
     img = pil_image.copy()
     draw = ImageDraw.Draw(img)
     w, h = img.size
     radius = min(w, h) // 4
     bbox = (w//2 - radius, h//2 - radius, w//2 + radius, h//2 + radius)
     draw.ellipse(bbox, outline="red", width=10)
-    os.makedirs("results", exist_ok=True)
+    return img
+
+
+def create_dummy_heatmap(pil_image, output_path):
+    """Fallback dummy heatmap when model not available"""
+    img = draw_dummy_overlay(pil_image)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
     img.save(output_path)
     return output_path
 
 
+def _layer4_features(model, tensor):
+    """ResNet50 forward up to (and including) layer4"""
+    x = model.conv1(tensor)
+    x = model.bn1(x)
+    x = model.relu(x)
+    x = model.maxpool(x)
+    x = model.layer1(x)
+    x = model.layer2(x)
+    x = model.layer3(x)
+    return model.layer4(x)
+
+
+def explain_and_classify(model, tensor, target_class_idx=None, features_fn=None):
+    """
+    Classify a batch and compute its Grad-CAM maps from a single forward pass
+
+    The backbone runs once without gradients; only the avgpool/fc head is
+    re-run with autograd to get d(logit)/d(layer4), so explanation costs a
+    tiny backward instead of a second full forward + backward.
+
+    Args:
+        model: ResNet50 in eval mode
+        tensor: Preprocessed input tensor (N, C, H, W)
+        target_class_idx: Class index to explain (None = predicted class per image)
+        features_fn: Optional optimized backbone returning layer4 activations
+            (see app/backends.py); defaults to the model's own layers
+
+    Returns:
+        (probs, cams): softmax probabilities (N, num_classes) and low-res
+        CAMs as a float32 numpy array (N, 7, 7), not yet normalized
+    """
+    import torch
+
+    device = next(model.parameters()).device
+    tensor = tensor.to(device)
+
+    with torch.no_grad(), STAGE_SECONDS.time(stage="gradcam_forward"):
+        acts = features_fn(tensor) if features_fn is not None else _layer4_features(model, tensor)
+
+    with torch.enable_grad(), STAGE_SECONDS.time(stage="gradcam_backward"):
+        acts = acts.detach().requires_grad_()
+        logits = model.fc(torch.flatten(model.avgpool(acts), 1))
+
+        if target_class_idx is None:
+            targets = logits.argmax(dim=1)
+        else:
+            targets = torch.full((logits.shape[0],), int(target_class_idx), device=device)
+
+        # Samples are independent, so one backward of the summed targets gives
+        # each image its own gradient. autograd.grad leaves parameter .grad untouched.
+        selected = logits.gather(1, targets.unsqueeze(1)).sum()
+        grads, = torch.autograd.grad(selected, acts)
+
+        # Global average pooling of gradients, weighted combination of activation maps
+        weights = torch.mean(grads, dim=(2, 3), keepdim=True)
+        cams = torch.relu(torch.sum(weights * acts.detach(), dim=1))
+        probs = torch.softmax(logits.detach(), dim=1)
+    return probs.cpu(), cams.cpu().numpy().astype(np.float32)
+
+
+def compact_cam(cam, dtype="uint8", size=0):
+    """
+    Low-res CAM in a compact array for storage or transfer
+
+    Args:
+        cam: 2D numpy array (e.g. the 7x7 layer4 CAM)
+        dtype: "uint8" (min-max normalized to 0-255) or "float16" (raw values)
+        size: Upsample to size x size first (0 = keep the CAM's own grid)
+    """
+    cam = np.asarray(cam, dtype=np.float32)
+    if size and cam.shape != (size, size):
+        cam = cv2.resize(cam, (size, size), interpolation=cv2.INTER_LINEAR)
+    if dtype == "float16":
+        return cam.astype(np.float16)
+    cam = (cam - cam.min()) / (cam.max() - cam.min() + 1e-8)
+    return np.uint8(np.round(255 * cam))
+
+
+@STAGE_SECONDS.time(stage="colormap")
+def colorize_cam(cam, width, height):
+    """
+    Upsample a low-res CAM to width x height and apply the JET colormap
+
+    Returns an RGB uint8 numpy array (height, width, 3). Accepts float CAMs
+    or compact uint8/float16 ones (see compact_cam).
+    """
+    cam = cv2.resize(np.asarray(cam, dtype=np.float32), (width, height),
+                     interpolation=cv2.INTER_LINEAR)
+
+    # Normalize to 0-1
+    cam = (cam - cam.min()) / (cam.max() - cam.min() + 1e-8)
+
+    # Convert to heatmap colormap
+    cam_uint8 = np.uint8(255 * cam)
+    heatmap = cv2.applyColorMap(cam_uint8, cv2.COLORMAP_JET)
+    return cv2.cvtColor(heatmap, cv2.COLOR_BGR2RGB)
+
+
+@STAGE_SECONDS.time(stage="overlay")
+def blend_cam_overlay(cam, pil_image, alpha=0.4):
+    """
+    Upsample a low-res CAM to the image size, colorize it and blend it over the image
+
+    Args:
+        cam: 2D numpy array (e.g. the 7x7 layer4 CAM)
+        pil_image: Original PIL image for overlay
+        alpha: Heatmap transparency factor
+
+    Returns:
+        Blended PIL image
+    """
+    img_np = np.array(pil_image)
+    if img_np.ndim == 3 and img_np.shape[2] == 4:  # RGBA
+        img_np = img_np[:, :, :3]  # Remove alpha
+
+    heatmap = colorize_cam(cam, img_np.shape[1], img_np.shape[0])
+
+    # Blend heatmap with original image
+    blended = (alpha * heatmap + (1 - alpha) * img_np).astype(np.uint8)
+    return Image.fromarray(blended)
+
+
+def render_cam_overlay(cam, pil_image, output_path, alpha=0.4):
+    """Blend a low-res CAM over the image (see blend_cam_overlay) and save it"""
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    blend_cam_overlay(cam, pil_image, alpha=alpha).save(output_path)
+    return output_path
+
+
 def create_gradcam_heatmap(model, tensor, pil_image, output_path, target_class_idx=None):
     """
     Create Grad-CAM heatmap visualization
@@ -33,97 +171,8 @@ def create_gradcam_heatmap(model, tensor, pil_image, output_path, target_class_i
         return create_dummy_heatmap(pil_image, output_path)
     
     try:
-        device = next(model.parameters()).device
-        tensor = tensor.to(device)
-        
-        # Register hooks for activations and gradients
-        activations = {}
-        gradients = {}
-        
-        def forward_hook(module, input, output):
-            activations['layer4'] = output
-        
-        def backward_hook(module, grad_input, grad_output):
-            if grad_output[0] is not None:
-                gradients['layer4'] = grad_output[0]
-        
-        # Use layer4 (last conv block) for ResNet50
-        target_layer = model.layer4
-        handle_forward = target_layer.register_forward_hook(forward_hook)
-        try:
-            handle_backward = target_layer.register_full_backward_hook(backward_hook)
-        except:
-            # Fallback for older PyTorch versions
-            handle_backward = target_layer.register_backward_hook(backward_hook)
-        
-        # Forward pass (need gradients enabled)
-        model.eval()
-        tensor.requires_grad_()
-        output = model(tensor)
-        
-        # Get target class (predicted if not specified)
-        if target_class_idx is None:
-            target_class_idx = output.argmax(dim=1).item()
-        
-        # Backward pass
-        model.zero_grad()
-        target = output[0, target_class_idx]
-        target.backward()
-        
-        # Get gradients and activations
-        if 'layer4' not in gradients or 'layer4' not in activations:
-            # Fallback if hooks didn't capture properly
-            return create_dummy_heatmap(pil_image, output_path)
-        
-        grads = gradients['layer4']
-        acts = activations['layer4']
-        
-        if grads is None or acts is None:
-            return create_dummy_heatmap(pil_image, output_path)
-        
-        # Global average pooling of gradients
-        weights = torch.mean(grads, dim=(2, 3), keepdim=True)
-        
-        # Weighted combination of activation maps
-        cam = torch.sum(weights * acts, dim=1, keepdim=True)
-        cam = F.relu(cam)  # Apply ReLU
-        cam = F.interpolate(cam, size=(pil_image.size[1], pil_image.size[0]), mode='bilinear', align_corners=False)
-        cam = cam.squeeze().cpu().detach().numpy()
-        
-        # Normalize to 0-1
-        cam = (cam - cam.min()) / (cam.max() - cam.min() + 1e-8)
-        
-        # Convert to heatmap colormap
-        cam_uint8 = np.uint8(255 * cam)
-        heatmap = cv2.applyColorMap(cam_uint8, cv2.COLORMAP_JET)
-        heatmap = cv2.cvtColor(heatmap, cv2.COLOR_BGR2RGB)
-        
-        # Convert PIL to numpy for blending
-        img_np = np.array(pil_image)
-        if img_np.shape[2] == 4:  # RGBA
-            img_np = img_np[:, :, :3]  # Remove alpha
-        
-        # Resize heatmap to match image
-        if heatmap.shape[:2] != img_np.shape[:2]:
-            heatmap = cv2.resize(heatmap, (img_np.shape[1], img_np.shape[0]))
-        
-        # Blend heatmap with original image
-        alpha = 0.4  # Transparency factor
-        blended = (alpha * heatmap + (1 - alpha) * img_np).astype(np.uint8)
-        
-        # Remove hooks
-        try:
-            handle_forward.remove()
-            handle_backward.remove()
-        except:
-            pass
-        
-        # Save result
-        os.makedirs("results", exist_ok=True)
-        result_img = Image.fromarray(blended)
-        result_img.save(output_path)
-        
-        return output_path
+        _, cams = explain_and_classify(model, tensor, target_class_idx=target_class_idx)
+        return render_cam_overlay(cams[0], pil_image, output_path)
     except Exception as e:
         # Fallback to dummy heatmap on any error
         print(f"Grad-CAM failed (falling back to dummy): {e}")
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Benchmark the inference and API hot paths
+
+Synthetic drone-like images (smooth gradients plus sensor noise, JPEG
+encoded) at several resolutions are run through:
+
+    preprocess  load_image_from_bytes (draft decode) and preprocess_for_model
+    predict     ModelLoader.predict_batch at several batch sizes
+    explain     ModelLoader.predict_and_explain_batch (fused Grad-CAM) at several batch sizes
+    gradcam     create_gradcam_heatmap (CAM + overlay + PNG save) per resolution
+    api         POST /analyze-blade end to end through an in-process ASGI client,
+                at several concurrency levels
+
+Each case reports p50/p95/p99 latency, images/sec and peak RSS. Results are
+written as JSON together with the commit, library versions and thread
+count, so runs can be compared across commits:
+
+    python benchmark.py                                  # everything
+    python benchmark.py --quick --suites preprocess predict
+    python benchmark.py --compare results/benchmarks/benchmark_abc1234_20240601-120000.json
+
+Without models/blade_resnet50.pth, a randomly initialized ResNet50 is
+benchmarked instead (weights do not affect speed). The result cache is
+disabled so repeated images are fully processed every time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+RESOLUTIONS = {
+    "vga": (640, 480),
+    "1080p": (1920, 1080),
+    "20mp": (5472, 3648),
+}
+SUITES = ("preprocess", "predict", "explain", "gradcam", "api")
+DEFAULT_CHECKPOINT = os.path.join("models", "blade_resnet50.pth")
+
+
+def synthetic_image(width, height, seed=0, quality=90):
+    """JPEG bytes of a blade-photo-like image; compresses like a photo, unlike pure noise"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0.0, 1.0, width, dtype=np.float32)[None, :, None]
+    y = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None, None]
+    tint = np.array([0.55, 0.7, 0.9], dtype=np.float32)  # sky blue
+    base = 255 * tint * (0.6 + 0.3 * x + 0.1 * y)
+    pixels = np.clip(base + rng.normal(0, 6, (height, width, 3)).astype(np.float32), 0, 255).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def reset_peak_rss():
+    """Start a new peak-RSS window (Linux; elsewhere the peak is process-wide)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(latencies, images, wall_seconds):
+    ms = np.asarray(latencies) * 1000
+    return {
+        "iterations": len(latencies),
+        "images": images,
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "images_per_sec": round(images / wall_seconds, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def measure(fn, iterations, warmup, images_per_call=1):
+    """Time fn() sequentially after warm-up calls"""
+    for _ in range(warmup):
+        fn()
+    reset_peak_rss()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, iterations * images_per_call, time.perf_counter() - start)
+
+
+def bench_preprocess(args, images):
+    from app.utils.preprocessing import load_image_from_bytes, preprocess_for_model, MODEL_INPUT_SIZE
+
+    results = {}
+    for name, data in images.items():
+        results[f"decode_draft/{name}"] = measure(
+            lambda: load_image_from_bytes(data, target_size=MODEL_INPUT_SIZE), args.iterations, args.warmup
+        )
+        decoded = load_image_from_bytes(data)
+        results[f"preprocess_for_model/{name}"] = measure(
+            lambda: preprocess_for_model(decoded), args.iterations, args.warmup
+        )
+    return results
+
+
+def _batches(args):
+    import torch
+    torch.manual_seed(0)
+    return {size: torch.randn(size, 3, 224, 224) for size in args.batch_sizes}
+
+
+def bench_predict(args, loader):
+    return {
+        f"predict_batch/bs{size}": measure(lambda: loader.predict_batch(batch), args.iterations, args.warmup, size)
+        for size, batch in _batches(args).items()
+    }
+
+
+def bench_explain(args, loader):
+    return {
+        f"predict_and_explain_batch/bs{size}": measure(
+            lambda: loader.predict_and_explain_batch(batch), args.iterations, args.warmup, size
+        )
+        for size, batch in _batches(args).items()
+    }
+
+
+def bench_gradcam(args, loader, images, output_dir):
+    from app.utils.preprocessing import load_image_from_bytes, preprocess_for_model
+    from app.utils.visualization import create_gradcam_heatmap
+
+    results = {}
+    output_path = os.path.join(output_dir, "gradcam_bench.png")
+    for name, data in images.items():
+        pil_image = load_image_from_bytes(data)
+        tensor = preprocess_for_model(pil_image)
+        results[f"create_gradcam_heatmap/{name}"] = measure(
+            lambda: create_gradcam_heatmap(loader.model, tensor, pil_image, output_path),
+            args.iterations, args.warmup,
+        )
+    return results
+
+
+async def _api_case(client, data, concurrency, requests, heatmap_mode):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(
+                "/analyze-blade",
+                files={"file": ("blade.jpg", data, "image/jpeg")},
+                data={"blade_type": "TPI", "heatmap_mode": heatmap_mode},
+            )
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+    await asyncio.gather(*(one() for _ in range(concurrency)))  # warm-up
+    reset_peak_rss()
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one() for _ in range(requests)))
+    return summarize(latencies, requests, time.perf_counter() - start)
+
+
+async def _bench_api(args, images):
+    import httpx
+    from app.main import app
+    from app.model_registry import model_registry
+    from app.config import MODEL_WARMUP
+
+    results = {}
+    # Run the app's own lifespan (background warm-up, heatmap writer shutdown)
+    async with app.router.lifespan_context(app):
+        if not MODEL_WARMUP:
+            model_registry.warm_up()
+        while not model_registry.status()["ready"]:
+            if "error" in model_registry.status():
+                raise RuntimeError(f"Model warm-up failed: {model_registry.status()['error']}")
+            await asyncio.sleep(0.1)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=300) as client:
+            for name in args.api_resolutions:
+                for concurrency in args.concurrency:
+                    results[f"analyze_blade/{args.heatmap_mode}/{name}/c{concurrency}"] = await _api_case(
+                        client, images[name], concurrency, args.requests, args.heatmap_mode
+                    )
+    return results
+
+
+def bench_api(args, images):
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        print("Skipping api suite: pip install httpx")
+        return {}
+    return asyncio.run(_bench_api(args, images))
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _prepare_checkpoint(path, workdir):
+    """Checkpoint to benchmark; a random-weight ResNet50 when none has been trained"""
+    if os.path.exists(path):
+        return path, False
+    import torch
+    from torchvision import models
+
+    print(f"No checkpoint at {path}; benchmarking a randomly initialized ResNet50")
+    model = models.resnet50(weights=None, num_classes=3)
+    path = os.path.join(workdir, "random_resnet50.pth")
+    torch.save({"model_state_dict": model.state_dict(), "class_names": ["healthy", "minor_damage", "severe_damage"]}, path)
+    return path, True
+
+
+def _configure_environment(checkpoint, backend, workdir):
+    """Settings the app reads at import time; must run before any app module is imported"""
+    os.environ["BLADEGUARD_RESULT_CACHE_ENTRIES"] = "0"
+    os.environ["BLADEGUARD_RESULT_CACHE_DIR"] = ""
+    os.environ["BLADEGUARD_HEATMAP_DIR"] = os.path.join(workdir, "heatmaps")
+    if backend:
+        os.environ["BLADEGUARD_INFERENCE_BACKEND"] = backend
+    # Serve exactly the benchmarked checkpoint through the API
+    manifest = os.path.join(workdir, "registry.json")
+    with open(manifest, "w") as f:
+        json.dump({"models": {"bench": {"versions": {"v1": os.path.abspath(checkpoint)}}}}, f)
+    os.environ["BLADEGUARD_MODEL_REGISTRY"] = manifest
+
+
+def compare(current, baseline_path):
+    """Print the change of p50/p95 latency and throughput against an earlier run"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nvs {baseline['meta']['commit']} ({baseline_path}):")
+    for case, stats in current["results"].items():
+        old = baseline["results"].get(case)
+        if old is None:
+            continue
+        changes = [
+            f"{key} {100 * (stats[key] - old[key]) / old[key]:+.1f}%"
+            for key in ("p50_ms", "p95_ms", "images_per_sec")
+            if old.get(key)
+        ]
+        print(f"  {case:55s} " + "  ".join(changes))
+
+
+def print_table(results):
+    print(f"\n{'case':55s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'img/s':>9s} {'peak MB':>9s}")
+    for case, s in results.items():
+        print(f"{case:55s} {s['p50_ms']:9.2f} {s['p95_ms']:9.2f} {s['p99_ms']:9.2f} {s['images_per_sec']:9.2f} {s['peak_rss_mb']:9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BladeGuard inference and API hot paths")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--backend", default=None, help="Inference backend (default: BLADEGUARD_INFERENCE_BACKEND)")
+    parser.add_argument("--resolutions", nargs="+", choices=RESOLUTIONS, default=list(RESOLUTIONS))
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4, 8, 16])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--api-resolutions", nargs="+", choices=RESOLUTIONS, default=["1080p", "20mp"])
+    parser.add_argument("--heatmap-mode", default="eager", choices=["eager", "lazy", "cam"])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=64, help="Requests per api case")
+    parser.add_argument("--quick", action="store_true", help="Small smoke run (fewer iterations, sizes and levels)")
+    parser.add_argument("--output", default=None, help="JSON path (default: results/benchmarks/benchmark_<commit>_<time>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier benchmark JSON to compare against")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.iterations, args.warmup, args.requests = 5, 1, 8
+        args.resolutions = [r for r in args.resolutions if r != "20mp"] or ["vga"]
+        args.api_resolutions = ["1080p"]
+        args.batch_sizes = [1, 4]
+        args.concurrency = [1, 4]
+
+    workdir = tempfile.mkdtemp(prefix="bladeguard-bench-")
+    checkpoint, random_weights = _prepare_checkpoint(args.checkpoint, workdir)
+    _configure_environment(checkpoint, args.backend, workdir)
+
+    import torch
+    from app.model_loader import create_model_loader
+
+    names = sorted(set(args.resolutions) | (set(args.api_resolutions) if "api" in args.suites else set()),
+                   key=list(RESOLUTIONS).index)
+    images = {name: synthetic_image(*RESOLUTIONS[name], seed=i) for i, name in enumerate(names)}
+    sized = {name: images[name] for name in args.resolutions}
+
+    loader = None
+    if {"predict", "explain", "gradcam"} & set(args.suites):
+        loader = create_model_loader(backend=args.backend, model_path=checkpoint)
+
+    results = {}
+    for suite in args.suites:
+        print(f"Running {suite}...")
+        if suite == "preprocess":
+            results.update(bench_preprocess(args, sized))
+        elif suite == "predict":
+            results.update(bench_predict(args, loader))
+        elif suite == "explain":
+            results.update(bench_explain(args, loader))
+        elif suite == "gradcam":
+            results.update(bench_gradcam(args, loader, sized, workdir))
+        elif suite == "api":
+            results.update(bench_api(args, images))
+
+    commit = _git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "torch_threads": torch.get_num_threads(),
+            "backend": loader.backend if loader is not None else (args.backend or os.environ.get("BLADEGUARD_INFERENCE_BACKEND", "eager")),
+            "checkpoint": "random" if random_weights else checkpoint,
+            "resolutions": {name: RESOLUTIONS[name] for name in names},
+            "image_bytes": {name: len(data) for name, data in images.items()},
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "results": results,
+    }
+
+    output = args.output or os.path.join(
+        "results", "benchmarks", f"benchmark_{commit}_{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(results)
+    print(f"\nSaved {output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
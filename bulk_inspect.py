@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Offline bulk inspection: score whole directories of blade images without HTTP
+
+Images are decoded in parallel DataLoader workers (JPEG draft decode near
+224x224), run through the model in large batches, and turned into actions
+with the same decide_action rules as the API. One row per image is written
+to CSV, JSONL or Parquet.
+
+With --heatmaps, Grad-CAM overlays are rendered and saved only for images
+that are not predicted healthy. The CAM itself comes from the fused
+forward pass (a head-only backward, ~1% of the forward), so the costly part,
+full-resolution decode plus overlay and encode, is skipped for healthy frames.
+
+Progress is appended batch by batch; --resume skips images already in the
+output, so an interrupted sweep continues where it stopped.
+
+Usage:
+    python bulk_inspect.py flights/2024-06-T07 --output T07.csv --blade-type TPI
+    python bulk_inspect.py flights/ --output fleet.parquet --heatmaps results/fleet --workers 8 --batch-size 64
+    python bulk_inspect.py flights/ --output fleet.parquet --resume
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+
+from app.model_loader import create_model_loader, MODEL_PATH
+from app.decisions import decide_action
+from app.heatmap_writer import HeatmapWriter, HEATMAP_FORMATS
+from app.utils.archives import IMAGE_EXTENSIONS
+from app.utils.image_files import ImageFileDataset, collate
+from app.utils.preprocessing import load_image_from_bytes, normalize_batch
+from app.utils.visualization import blend_cam_overlay
+from app.config import HEATMAP_MAX_SIDE, HEATMAP_QUALITY
+
+FIELDS = [
+    "path",
+    "blade_type",
+    "severity",
+    "confidence",
+    "recommended_action",
+    "needs_shutdown",
+    "needs_investigation",
+    "action_reason",
+    "heatmap_path",
+    "model",
+    "error",
+]
+FORMATS = ("csv", "jsonl", "parquet")
+
+# Overlays are drawn at heatmap preview size, so flagged JPEGs needn't be decoded beyond it
+OVERLAY_DECODE_SIZE = (HEATMAP_MAX_SIDE, HEATMAP_MAX_SIDE) if HEATMAP_MAX_SIDE > 0 else None
+
+
+def find_images(inputs, recursive=True):
+    """Image files under the given files/directories, in a stable (sorted) order"""
+    paths = []
+    for root in inputs:
+        if os.path.isfile(root):
+            paths.append(root)
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            if not recursive:
+                dirnames.clear()
+            paths.extend(
+                os.path.join(dirpath, name) for name in sorted(filenames)
+                if name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith(".")
+            )
+    return paths
+
+
+def _truncate_partial_line(path):
+    """Drop a half-written last line left by an interrupted run"""
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+class JsonlSink:
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.done = set()
+        if resume and os.path.exists(path):
+            _truncate_partial_line(path)
+            with open(path) as f:
+                self.done = {json.loads(line)["path"] for line in f if line.strip()}
+        self._file = open(path, "a" if resume else "w")
+
+    def write(self, rows):
+        for row in rows:
+            self._file.write(json.dumps(row) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class CsvSink:
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.done = set()
+        exists = resume and os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            _truncate_partial_line(path)
+            with open(path, newline="") as f:
+                self.done = {row["path"] for row in csv.DictReader(f)}
+        self._file = open(path, "a" if exists else "w", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=FIELDS)
+        if not exists:
+            self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink:
+    """
+    Parquet cannot be appended to, so rows go to a JSONL journal next to the
+    output and the Parquet file is (re)written from it on close
+    """
+
+    def __init__(self, path, resume=False):
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self.journal_path = f"{path}.partial.jsonl"
+        journal_exists = resume and os.path.exists(self.journal_path)
+        self._journal = JsonlSink(self.journal_path, resume=resume)
+        if resume and os.path.exists(path) and not journal_exists:
+            # Completed earlier run: carry its rows over into the new journal
+            rows = pq.read_table(path).to_pylist()
+            self._journal.write(rows)
+            self._journal.done = {row["path"] for row in rows}
+        self.done = self._journal.done
+
+    def write(self, rows):
+        self._journal.write(rows)
+
+    def close(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._journal.close()
+        with open(self.journal_path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        schema = pa.schema([
+            ("path", pa.string()),
+            ("blade_type", pa.string()),
+            ("severity", pa.string()),
+            ("confidence", pa.float32()),
+            ("recommended_action", pa.string()),
+            ("needs_shutdown", pa.bool_()),
+            ("needs_investigation", pa.bool_()),
+            ("action_reason", pa.string()),
+            ("heatmap_path", pa.string()),
+            ("model", pa.string()),
+            ("error", pa.string()),
+        ])
+        tmp_path = f"{self.path}.tmp"
+        pq.write_table(pa.Table.from_pylist(rows, schema=schema), tmp_path)
+        os.replace(tmp_path, self.path)
+        os.remove(self.journal_path)
+
+
+SINKS = {"csv": CsvSink, "jsonl": JsonlSink, "parquet": ParquetSink}
+
+
+def heatmap_name(path, root, extension):
+    """
+    Flat, deterministic heatmap filename for an image path, relative to the input root
+
+    The readable part drops the extension and flattens directories, so a
+    short hash of the relative path keeps IMG_1.jpg / IMG_1.png and
+    a/b.jpg / a__b.jpg from overwriting each other's heatmaps.
+    """
+    relative = os.path.relpath(os.path.abspath(path), root)
+    stem = os.path.splitext(relative)[0].replace(os.sep, "__")
+    digest = hashlib.sha256(relative.replace(os.sep, "/").encode()).hexdigest()[:8]
+    return f"{stem}-{digest}.{extension}"
+
+
+def _row(path, blade_type, model_id, severity=None, confidence=None, heatmap_path=None, error=None):
+    row = dict.fromkeys(FIELDS)
+    row.update(path=path, blade_type=blade_type, model=model_id, error=error)
+    if error is None:
+        confidence = round(float(confidence), 4)
+        row.update(
+            severity=severity,
+            confidence=confidence,
+            heatmap_path=heatmap_path,
+            **decide_action(blade_type, severity, round(confidence, 2)),
+        )
+    return row
+
+
+def run(args):
+    from torch.utils.data import DataLoader
+
+    paths = find_images(args.inputs, recursive=not args.no_recursive)
+    sink = SINKS[args.format](args.output, resume=args.resume)
+    todo = [p for p in paths if p not in sink.done]
+    print(f"{len(paths)} images found, {len(paths) - len(todo)} already scored, {len(todo)} to go")
+
+    loader = create_model_loader(backend=args.backend, model_path=args.checkpoint)
+    model_id = loader.checkpoint_id
+    writer = None
+    root = os.path.commonpath([os.path.abspath(p) for p in args.inputs])
+    if os.path.isfile(root):
+        root = os.path.dirname(root)
+    if args.heatmaps:
+        writer = HeatmapWriter(
+            args.heatmaps, image_format=args.heatmap_format, quality=HEATMAP_QUALITY,
+            max_side=HEATMAP_MAX_SIDE, prune_interval_seconds=0,
+        )
+
+    batches = DataLoader(
+        ImageFileDataset(todo),
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+        collate_fn=collate,
+        prefetch_factor=args.prefetch if args.workers > 0 else None,
+        persistent_workers=False,
+    )
+
+    actions = Counter()
+    # Rows are written only once their heatmaps are on disk, so a resumed run never
+    # skips an image whose heatmap was lost
+    waiting = []
+    scored = 0
+    start = time.perf_counter()
+
+    def drain(block=False):
+        while waiting and (block or not any(writer.is_pending(p) for p in waiting[0][1])):
+            rows, heatmap_paths = waiting.pop(0)
+            if block and writer is not None:
+                for p in heatmap_paths:
+                    writer.wait(p)
+            sink.write(rows)
+
+    try:
+        for batch_number, (indices, pixels, failed) in enumerate(batches, 1):
+            rows, heatmap_paths = [], []
+            for index, error in failed:
+                rows.append(_row(todo[index], args.blade_type, model_id, error=error))
+            if indices:
+                tensor = normalize_batch(pixels)
+                if writer is not None:
+                    predictions = loader.predict_and_explain_batch(tensor)
+                else:
+                    predictions = [(label, conf, None) for label, conf in loader.predict_batch(tensor)]
+                for index, (severity, confidence, cam) in zip(indices, predictions):
+                    path = todo[index]
+                    heatmap_path = None
+                    if writer is not None and severity != "healthy" and cam is not None:
+                        with open(path, "rb") as f:
+                            pil_image = load_image_from_bytes(f.read(), target_size=OVERLAY_DECODE_SIZE)
+                        heatmap_path = writer.submit(
+                            lambda image, cam=cam: blend_cam_overlay(cam, image),
+                            pil_image,
+                            path=os.path.join(args.heatmaps, heatmap_name(path, root, writer.extension)),
+                        )
+                        heatmap_paths.append(heatmap_path)
+                    rows.append(_row(path, args.blade_type, model_id, severity, confidence, heatmap_path))
+            actions.update(row["recommended_action"] or "error" for row in rows)
+            scored += len(rows)
+            if writer is None:
+                sink.write(rows)
+            else:
+                waiting.append((rows, heatmap_paths))
+                drain()
+            if batch_number % args.log_every == 0:
+                rate = scored / (time.perf_counter() - start)
+                print(f"{scored}/{len(todo)} images ({rate:.1f} images/s)")
+        if writer is not None:
+            drain(block=True)
+    finally:
+        if writer is not None:
+            writer.close()
+        sink.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Scored {scored} images in {elapsed:.1f}s ({scored / max(elapsed, 1e-9):.1f} images/s) -> {args.output}")
+    for action, count in actions.most_common():
+        print(f"  {action}: {count}")
+    return actions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Score directories of blade images offline")
+    parser.add_argument("inputs", nargs="+", help="Image files and/or directories (searched recursively)")
+    parser.add_argument("--output", required=True, help="Output file (.csv, .jsonl or .parquet)")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="Default: from the output extension")
+    parser.add_argument("--blade-type", default="UNKNOWN", help='"TPI" or "LM"; selects decide_action thresholds')
+    parser.add_argument("--checkpoint", default=MODEL_PATH, help="Model checkpoint (.pth) or exported ONNX graph (.onnx)")
+    parser.add_argument("--backend", default=None, help="Inference backend (default: BLADEGUARD_INFERENCE_BACKEND)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1), help="Decode worker processes (0 = decode inline)")
+    parser.add_argument("--prefetch", type=int, default=4, help="Batches decoded ahead per worker")
+    parser.add_argument("--heatmaps", default=None, help="Directory for Grad-CAM overlays of non-healthy images")
+    parser.add_argument("--heatmap-format", choices=HEATMAP_FORMATS, default="jpeg")
+    parser.add_argument("--resume", action="store_true", help="Skip images already in --output")
+    parser.add_argument("--no-recursive", action="store_true")
+    parser.add_argument("--log-every", type=int, default=20, help="Progress line every N batches")
+    args = parser.parse_args(argv)
+
+    if args.format is None:
+        extension = os.path.splitext(args.output)[1].lstrip(".").lower()
+        if extension not in FORMATS:
+            parser.error(f"Cannot infer the format from {args.output}; pass --format")
+        args.format = extension
+    if args.format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error("Parquet output needs pyarrow: pip install pyarrow")
+    if not os.path.exists(args.checkpoint):
+        parser.error(f"checkpoint not found at {args.checkpoint}. Train a model first using train_model.py")
+    return args
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -0,0 +1,143 @@
+"""
+Crash-safe training checkpoints: atomic writes, background saving, full resumable state
+
+torch.save straight onto models/blade_resnet50.pth meant a crash mid-write
+left a truncated file that ModelLoader could not read, and only the model
+weights were kept, so an interrupted run had to start over. Here every
+file is written to a temporary name in the same directory, fsynced and
+renamed over the target, so readers see either the old or the new file.
+Saving runs on a background thread from a CPU copy of the state, so a
+snapshot costs training one memory copy, not the disk write.
+
+A training-state checkpoint is also a valid ModelLoader checkpoint (it has
+model_state_dict and class_names), plus what train_model.py needs to
+continue exactly where it stopped: optimizer, LR scheduler, epoch and step
+position, best score and the RNG states.
+"""
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+TRAIN_STATE_FORMAT = "bladeguard-train-state"
+
+TRAIN_STATE_VERSION = 1
+
+
+def atomic_save(obj, path):
+    """torch.save obj to path so that path never holds a partial file"""
+    import torch
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            torch.save(obj, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    # Persist the rename itself
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def snapshot(obj):
+    """
+    Copy of a nested dict/list/tuple of tensors and plain values, detached on the CPU
+
+    Taken on the training thread, so the optimizer can keep updating the live
+    tensors while the copy is written out.
+    """
+    import torch
+
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {key: snapshot(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(value) for value in obj)
+    return obj
+
+
+def capture_rng_state():
+    """
+    Python, NumPy and torch (CPU and CUDA) RNG states
+
+    Kept to tuples, ints and tensors so the checkpoint loads with
+    torch.load(weights_only=True), as ModelLoader loads it.
+    """
+    import torch
+
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    state = {
+        "python": random.getstate(),
+        "numpy": (name, torch.from_numpy(keys.astype(np.int64)), pos, has_gauss, cached_gaussian),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state):
+    import torch
+
+    name, keys, pos, has_gauss, cached_gaussian = state["numpy"]
+    random.setstate(state["python"])
+    np.random.set_state((name, keys.numpy().astype(np.uint32), pos, has_gauss, cached_gaussian))
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+class AsyncCheckpointer:
+    """
+    Writes checkpoints with atomic_save on a background thread
+
+    At most one write is in flight: save() waits for the previous one first,
+    so memory holds at most one extra copy of the state. A failed write is
+    raised from the next save(), wait() or close() rather than lost.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+        self._pending = None
+
+    def save(self, state, path):
+        """Snapshot state now and write it to path in the background"""
+        self.wait()
+        copy = snapshot(state)
+        self._pending = self._executor.submit(atomic_save, copy, path)
+
+    def wait(self):
+        """Block until the write in flight (if any) is on disk"""
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            pending.result()
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown(wait=True)
+
+
+def load_train_state(path):
+    """A training-state checkpoint written by train_model.py; ValueError for plain model checkpoints"""
+    import torch
+
+    state = torch.load(path, map_location="cpu", weights_only=True)
+    if not isinstance(state, dict) or state.get("format") != TRAIN_STATE_FORMAT:
+        raise ValueError(f"{path} is not a training-state checkpoint (only model weights?)")
+    if state.get("version") != TRAIN_STATE_VERSION:
+        raise ValueError(f"{path} has training-state version {state.get('version')}, expected {TRAIN_STATE_VERSION}")
+    return state
@@ -1,23 +1,36 @@
 #!/usr/bin/env python3
 """
 Enhanced model evaluation with confusion matrix visualization
+
+Only images that are new or changed since the last run with the same
+checkpoint are decoded and scored; the rest come from the logit cache in
+data/eval_cache (see evaluation.py).
+
+Usage:
+    python evaluate_model.py                      # evaluate the fp32 model
+    python evaluate_model.py --checkpoint models/candidate.pth
+    python evaluate_model.py --no-cache           # re-score every image
+    python evaluate_model.py --backend static_int8  # accuracy parity vs fp32
+    python evaluate_model.py --backend onnxruntime  # (after python export_onnx.py)
 """
-import torch
-from torchvision import datasets, transforms
-from torch.utils.data import DataLoader
-from app.model_loader import model_loader
-from sklearn.metrics import classification_report, confusion_matrix
+import argparse
+import sys
+from app.model_loader import create_model_loader
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 import os
 
+from evaluation import StreamingMetrics, score_images, softmax
+from training_data import scan_image_folder
+
 DATA_DIR = "data/test"
 
-def plot_confusion_matrix(y_true, y_pred, class_names, save_path="results/confusion_matrix.png"):
+# Per-image logits, keyed by image hash and checkpoint (see evaluation.py)
+CACHE_DIR = os.path.join("data", "eval_cache")
+
+def plot_confusion_matrix(cm, class_names, save_path="results/confusion_matrix.png"):
     """Plot and save confusion matrix"""
-    cm = confusion_matrix(y_true, y_pred)
-    
     plt.figure(figsize=(8, 6))
     sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', 
                 xticklabels=class_names, yticklabels=class_names)
@@ -43,80 +56,166 @@ def plot_class_distribution(class_names, counts, save_path="results/class_distri
     print(f"Class distribution saved to {save_path}")
     plt.close()
 
-if __name__ == "__main__":
-    if model_loader.model is None:
-        print("Error: Model not found. Please train a model first using train_model.py")
-        exit(1)
-
-    if not os.path.exists(DATA_DIR):
-        print(f"Error: Test directory not found at {DATA_DIR}")
-        exit(1)
+def plot_reliability(metrics, save_path="results/reliability.png"):
+    """Plot and save the reliability diagram (accuracy vs confidence per bin)"""
+    confidence, accuracy, counts = metrics.reliability()
+    edges = np.linspace(0, 1, metrics.bins + 1)
+    filled = counts > 0
 
-    test_transforms = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(
-            mean=[0.485, 0.456, 0.406],
-            std=[0.229, 0.224, 0.225],
-        ),
-    ])
+    plt.figure(figsize=(6, 6))
+    plt.bar(edges[:-1][filled], accuracy[filled], width=1 / metrics.bins, align='edge',
+            edgecolor='black', label='Accuracy')
+    plt.plot([0, 1], [0, 1], 'k--', label='Perfect calibration')
+    plt.title(f'Reliability - ECE {metrics.expected_calibration_error():.3f}')
+    plt.xlabel('Confidence')
+    plt.ylabel('Accuracy')
+    plt.legend()
+    plt.tight_layout()
+    os.makedirs("results", exist_ok=True)
+    plt.savefig(save_path, dpi=150)
+    print(f"Reliability diagram saved to {save_path}")
+    plt.close()
 
-    test_dataset = datasets.ImageFolder(DATA_DIR, transform=test_transforms)
-    test_loader = DataLoader(test_dataset, batch_size=16, shuffle=False)
+def collect_logits(loader, paths, cache_dir=CACHE_DIR, batch_size=32, workers=0):
+    """Logits for every path as one (N, classes) array, NaN rows for undecodable images"""
+    logits = np.full((len(paths), len(loader.class_names)), np.nan, dtype=np.float32)
+    for indices, batch, _ in score_images(loader, paths, cache_dir, batch_size, workers):
+        if indices:
+            logits[indices] = batch
+    return logits
 
-    all_labels = []
-    all_preds = []
-    all_probs = []
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
+def evaluate(paths, labels, class_names, checkpoint=None, cache_dir=CACHE_DIR, batch_size=32, workers=0):
+    model_loader = create_model_loader(backend="eager", model_path=checkpoint)
+    if not model_loader.is_loaded:
+        print("Error: Model not found. Please train a model first using train_model.py")
+        exit(1)
 
     print("Evaluating model on test set...")
-    model_loader.model.eval()
-    with torch.no_grad():
-        for inputs, labels in test_loader:
-            inputs = inputs.to(device)
-            outputs = model_loader.model(inputs)
-            probs = torch.softmax(outputs, dim=1)
-            _, preds = torch.max(outputs, 1)
-            all_labels.extend(labels.numpy())
-            all_preds.extend(preds.cpu().numpy())
-            all_probs.extend(probs.cpu().numpy())
-
-    class_names = test_dataset.classes
+    metrics = StreamingMetrics(len(class_names))
+    failed = []
+    for indices, logits, errors in score_images(model_loader, paths, cache_dir, batch_size, workers):
+        if indices:
+            metrics.update(labels[indices], logits)
+        failed.extend(errors)
+    for index, error in failed:
+        print(f"  skipped {paths[index]}: {error}")
     
     print("\n" + "="*50)
     print("MODEL EVALUATION RESULTS")
     print("="*50)
     print(f"\nClasses: {class_names}")
-    print(f"Test set size: {len(all_labels)} images")
+    print(f"Test set size: {metrics.count} images")
     
     # Class distribution
-    unique, counts = np.unique(all_labels, return_counts=True)
-    print(f"\nClass distribution: {dict(zip([class_names[i] for i in unique], counts))}")
-    plot_class_distribution([class_names[i] for i in unique], counts)
+    counts = metrics.confusion.sum(axis=1)
+    print(f"\nClass distribution: {dict(zip(class_names, counts.tolist()))}")
+    plot_class_distribution(class_names, counts)
     
     # Classification report
     print("\nClassification Report:")
-    print(classification_report(all_labels, all_preds, target_names=class_names))
+    print(metrics.report(class_names))
     
     # Confusion matrix
     print("\nConfusion Matrix:")
-    cm = confusion_matrix(all_labels, all_preds)
-    print(cm)
-    plot_confusion_matrix(all_labels, all_preds, class_names)
+    print(metrics.confusion)
+    plot_confusion_matrix(metrics.confusion, class_names)
     
-    # Per-class accuracy
+    # Per-class accuracy (recall)
     print("\nPer-Class Accuracy:")
-    for i, class_name in enumerate(class_names):
-        class_mask = np.array(all_labels) == i
-        if np.sum(class_mask) > 0:
-            class_acc = np.mean(np.array(all_preds)[class_mask] == i)
+    _, recall, _, support = metrics.precision_recall_f1()
+    for class_name, class_acc, n in zip(class_names, recall, support):
+        if n > 0:
             print(f"  {class_name}: {class_acc:.2%}")
     
     # Overall accuracy
-    overall_acc = np.mean(np.array(all_labels) == np.array(all_preds))
-    print(f"\nOverall Accuracy: {overall_acc:.2%}")
+    print(f"\nOverall Accuracy: {metrics.accuracy:.2%}")
+
+    # Calibration: does a 0.9 confidence mean 90% correct?
+    print(f"Expected Calibration Error: {metrics.expected_calibration_error():.4f}")
+    print(f"Log loss: {metrics.log_loss:.4f}")
+    plot_reliability(metrics)
     
     print("\n" + "="*50)
     print("Evaluation complete! Check results/ for visualizations.")
+    return metrics
+
+
+def check_backend_parity(backend, paths, labels, max_accuracy_drop=0.01, min_agreement=0.98, cache_dir=CACHE_DIR,
+                         batch_size=32, workers=0, checkpoint=None):
+    """
+    Compare an optimized inference backend against the fp32 checkpoint on the test set
+
+    Returns True if the backend's accuracy is within max_accuracy_drop of fp32
+    and its top-1 predictions agree with fp32 on at least min_agreement of images.
+    Both models' logits are cached separately (the backend is part of the checkpoint id).
+    checkpoint selects the weights for both (default: the served model).
+    """
+    reference = create_model_loader(backend="eager", model_path=checkpoint)
+    if not reference.is_loaded:
+        print("Error: Model not found. Please train a model first using train_model.py")
+        exit(1)
+    candidate = create_model_loader(backend, model_path=checkpoint)
+    if candidate.backend != backend:
+        print(f"Error: backend {backend!r} could not be built")
+        return False
+
+    print(f"Comparing {backend} against fp32 on {len(paths)} images...")
+    ref_logits = collect_logits(reference, paths, cache_dir, batch_size, workers)
+    cand_logits = collect_logits(candidate, paths, cache_dir, batch_size, workers)
+    scored = ~np.isnan(ref_logits).any(axis=1)
+    labels, ref_logits, cand_logits = labels[scored], ref_logits[scored], cand_logits[scored]
+    ref_probs, cand_probs = softmax(ref_logits), softmax(cand_logits)
+    ref_preds, cand_preds = ref_probs.argmax(axis=1), cand_probs.argmax(axis=1)
+
+    ref_acc = np.mean(ref_preds == labels)
+    cand_acc = np.mean(cand_preds == labels)
+    agreement = np.mean(ref_preds == cand_preds)
+    prob_diff = np.abs(ref_probs - cand_probs)
+
+    print("\n" + "="*50)
+    print(f"BACKEND PARITY: {backend} vs fp32")
+    print("="*50)
+    print(f"fp32 accuracy:        {ref_acc:.2%}")
+    print(f"{backend} accuracy: {cand_acc:.2%}")
+    print(f"Top-1 agreement:      {agreement:.2%}")
+    print(f"Max |prob diff|:      {prob_diff.max():.4f} (mean {prob_diff.mean():.4f})")
+
+    passed = ref_acc - cand_acc <= max_accuracy_drop and agreement >= min_agreement
+    print(f"\n{'PASS' if passed else 'FAIL'} (max accuracy drop {max_accuracy_drop:.2%}, min agreement {min_agreement:.2%})")
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the blade model on the test set")
+    parser.add_argument("--backend", help="Check accuracy parity of an inference backend against fp32")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.01)
+    parser.add_argument("--min-agreement", type=float, default=0.98)
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Test images in <class>/<image> folders")
+    parser.add_argument("--checkpoint", help="Checkpoint to evaluate (default: the served model)")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Where per-image logits are cached")
+    parser.add_argument("--no-cache", action="store_true", help="Score every image and leave the cache untouched")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="Processes decoding images (and threads hashing them)")
+    args = parser.parse_args()
+    if args.backend == "onnxruntime" and args.checkpoint:
+        # The ONNX graph is exported separately (export_onnx.py); a .pth checkpoint cannot be served by it
+        parser.error("--checkpoint cannot be combined with --backend onnxruntime; "
+                     "export the checkpoint and set BLADEGUARD_ONNX_MODEL_PATH instead")
+
+    if not os.path.exists(args.data_dir):
+        print(f"Error: Test directory not found at {args.data_dir}")
+        exit(1)
+
+    class_names, samples = scan_image_folder(args.data_dir)
+    paths = [os.path.join(args.data_dir, path) for path, _ in samples]
+    labels = np.array([label for _, label in samples], dtype=np.int64)
+    cache_dir = None if args.no_cache else args.cache_dir
+
+    if args.backend:
+        passed = check_backend_parity(args.backend, paths, labels, args.max_accuracy_drop, args.min_agreement,
+                                      cache_dir, args.batch_size, args.workers, args.checkpoint)
+        sys.exit(0 if passed else 1)
 
+    evaluate(paths, labels, class_names, args.checkpoint, cache_dir, args.batch_size, args.workers)
@@ -0,0 +1,247 @@
+"""
+Incremental evaluation: cached per-image logits and streaming metrics
+
+evaluate_model.py used to push all of data/test through the model on every
+run and gather the predictions in Python lists. Here each image's logits are
+stored under (SHA-256 of the file, model checkpoint id), so a re-run only
+decodes and scores images that are new or changed since the last run for
+that checkpoint. A new checkpoint scores the archive once and is cached too.
+
+Metrics are accumulated batch by batch into fixed-size NumPy counters
+(confusion matrix, calibration bins), so memory does not grow with the test
+set and the arithmetic is vectorized per batch.
+"""
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.utils.image_files import ImageFileDataset, collate
+from app.utils.preprocessing import normalize_batch
+
+# Equal-width confidence bins for the reliability diagram and ECE
+CALIBRATION_BINS = 15
+
+# Newly scored logits are written out every this many images (and at the end of a run)
+FLUSH_EVERY = 4096
+
+# More chunk files than this are compacted into one when the cache is opened
+MAX_CHUNKS = 16
+
+
+def file_digest(path):
+    """SHA-256 hex digest of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def softmax(logits):
+    """Row-wise softmax of an (N, classes) logits array"""
+    shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+
+class LogitCache:
+    """
+    Logits of one model version, keyed by image digest
+
+    Stored as append-only .npz chunks (digests plus a float32 logits matrix)
+    in cache_dir/<hash of the model id>/. Each flush writes one chunk to a
+    temporary name and renames it into place, so an interrupted run keeps
+    whatever it had flushed.
+    """
+
+    def __init__(self, cache_dir, model_id):
+        self.model_id = model_id
+        self.directory = os.path.join(cache_dir, hashlib.sha256(model_id.encode()).hexdigest()[:16])
+        self._rows = {}
+        self._pending_digests = []
+        self._pending_logits = []
+        chunks = self._chunk_paths()
+        for path in chunks:
+            with np.load(path, allow_pickle=False) as chunk:
+                self._rows.update(zip(chunk["digests"].tolist(), chunk["logits"]))
+        if len(chunks) > MAX_CHUNKS:
+            self._compact(chunks)
+
+    def _chunk_paths(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            os.path.join(self.directory, name) for name in os.listdir(self.directory)
+            if name.startswith("chunk-") and name.endswith(".npz")
+        )
+
+    def _write_chunk(self, digests, logits):
+        os.makedirs(self.directory, exist_ok=True)
+        number = max([int(os.path.basename(p)[6:-4]) for p in self._chunk_paths()], default=-1) + 1
+        path = os.path.join(self.directory, f"chunk-{number:06d}.npz")
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, digests=np.array(digests, dtype="U64"), logits=np.asarray(logits, dtype=np.float32))
+        os.replace(tmp_path, path)
+        return path
+
+    def _compact(self, chunks):
+        digests = list(self._rows)
+        self._write_chunk(digests, np.stack([self._rows[d] for d in digests]))
+        for path in chunks:
+            os.remove(path)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get(self, digest):
+        """Cached logits row for an image digest, or None"""
+        return self._rows.get(digest)
+
+    def put(self, digests, logits):
+        logits = np.asarray(logits, dtype=np.float32)
+        self._rows.update(zip(digests, logits))
+        self._pending_digests.extend(digests)
+        self._pending_logits.append(logits)
+        if len(self._pending_digests) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        """Write the logits added since the last flush as one new chunk"""
+        if self._pending_digests:
+            self._write_chunk(self._pending_digests, np.concatenate(self._pending_logits))
+            self._pending_digests, self._pending_logits = [], []
+
+
+def score_images(model_loader, paths, cache_dir=None, batch_size=32, workers=0):
+    """
+    Yield (indices, logits, failed) batches covering paths, as app/utils/image_files.collate groups them
+
+    With cache_dir, cached logits for model_loader.checkpoint_id are yielded
+    first (as batches of up to batch_size) and only the remaining images are
+    decoded and run through the model; their logits are added to the cache.
+    failed lists (index, error) for images that could not be decoded.
+    """
+    from torch.utils.data import DataLoader
+
+    cache = LogitCache(cache_dir, model_loader.checkpoint_id) if cache_dir else None
+    todo = list(range(len(paths)))
+    digests = None
+    if cache is not None:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            digests = list(pool.map(file_digest, paths))
+        hits = [i for i in todo if cache.get(digests[i]) is not None]
+        for start in range(0, len(hits), batch_size):
+            indices = hits[start:start + batch_size]
+            yield indices, np.stack([cache.get(digests[i]) for i in indices]), []
+        todo = [i for i in todo if cache.get(digests[i]) is None]
+        print(f"{len(hits)} of {len(paths)} images cached for {model_loader.checkpoint_id}, {len(todo)} to score")
+
+    batches = DataLoader(
+        ImageFileDataset([paths[i] for i in todo]),
+        batch_size=batch_size,
+        num_workers=workers,
+        collate_fn=collate,
+    )
+    try:
+        for positions, pixels, failed in batches:
+            failed = [(todo[position], error) for position, error in failed]
+            indices = [todo[position] for position in positions]
+            logits = None
+            if indices:
+                logits = np.asarray(model_loader.forward_logits(normalize_batch(pixels)).float().cpu(),
+                                    dtype=np.float32)
+                if cache is not None:
+                    cache.put([digests[i] for i in indices], logits)
+            yield indices, logits, failed
+    finally:
+        if cache is not None:
+            cache.flush()
+
+
+class StreamingMetrics:
+    """
+    Classification and calibration metrics accumulated one batch at a time
+
+    Holds a (classes x classes) confusion matrix, per-bin confidence and
+    accuracy sums for CALIBRATION_BINS confidence bins and the summed
+    log-loss, so memory is fixed however many images are evaluated.
+    """
+
+    def __init__(self, num_classes, bins=CALIBRATION_BINS):
+        self.num_classes = num_classes
+        self.bins = bins
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.bin_count = np.zeros(bins, dtype=np.int64)
+        self.bin_confidence = np.zeros(bins)
+        self.bin_correct = np.zeros(bins)
+        self.log_loss_sum = 0.0
+
+    @property
+    def count(self):
+        return int(self.confusion.sum())
+
+    def update(self, labels, logits):
+        """Add a batch: labels (N,) class indices, logits (N, classes)"""
+        labels = np.asarray(labels, dtype=np.int64)
+        logits = np.asarray(logits, dtype=np.float64)
+        rows = np.arange(len(labels))
+        # log-softmax, shifted by the row max for stability
+        shifted = logits - logits.max(axis=1, keepdims=True)
+        log_probs = shifted - np.log(np.exp(shifted).sum(axis=1, keepdims=True))
+        preds = log_probs.argmax(axis=1)
+        confidence = np.exp(log_probs[rows, preds])
+
+        c = self.num_classes
+        self.confusion += np.bincount(labels * c + preds, minlength=c * c).reshape(c, c)
+        bins = np.minimum((confidence * self.bins).astype(np.int64), self.bins - 1)
+        self.bin_count += np.bincount(bins, minlength=self.bins)
+        self.bin_confidence += np.bincount(bins, weights=confidence, minlength=self.bins)
+        self.bin_correct += np.bincount(bins, weights=preds == labels, minlength=self.bins)
+        self.log_loss_sum -= log_probs[rows, labels].sum()
+
+    @property
+    def accuracy(self):
+        return np.trace(self.confusion) / max(self.count, 1)
+
+    @property
+    def log_loss(self):
+        return self.log_loss_sum / max(self.count, 1)
+
+    def precision_recall_f1(self):
+        """Per-class (precision, recall, f1, support) arrays; 0 where undefined"""
+        tp = np.diag(self.confusion).astype(np.float64)
+        predicted = self.confusion.sum(axis=0)
+        support = self.confusion.sum(axis=1)
+        precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+        recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+        total = precision + recall
+        f1 = np.divide(2 * precision * recall, total, out=np.zeros_like(tp), where=total > 0)
+        return precision, recall, f1, support
+
+    def reliability(self):
+        """Per-bin (mean confidence, accuracy, count); NaN for empty bins"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.bin_confidence / self.bin_count, self.bin_correct / self.bin_count, self.bin_count
+
+    def expected_calibration_error(self):
+        """Count-weighted mean |accuracy - confidence| over the confidence bins"""
+        return np.abs(self.bin_correct - self.bin_confidence).sum() / max(self.count, 1)
+
+    def report(self, class_names):
+        """Per-class precision/recall/F1 table with macro and weighted averages"""
+        precision, recall, f1, support = self.precision_recall_f1()
+        width = max(len(name) for name in list(class_names) + ["weighted avg"])
+        lines = [f"{'':>{width}}  precision    recall  f1-score   support", ""]
+        for name, p, r, f, s in zip(class_names, precision, recall, f1, support):
+            lines.append(f"{name:>{width}}  {p:9.2f} {r:9.2f} {f:9.2f} {s:9d}")
+        weights = support / max(support.sum(), 1)
+        lines += [
+            "",
+            f"{'accuracy':>{width}}  {'':9} {'':9} {self.accuracy:9.2f} {self.count:9d}",
+            f"{'macro avg':>{width}}  {precision.mean():9.2f} {recall.mean():9.2f} {f1.mean():9.2f} {self.count:9d}",
+            f"{'weighted avg':>{width}}  {precision @ weights:9.2f} {recall @ weights:9.2f} "
+            f"{f1 @ weights:9.2f} {self.count:9d}",
+        ]
+        return "\n".join(lines)
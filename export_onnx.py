@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Export the trained blade model to ONNX for the onnxruntime serving backend
+
+The exported graph takes a (N, 3, 224, 224) float input and returns
+logits plus per-class Grad-CAM maps; class names are stored in the model
+metadata.
+
+Usage:
+    python export_onnx.py
+    BLADEGUARD_INFERENCE_BACKEND=onnxruntime uvicorn app.main:app
+"""
+import argparse
+import inspect
+import json
+import os
+import sys
+
+import numpy as np
+import torch
+
+from app.backends import ExplainableResNet
+from app.model_loader import load_checkpoint, MODEL_PATH
+from app.config import ONNX_MODEL_PATH
+
+
+def export(checkpoint_path, output_path, opset=17):
+    model, class_names = load_checkpoint(checkpoint_path, "cpu")
+    wrapper = ExplainableResNet(model).eval()
+    example = torch.randn(1, 3, 224, 224)
+
+    # Stick to the TorchScript-based exporter where torch offers a choice
+    extra = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            (example,),
+            output_path,
+            input_names=["input"],
+            output_names=["logits", "cams"],
+            dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}, "cams": {0: "batch"}},
+            opset_version=opset,
+            **extra,
+        )
+
+    import onnx
+    onnx_model = onnx.load(output_path)
+    for key, value in {
+        "class_names": json.dumps(class_names),
+        "source_checkpoint": os.path.basename(checkpoint_path),
+    }.items():
+        entry = onnx_model.metadata_props.add()
+        entry.key, entry.value = key, value
+    onnx.save(onnx_model, output_path)
+    return wrapper
+
+
+def verify(wrapper, output_path, batch_size=4, atol=1e-3):
+    """Compare ONNX Runtime output with PyTorch on random input"""
+    import onnxruntime as ort
+
+    session = ort.InferenceSession(output_path, providers=["CPUExecutionProvider"])
+    x = torch.randn(batch_size, 3, 224, 224)
+    with torch.no_grad():
+        ref_logits, ref_cams = wrapper(x)
+    logits, cams = session.run(None, {"input": x.numpy()})
+
+    logit_diff = np.abs(logits - ref_logits.numpy()).max()
+    cam_diff = np.abs(cams - ref_cams.numpy()).max()
+    print(f"Max |logit diff|: {logit_diff:.2e}, max |cam diff|: {cam_diff:.2e}")
+    return logit_diff <= atol and cam_diff <= atol
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the blade model to ONNX")
+    parser.add_argument("--checkpoint", default=MODEL_PATH)
+    parser.add_argument("--output", default=ONNX_MODEL_PATH)
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--no-verify", action="store_true", help="Skip the ONNX Runtime vs PyTorch check")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.checkpoint):
+        print(f"Error: checkpoint not found at {args.checkpoint}. Train a model first using train_model.py")
+        sys.exit(1)
+
+    wrapper = export(args.checkpoint, args.output, args.opset)
+    print(f"Exported {args.checkpoint} -> {args.output}")
+
+    if not args.no_verify:
+        if not verify(wrapper, args.output):
+            print("Error: ONNX Runtime output does not match PyTorch")
+            sys.exit(1)
+        print("ONNX Runtime output matches PyTorch")
@@ -0,0 +1,54 @@
+"""
+Unit tests for inspection archive unpacking
+"""
+import io
+import tarfile
+import zipfile
+import pytest
+from app.utils.archives import is_archive, extract_images
+
+
+def test_is_archive():
+    assert is_archive("run_042.zip")
+    assert is_archive("run_042.tar.gz")
+    assert not is_archive("blade_01.png")
+    assert not is_archive(None)
+
+
+def test_extract_zip_skips_non_images():
+    """Only image members are returned, in archive order"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("T1/blade_a.png", b"a")
+        archive.writestr("T1/notes.txt", b"x")
+        archive.writestr("__MACOSX/T1/._blade_a.png", b"junk")
+        archive.writestr("T1/blade_b.JPG", b"b")
+
+    images = extract_images("set.zip", buffer.getvalue())
+    assert images == [("T1/blade_a.png", b"a"), ("T1/blade_b.JPG", b"b")]
+
+
+def test_extract_tar_enforces_image_limit():
+    """Archives with too many images are rejected"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for i in range(3):
+            info = tarfile.TarInfo(f"blade_{i}.png")
+            info.size = 1
+            archive.addfile(info, io.BytesIO(b"x"))
+
+    assert len(extract_images("set.tar.gz", buffer.getvalue())) == 3
+    with pytest.raises(ValueError):
+        extract_images("set.tar.gz", buffer.getvalue(), max_images=2)
+
+
+def test_extract_zip_enforces_total_size():
+    """Members that are each within limits but add up past max_total_bytes are rejected"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for i in range(3):
+            archive.writestr(f"blade_{i}.png", b"\0" * 1000)
+
+    assert len(extract_images("set.zip", buffer.getvalue(), max_total_bytes=3000)) == 3
+    with pytest.raises(ValueError):
+        extract_images("set.zip", buffer.getvalue(), max_member_bytes=1000, max_total_bytes=2999)
@@ -0,0 +1,45 @@
+"""
+Unit tests for the optimized inference backends
+"""
+import pytest
+import torch
+from torchvision import models
+from app.backends import build_backbone, ResNetBackbone
+
+
+def small_model():
+    torch.manual_seed(0)
+    return models.resnet18(weights=None, num_classes=3).eval()
+
+
+@pytest.mark.parametrize("backend", ["channels_last", "torchscript"])
+def test_float_backends_match_eager(backend):
+    """fp32 backends produce the same layer4 activations as the eager backbone"""
+    model = small_model()
+    x = torch.randn(2, 3, 224, 224)
+    with torch.no_grad():
+        expected = ResNetBackbone(model)(x)
+        actual = build_backbone(model, backend)(x)
+    assert actual.shape == expected.shape
+    assert torch.allclose(actual, expected, atol=1e-4)
+
+
+def test_static_int8_requires_calibration():
+    with pytest.raises(ValueError):
+        build_backbone(small_model(), "static_int8", calibration_batches=[])
+
+
+def test_static_int8_runs_on_float_input():
+    """Quantized backbone takes and returns float tensors, so the fp32 head still works"""
+    model = small_model()
+    calibration = [torch.randn(4, 3, 224, 224)]
+    backbone = build_backbone(model, "static_int8", calibration_batches=calibration)
+    with torch.no_grad():
+        out = backbone(torch.randn(2, 3, 224, 224))
+    assert out.dtype == torch.float32
+    assert out.shape == (2, 512, 7, 7)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        build_backbone(small_model(), "tensorrt")
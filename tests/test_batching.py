@@ -0,0 +1,87 @@
+"""
+Unit tests for the micro-batching scheduler
+"""
+import threading
+import torch
+from app.batching import BatchScheduler
+
+
+def make_scheduler(max_batch_size=4, max_wait_ms=50.0):
+    """Scheduler whose batch_fn echoes each image's marker value and records batch sizes"""
+    batch_sizes = []
+
+    def batch_fn(batch):
+        batch_sizes.append(batch.shape[0])
+        return [float(t[0, 0, 0]) for t in batch]
+
+    return BatchScheduler(batch_fn, max_batch_size, max_wait_ms), batch_sizes
+
+
+def test_each_caller_gets_its_own_result():
+    """Concurrent callers are batched together but receive their own output"""
+    scheduler, batch_sizes = make_scheduler()
+    results = {}
+
+    def worker(i):
+        results[i] = scheduler.predict(torch.full((1, 1, 2, 2), float(i)))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == {i: float(i) for i in range(8)}
+    assert sum(batch_sizes) == 8
+    assert max(batch_sizes) <= 4
+    assert max(batch_sizes) > 1
+
+
+def test_batch_size_one_bypasses_worker():
+    """A batch size of 1 runs inline without starting the worker thread"""
+    scheduler, batch_sizes = make_scheduler(max_batch_size=1)
+    assert scheduler.predict(torch.full((1, 1, 2, 2), 3.0)) == 3.0
+    assert batch_sizes == [1]
+    assert scheduler._worker is None
+
+
+def test_errors_propagate_to_callers():
+    """A failing batch surfaces the exception to every caller in it"""
+    def batch_fn(batch):
+        raise RuntimeError("boom")
+
+    scheduler = BatchScheduler(batch_fn, max_batch_size=4, max_wait_ms=1.0)
+    future = scheduler.submit(torch.zeros(1, 1, 2, 2))
+    try:
+        future.result(timeout=5)
+        assert False, "expected RuntimeError"
+    except RuntimeError as e:
+        assert str(e) == "boom"
+
+
+def test_short_batch_output_fails_the_remaining_callers():
+    """Callers without a matching output row get an error instead of hanging"""
+    def batch_fn(batch):
+        return [float(t[0, 0, 0]) for t in batch][:1]
+
+    scheduler = BatchScheduler(batch_fn, max_batch_size=2, max_wait_ms=1000.0)
+    first = scheduler.submit(torch.full((1, 1, 2, 2), 1.0))
+    second = scheduler.submit(torch.full((1, 1, 2, 2), 2.0))
+    assert first.result(timeout=5) == 1.0
+    try:
+        second.result(timeout=5)
+        assert False, "expected RuntimeError"
+    except RuntimeError as e:
+        assert "1 results for a batch of 2" in str(e)
+
+
+def test_closed_scheduler_finishes_queued_work_and_runs_late_callers_inline():
+    """close() stops the worker after pending batches; later submits still get results"""
+    scheduler, batch_sizes = make_scheduler(max_batch_size=4, max_wait_ms=20.0)
+    queued = scheduler.submit(torch.full((1, 1, 2, 2), 1.0))
+    scheduler.close()
+
+    assert queued.result(timeout=5) == 1.0
+    scheduler._worker.join(timeout=5)
+    assert not scheduler._worker.is_alive()
+    assert scheduler.predict(torch.full((1, 1, 2, 2), 2.0)) == 2.0
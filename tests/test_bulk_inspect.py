@@ -0,0 +1,72 @@
+"""
+Tests for the offline bulk inspection CLI
+"""
+import json
+import os
+import torch
+from PIL import Image
+from torchvision import models
+import bulk_inspect
+
+
+def make_inputs(tmp_path, count=5):
+    images = tmp_path / "flight" / "T07"
+    images.mkdir(parents=True)
+    for i in range(count):
+        Image.new("RGB", (320, 240), (40 * i, 90, 200)).save(images / f"frame_{i}.jpg")
+    (images / "corrupt.jpg").write_bytes(b"not a jpeg")
+    torch.manual_seed(0)
+    checkpoint = tmp_path / "model.pth"
+    torch.save({
+        "model_state_dict": models.resnet50(weights=None, num_classes=3).state_dict(),
+        "class_names": ["healthy", "minor_damage", "severe_damage"],
+    }, checkpoint)
+    return str(tmp_path / "flight"), str(checkpoint)
+
+
+def read_rows(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_scores_directory_and_resumes(tmp_path):
+    """One row per image with decide_action fields; a resumed run only adds missing images"""
+    flight, checkpoint = make_inputs(tmp_path)
+    output = str(tmp_path / "scores.jsonl")
+    heatmaps = tmp_path / "heatmaps"
+    argv = [flight, "--output", output, "--checkpoint", checkpoint, "--workers", "0",
+            "--batch-size", "4", "--blade-type", "TPI", "--heatmaps", str(heatmaps)]
+
+    bulk_inspect.run(bulk_inspect.parse_args(argv))
+
+    rows = read_rows(output)
+    assert len(rows) == 6
+    errors = [r for r in rows if r["error"]]
+    assert [os.path.basename(r["path"]) for r in errors] == ["corrupt.jpg"]
+    scored = [r for r in rows if not r["error"]]
+    assert all(r["recommended_action"] and r["blade_type"] == "TPI" for r in scored)
+    # Overlays only for images not predicted healthy
+    flagged = [r for r in scored if r["severity"] != "healthy"]
+    assert sorted(os.listdir(heatmaps)) == sorted(os.path.basename(r["heatmap_path"]) for r in flagged)
+
+    # Interrupted run: two rows lost, the last one half-written
+    with open(output, "w") as f:
+        f.writelines(json.dumps(r) + "\n" for r in rows[:4])
+        f.write('{"path": "/half')
+
+    bulk_inspect.run(bulk_inspect.parse_args(argv + ["--resume"]))
+
+    resumed = read_rows(output)
+    assert sorted(r["path"] for r in resumed) == sorted(r["path"] for r in rows)
+
+
+def test_heatmap_names_do_not_collide():
+    """Same stem with another extension, or a flattened-looking name, gets its own heatmap file"""
+    root = os.path.abspath("flights")
+    names = [
+        bulk_inspect.heatmap_name(os.path.join(root, *parts), root, "jpg")
+        for parts in [("IMG_1.jpg",), ("IMG_1.png",), ("a", "b.jpg"), ("a__b.jpg",)]
+    ]
+    assert len(set(names)) == 4
+    assert names[2].startswith("a__b-") and names[2].endswith(".jpg")
+    assert bulk_inspect.heatmap_name(os.path.join(root, "IMG_1.jpg"), root, "jpg") == names[0]
@@ -0,0 +1,52 @@
+"""
+Unit tests for crash-safe training checkpoints
+"""
+import os
+import random
+import numpy as np
+import pytest
+import torch
+from checkpointing import (
+    TRAIN_STATE_FORMAT, TRAIN_STATE_VERSION, AsyncCheckpointer, atomic_save, capture_rng_state, restore_rng_state,
+    load_train_state,
+)
+
+
+def test_atomic_save_leaves_old_file_on_failure(tmp_path):
+    """A failed write keeps the previous checkpoint and leaves no temporary file behind"""
+    path = tmp_path / "model.pth"
+    atomic_save({"weights": torch.ones(3)}, str(path))
+
+    with pytest.raises(Exception):
+        atomic_save({"weights": lambda: None}, str(path))  # not picklable
+
+    assert torch.equal(torch.load(path)["weights"], torch.ones(3))
+    assert os.listdir(tmp_path) == ["model.pth"]
+
+
+def test_async_checkpointer_saves_a_snapshot(tmp_path):
+    """The saved state is the one passed to save(), even if training changes it afterwards"""
+    weights = torch.zeros(4)
+    checkpointer = AsyncCheckpointer()
+    checkpointer.save({"weights": weights}, str(tmp_path / "a.pt"))
+    weights.add_(1)
+    checkpointer.save({"weights": weights}, str(tmp_path / "b.pt"))
+    checkpointer.close()
+
+    assert torch.equal(torch.load(tmp_path / "a.pt")["weights"], torch.zeros(4))
+    assert torch.equal(torch.load(tmp_path / "b.pt")["weights"], torch.ones(4))
+
+
+def test_rng_state_round_trips_through_train_state(tmp_path):
+    """RNG states survive a weights-only load, so a resumed run draws the same numbers"""
+    path = str(tmp_path / "last.pt")
+    state = {"format": TRAIN_STATE_FORMAT, "version": TRAIN_STATE_VERSION, "rng": capture_rng_state()}
+    atomic_save(state, path)
+    expected = (random.random(), np.random.rand(), torch.rand(1))
+
+    restore_rng_state(load_train_state(path)["rng"])
+    assert (random.random(), np.random.rand(), torch.rand(1)) == expected
+
+    atomic_save({"model_state_dict": {}, "class_names": []}, path)
+    with pytest.raises(ValueError):
+        load_train_state(path)
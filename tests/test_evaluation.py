@@ -0,0 +1,88 @@
+"""
+Unit tests for incremental evaluation (logit cache and streaming metrics)
+"""
+import numpy as np
+import torch
+from PIL import Image
+from sklearn.metrics import confusion_matrix, precision_recall_fscore_support, log_loss
+from evaluation import StreamingMetrics, score_images
+
+
+class CountingLoader:
+    """Stand-in model: logits from the mean colour, counting the images it scores"""
+
+    def __init__(self, checkpoint_id="test.pth:1:1:eager"):
+        self.checkpoint_id = checkpoint_id
+        self.class_names = ["healthy", "minor_damage", "severe_damage"]
+        self.scored = 0
+
+    def forward_logits(self, tensor):
+        self.scored += len(tensor)
+        return tensor.mean(dim=(2, 3))
+
+
+def _make_images(root, count):
+    root.mkdir(exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = root / f"{i}.jpg"
+        Image.new("RGB", (64, 48), (30 * i, 100, 200 - 20 * i)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+def test_streaming_metrics_match_batch_computation():
+    """Metrics accumulated over batches equal sklearn's on the whole set"""
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 3, 500)
+    logits = rng.normal(size=(500, 3)) + 2 * np.eye(3)[labels]
+
+    metrics = StreamingMetrics(3)
+    for start in range(0, 500, 64):
+        metrics.update(labels[start:start + 64], logits[start:start + 64])
+
+    preds = logits.argmax(axis=1)
+    assert (metrics.confusion == confusion_matrix(labels, preds)).all()
+    precision, recall, f1, support = metrics.precision_recall_f1()
+    expected = precision_recall_fscore_support(labels, preds)
+    for ours, theirs in zip((precision, recall, f1, support), expected):
+        assert np.allclose(ours, theirs)
+    probs = torch.softmax(torch.from_numpy(logits), dim=1).numpy()
+    assert np.isclose(metrics.log_loss, log_loss(labels, probs))
+
+    # ECE from the reliability bins equals the per-image definition
+    confidence = probs.max(axis=1)
+    bins = np.minimum((confidence * metrics.bins).astype(int), metrics.bins - 1)
+    ece = sum(abs((preds == labels)[bins == b].sum() - confidence[bins == b].sum()) for b in range(metrics.bins)) / 500
+    assert np.isclose(metrics.expected_calibration_error(), ece)
+
+
+def test_only_new_images_are_scored(tmp_path):
+    """Cached logits are reused per checkpoint; added or changed images are scored again"""
+    paths = _make_images(tmp_path / "test", 5)
+    (tmp_path / "test" / "broken.jpg").write_bytes(b"not a jpeg")
+    paths.append(str(tmp_path / "test" / "broken.jpg"))
+    cache_dir = str(tmp_path / "cache")
+
+    def run(loader, paths):
+        results = {}
+        for indices, logits, failed in score_images(loader, paths, cache_dir, batch_size=2):
+            results.update(zip(indices, [] if logits is None else logits.tolist()))
+            assert all(paths[i].endswith("broken.jpg") for i, _ in failed)
+        return results
+
+    loader = CountingLoader()
+    first = run(loader, paths)
+    assert loader.scored == 5 and sorted(first) == [0, 1, 2, 3, 4]
+
+    loader = CountingLoader()
+    Image.new("RGB", (64, 48), (255, 0, 0)).save(tmp_path / "new.jpg")
+    paths.insert(3, str(tmp_path / "new.jpg"))
+    Image.new("RGB", (64, 48), (0, 0, 0)).save(paths[0])
+    second = run(loader, paths)
+    assert loader.scored == 2
+    assert np.allclose(second[4], first[3]) and not np.allclose(second[0], first[0])
+
+    loader = CountingLoader("other.pth:1:1:eager")
+    run(loader, paths)
+    assert loader.scored == 6
@@ -0,0 +1,85 @@
+"""
+Unit tests for the bounded inference worker pool
+"""
+import asyncio
+import threading
+import pytest
+from app.executor import InferenceExecutor, ExecutorSaturatedError
+
+
+def test_run_returns_result():
+    """Jobs run on the pool and their result is awaited"""
+    executor = InferenceExecutor(max_workers=2, max_queue_depth=2)
+    assert asyncio.run(executor.run(lambda x: x * 2, 21)) == 42
+    assert executor.pending == 0
+
+
+def test_saturated_pool_rejects_new_jobs():
+    """Once workers and queue are full, submit fails fast instead of queuing"""
+    executor = InferenceExecutor(max_workers=1, max_queue_depth=1)
+    release = threading.Event()
+
+    running = executor.submit(release.wait)
+    queued = executor.submit(release.wait)
+    assert executor.pending == 2
+    assert executor.queue_depth == 1
+
+    with pytest.raises(ExecutorSaturatedError):
+        executor.submit(release.wait)
+
+    release.set()
+    running.result(timeout=5)
+    queued.result(timeout=5)
+    assert executor.pending == 0
+
+    # Capacity is available again
+    assert executor.submit(lambda: "ok").result(timeout=5) == "ok"
+
+
+def test_job_errors_release_capacity():
+    """A failing job propagates its error and frees its slot"""
+    executor = InferenceExecutor(max_workers=1, max_queue_depth=0)
+
+    def fail():
+        raise ValueError("bad image")
+
+    with pytest.raises(ValueError):
+        asyncio.run(executor.run(fail))
+    assert executor.pending == 0
+
+
+def test_stream_yields_items_in_order():
+    """stream() runs a generator on the pool and yields its items asynchronously"""
+    executor = InferenceExecutor(max_workers=1, max_queue_depth=0)
+
+    async def collect():
+        return [item async for item in executor.stream(lambda n: (i * i for i in range(n)), 5)]
+
+    assert asyncio.run(collect()) == [0, 1, 4, 9, 16]
+    executor.shutdown(wait=True)
+    assert executor.pending == 0
+
+
+def test_stream_stops_producer_when_consumer_stops():
+    """Abandoning the stream early releases the worker instead of blocking it forever"""
+    executor = InferenceExecutor(max_workers=1, max_queue_depth=0)
+    produced = []
+
+    def numbers():
+        for i in range(1000):
+            produced.append(i)
+            yield i
+
+    async def take_two():
+        stream = executor.stream(numbers, buffer_size=2)
+        taken = []
+        async for item in stream:
+            taken.append(item)
+            if len(taken) == 2:
+                break
+        await stream.aclose()
+        return taken
+
+    assert asyncio.run(take_two()) == [0, 1]
+    executor.shutdown(wait=True)
+    assert len(produced) < 1000
@@ -8,12 +8,12 @@ from PIL import Image
 import numpy as np
 from app.model_loader import model_loader
 from app.utils.preprocessing import load_image_from_bytes, preprocess_for_model
-from app.utils.visualization import create_gradcam_heatmap, create_dummy_heatmap
+from app.utils.visualization import create_gradcam_heatmap, create_dummy_heatmap, explain_and_classify, compact_cam, colorize_cam, render_cam_overlay
 
 def test_gradcam():
     """Test if Grad-CAM is working vs dummy heatmap"""
     
-    if model_loader.model is None:
+    if not model_loader.is_loaded:
         print("❌ ERROR: Model not loaded. Train a model first.")
         return False
     
@@ -115,6 +115,59 @@ def test_gradcam():
         traceback.print_exc()
         return False
 
+def test_fused_gradcam_matches_hook_gradcam():
+    """Single-pass explain_and_classify gives the same CAM as a classic hook-based Grad-CAM"""
+    import torch
+    from torchvision import models
+
+    torch.manual_seed(0)
+    model = models.resnet18(weights=None, num_classes=3).eval()
+    tensor = torch.randn(2, 3, 224, 224)
+
+    probs, cams = explain_and_classify(model, tensor)
+
+    # Reference: full forward with gradients, hooks on layer4, backward per image
+    for i in range(tensor.shape[0]):
+        store = {}
+        handle = model.layer4.register_forward_hook(lambda m, inp, out: store.update(acts=out))
+        output = model(tensor[i:i + 1])
+        handle.remove()
+        target = output[0, output.argmax(dim=1).item()]
+        grads, = torch.autograd.grad(target, store["acts"])
+        weights = grads.mean(dim=(2, 3), keepdim=True)
+        ref_cam = torch.relu((weights * store["acts"]).sum(dim=1))[0].detach().numpy()
+
+        assert np.allclose(cams[i], ref_cam, atol=1e-5)
+        assert np.allclose(probs[i].numpy(), torch.softmax(output, dim=1)[0].detach().numpy(), atol=1e-5)
+
+
+def test_compact_cam_dtypes_and_colorize():
+    """uint8 CAMs are min-max scaled, float16 keep raw values; both colorize to RGB"""
+    cam = np.arange(49, dtype=np.float32).reshape(7, 7)
+
+    as_uint8 = compact_cam(cam)
+    assert as_uint8.dtype == np.uint8 and as_uint8.shape == (7, 7)
+    assert as_uint8.min() == 0 and as_uint8.max() == 255
+
+    as_half = compact_cam(cam, dtype="float16", size=14)
+    assert as_half.dtype == np.float16 and as_half.shape == (14, 14)
+
+    rgb = colorize_cam(as_uint8, 64, 32)
+    assert rgb.shape == (32, 64, 3) and rgb.dtype == np.uint8
+
+
+
+def test_overlays_create_their_own_directory(tmp_path):
+    """Overlays are saved under output_path's directory, not a hardcoded results/"""
+    pil_image = Image.new("RGB", (32, 32))
+    dummy_path = tmp_path / "heatmaps" / "dummy.png"
+    cam_path = tmp_path / "cams" / "cam.png"
+
+    assert create_dummy_heatmap(pil_image, str(dummy_path)) == str(dummy_path)
+    assert render_cam_overlay(np.ones((7, 7), dtype=np.float32), pil_image, str(cam_path)) == str(cam_path)
+    assert dummy_path.is_file() and cam_path.is_file()
+
+
 if __name__ == "__main__":
     print("=" * 50)
     print("Grad-CAM Verification Test")
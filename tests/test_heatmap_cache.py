@@ -0,0 +1,61 @@
+"""
+Unit tests for lazy heatmap rendering and the LRU render cache
+"""
+from app.heatmap_cache import LRUBytesCache, LazyHeatmapStore
+
+
+def test_lru_evicts_least_recently_used():
+    """Cache stays within its byte budget, evicting the oldest untouched entry"""
+    cache = LRUBytesCache(max_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    cache.get("a")  # a is now most recently used
+    cache.put("c", b"cccc")
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.size_bytes == 8
+
+
+def test_lru_rejects_oversized_values():
+    """Values larger than the whole budget are not stored"""
+    cache = LRUBytesCache(max_bytes=4)
+    assert cache.put("big", b"12345") is False
+    assert len(cache) == 0
+
+
+def test_lazy_store_renders_once_on_first_request():
+    """Registering is free; rendering happens on first get and is cached"""
+    calls = []
+
+    def render(image_bytes):
+        calls.append(image_bytes)
+        return b"png:" + image_bytes
+
+    store = LazyHeatmapStore(render, max_source_bytes=1024, max_cache_bytes=1024)
+    handle = store.register(b"img")
+
+    assert handle.startswith("heatmap_") and handle.endswith(".png")
+    assert calls == []
+    assert store.get(handle) == b"png:img"
+    assert store.get(handle) == b"png:img"
+    assert calls == [b"img"]
+
+
+def test_lazy_store_unknown_handle():
+    """Unknown handles return None without rendering"""
+    store = LazyHeatmapStore(lambda b: b, max_source_bytes=1024, max_cache_bytes=1024)
+    assert "heatmap_missing.png" not in store
+    assert store.get("heatmap_missing.png") is None
+
+
+def test_lazy_store_passes_context_to_renderer():
+    """Keyword context given at registration reaches render_fn"""
+    store = LazyHeatmapStore(
+        lambda image_bytes, model_version: model_version.encode() + b":" + image_bytes,
+        max_source_bytes=1024,
+        max_cache_bytes=1024,
+    )
+    handle = store.register(b"img", model_version="lm@v2")
+    assert store.get(handle) == b"lm@v2:img"
@@ -0,0 +1,53 @@
+"""
+Unit tests for background heatmap writing and retention
+"""
+import os
+import time
+from PIL import Image
+from app.heatmap_writer import HeatmapWriter
+
+
+def test_writes_downscaled_heatmap_in_background(tmp_path):
+    """submit returns the final path at once; the file appears after wait"""
+    writer = HeatmapWriter(str(tmp_path / "results"), image_format="webp", max_side=100, prune_interval_seconds=0)
+    path = writer.submit(lambda image: image, Image.new("RGB", (400, 200), "gray"))
+
+    assert path.endswith(".webp")
+    assert writer.wait(path, timeout=5)
+    assert not writer.is_pending(path)
+    with Image.open(path) as saved:
+        assert saved.format == "WEBP"
+        assert saved.size == (100, 50)
+    writer.close()
+
+
+def test_failed_render_is_counted_not_raised(tmp_path):
+    """A render error is logged and counted; the caller is not affected"""
+    writer = HeatmapWriter(str(tmp_path), prune_interval_seconds=0)
+
+    def broken(image):
+        raise RuntimeError("bad cam")
+
+    path = writer.submit(broken, Image.new("RGB", (10, 10)))
+    assert not writer.wait(path, timeout=5)
+    assert writer.stats()["failed"] == 1
+    writer.close()
+
+
+def test_prune_applies_age_count_and_size_limits(tmp_path):
+    """Oldest heatmaps go first; unrelated files are left alone"""
+    now = time.time()
+    for i in range(5):
+        path = tmp_path / f"heatmap_{i}.jpg"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (now - 1000 + i, now - 1000 + i))
+    (tmp_path / "notes.txt").write_text("keep me")
+
+    assert HeatmapWriter(str(tmp_path), max_files=3).prune() == 2
+    assert sorted(os.listdir(tmp_path)) == ["heatmap_2.jpg", "heatmap_3.jpg", "heatmap_4.jpg", "notes.txt"]
+
+    assert HeatmapWriter(str(tmp_path), max_bytes=150).prune() == 2
+    assert sorted(os.listdir(tmp_path)) == ["heatmap_4.jpg", "notes.txt"]
+
+    assert HeatmapWriter(str(tmp_path), max_age_seconds=60).prune() == 1
+    assert os.listdir(tmp_path) == ["notes.txt"]
@@ -6,7 +6,7 @@ import uuid
 from PIL import Image
 import io
 import numpy as np
-from app.inference import analyze_blade_image, decide_action
+from app.inference import analyze_blade_image, analyze_blade_batch, decide_action, summarize_inspection
 
 def create_test_image():
     """Create a simple test image"""
@@ -77,6 +77,101 @@ def test_analyze_blade_image_structure():
     assert isinstance(result["damage_detected"], bool)
     assert result["severity"] in ["healthy", "minor_damage", "severe_damage"]
 
+def test_analyze_blade_image_lazy_heatmap():
+    """Lazy mode returns a heatmap handle without writing a file"""
+    import os
+    img = create_test_image()
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format='PNG')
+
+    result = analyze_blade_image(img_bytes.getvalue(), "LM", heatmap_mode="lazy")
+
+    handle = os.path.basename(result["heatmap_path"])
+    assert result["heatmap_url"] == f"/view-heatmap/{handle}"
+    assert not os.path.exists(result["heatmap_path"])
+    assert result["severity"] in ["healthy", "minor_damage", "severe_damage"]
+
+def test_analyze_blade_image_cam_heatmap():
+    """CAM mode returns the compact CAM inline and serves it colorized at any size"""
+    import os
+    from app.inference import cam_store, render_cam_image
+    img = create_test_image()
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format='PNG')
+
+    result = analyze_blade_image(img_bytes.getvalue(), "TPI", heatmap_mode="cam")
+
+    handle = os.path.basename(result["heatmap_path"])
+    assert handle in cam_store
+    assert not os.path.exists(result["heatmap_path"])
+    assert result["cam"]["dtype"] in ["uint8", "float16"]
+    assert len(result["cam"]["shape"]) == 2
+    with Image.open(io.BytesIO(render_cam_image(handle, width=120, height=80))) as rendered:
+        assert rendered.size == (120, 80)
+
+    # Re-uploads are served from the result cache and still carry the CAM
+    again = analyze_blade_image(img_bytes.getvalue(), "TPI", heatmap_mode="cam")
+    assert again["cam"] == result["cam"]
+
+def test_analyze_blade_image_rejects_unknown_heatmap_mode():
+    """Unknown heatmap modes are rejected"""
+    img_bytes = io.BytesIO()
+    create_test_image().save(img_bytes, format='PNG')
+    with pytest.raises(ValueError):
+        analyze_blade_image(img_bytes.getvalue(), "TPI", heatmap_mode="sometimes")
+
+def test_analyze_blade_batch_keeps_order_and_isolates_failures():
+    """Batch results follow input order and a bad image doesn't fail the set"""
+    img_bytes = io.BytesIO()
+    create_test_image().save(img_bytes, format='PNG')
+    good = img_bytes.getvalue()
+    items = [
+        {"filename": "a.png", "image_bytes": good, "blade_type": "TPI", "turbine_id": "T1"},
+        {"filename": "broken.png", "image_bytes": b"not an image", "blade_type": "TPI", "turbine_id": "T1"},
+        {"filename": "c.png", "image_bytes": good, "blade_type": "LM", "turbine_id": "T2"},
+    ]
+
+    results = analyze_blade_batch(items, heatmap_mode="lazy", chunk_size=2)
+
+    assert [r["filename"] for r in results] == ["a.png", "broken.png", "c.png"]
+    assert "error" in results[1]
+    assert results[2]["blade_type"] == "LM"
+    assert results[0]["severity"] in ["healthy", "minor_damage", "severe_damage"]
+
+def test_summarize_inspection_picks_most_urgent_action():
+    """Turbine summary escalates to the most urgent per-image action"""
+    results = [
+        {"filename": "1.png", "turbine_id": "T1", "severity": "healthy", **decide_action("TPI", "healthy", 0.9)},
+        {"filename": "2.png", "turbine_id": "T1", "severity": "severe_damage", **decide_action("TPI", "severe_damage", 0.9)},
+        {"filename": "3.png", "turbine_id": "T1", "error": "Could not decode image"},
+        {"filename": "4.png", "turbine_id": "T2", "severity": "minor_damage", **decide_action("LM", "minor_damage", 0.5)},
+    ]
+
+    summary = summarize_inspection(results)
+
+    assert summary["T1"]["recommended_action"] == "shutdown_and_investigate"
+    assert summary["T1"]["needs_shutdown"] == True
+    assert summary["T1"]["images"] == 3
+    assert summary["T1"]["failed_images"] == 1
+    assert summary["T1"]["flagged_images"] == ["2.png"]
+    assert summary["T2"]["recommended_action"] == "monitor"
+    assert summary["T2"]["severity_counts"] == {"minor_damage": 1}
+
+def test_analyze_blade_image_tiled():
+    """Tiled inference reports its tile grid and returns it as the compact CAM"""
+    img = Image.new('RGB', (900, 600), color='gray')
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format='PNG')
+
+    result = analyze_blade_image(img_bytes.getvalue(), "TPI", heatmap_mode="cam", tiled=True)
+
+    assert result["severity"] in ["healthy", "minor_damage", "severe_damage"]
+    assert result["tiling"]["tiles_total"] == len(result["tiling"]["grid"]) * len(result["tiling"]["grid"][0])
+    assert result["cam"]["shape"] == [len(result["tiling"]["grid"]), len(result["tiling"]["grid"][0])]
+
+    # Tiled and whole-image results are cached separately
+    assert "tiling" not in analyze_blade_image(img_bytes.getvalue(), "TPI", heatmap_mode="cam")
+    assert analyze_blade_image(img_bytes.getvalue(), "TPI", heatmap_mode="cam", tiled=True)["tiling"] == result["tiling"]
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
-
@@ -0,0 +1,60 @@
+"""
+Unit tests for the Prometheus-style metrics
+"""
+import io
+from PIL import Image
+from app.metrics import MetricsRegistry, STAGE_SECONDS, RESULTS
+
+
+def test_renders_prometheus_text_format():
+    """Counters, cumulative histogram buckets and callback gauges are exposed"""
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ["severity"])
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    registry.gauge("queue_depth", "Queue", lambda: 3)
+
+    requests.inc(severity="healthy")
+    requests.inc(2, severity="severe_damage")
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{severity="severe_damage"} 2' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1"} 2' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert "latency_seconds_count 3" in lines
+    assert "latency_seconds_sum 5.55" in lines
+    assert "queue_depth 3" in lines
+
+
+def test_timer_works_as_decorator():
+    """Histogram.time() records one observation per decorated call"""
+    registry = MetricsRegistry()
+    stage = registry.histogram("stage_seconds", "Stage", ["stage"])
+
+    @stage.time(stage="decode")
+    def decode():
+        return "done"
+
+    assert decode() == "done" and decode() == "done"
+    assert stage.count(stage="decode") == 2
+
+
+def test_analysis_records_stages_and_results():
+    """An analyzed image shows up in the stage timers and the per-severity counter"""
+    from app.inference import analyze_blade_image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (120, 90), color=(17, 99, 3)).save(buffer, format="PNG")
+    decodes = STAGE_SECONDS.count(stage="decode")
+
+    result = analyze_blade_image(buffer.getvalue(), "TPI", heatmap_mode="cam")
+
+    assert STAGE_SECONDS.count(stage="decode") == decodes + 1
+    assert RESULTS.value(
+        severity=result["severity"],
+        recommended_action=result["recommended_action"],
+        model_version=result["model_version"],
+    ) >= 1
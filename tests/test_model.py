@@ -7,7 +7,7 @@ import os
 
 DATA_DIR = "data/test"
 
-if model_loader.model is None:
+if not model_loader.is_loaded:
     print("Error: Model not found. Please train a model first using train_model.py")
     exit(1)
 
@@ -0,0 +1,96 @@
+"""
+Unit tests for lazy model loading and warm-up
+"""
+import subprocess
+import sys
+import torch
+from torchvision import models
+import app.model_loader
+from app.model_loader import LazyModelLoader, ModelLoader, load_checkpoint
+
+
+class FakeLoader:
+    backend = "eager"
+    checkpoint_id = "fake"
+    class_names = ["healthy", "minor_damage", "severe_damage"]
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict_and_explain_batch(self, tensor):
+        self.batch_sizes.append(tensor.shape[0])
+        return [("healthy", 0.9, None)] * tensor.shape[0]
+
+
+def test_loader_is_built_on_first_use():
+    """Nothing is loaded at construction; attribute access builds the loader once"""
+    calls = []
+    lazy = LazyModelLoader(lambda: calls.append(1) or FakeLoader())
+    assert not lazy.loaded and calls == []
+
+    assert lazy.class_names == FakeLoader.class_names
+    assert lazy.checkpoint_id == "fake"
+    assert calls == [1]
+    assert lazy.loaded and not lazy.ready
+
+
+def test_warm_up_runs_dummy_batches_and_sets_ready():
+    """warm_up loads the model, runs each batch size once and marks it ready"""
+    lazy = LazyModelLoader(FakeLoader)
+    lazy.warm_up(batch_sizes=(4, 1))
+
+    assert lazy.ready
+    assert lazy.get().batch_sizes == [1, 4]
+    status = lazy.status()
+    assert status["ready"] and status["backend"] == "eager"
+    assert status["warmup_seconds"] is not None
+
+
+def test_warm_up_failure_is_reported():
+    """A loader that cannot be built leaves the model not ready with an error"""
+    def broken():
+        raise RuntimeError("checkpoint is corrupt")
+
+    lazy = LazyModelLoader(broken)
+    lazy.warm_up()
+
+    status = lazy.status()
+    assert not status["ready"] and not status["loaded"]
+    assert "corrupt" in status["error"]
+
+
+def test_importing_api_does_not_load_torch():
+    """The API module imports without pulling in torch or loading the checkpoint"""
+    code = "import sys, app.main; print('torch' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert output.stdout.strip().splitlines()[-1] == "False"
+
+
+def test_mmap_checkpoint_matches_copied_load(tmp_path):
+    """Memory-mapped weights give the same model as a regular torch.load"""
+    torch.manual_seed(0)
+    model = models.resnet50(weights=None, num_classes=3)
+    path = str(tmp_path / "blade_resnet50.pth")
+    torch.save({"model_state_dict": model.state_dict(), "class_names": ["a", "b", "c"]}, path)
+
+    mapped, class_names = load_checkpoint(path, "cpu", mmap=True)
+    copied, _ = load_checkpoint(path, "cpu", mmap=False)
+
+    assert class_names == ["a", "b", "c"]
+    assert not mapped.training
+    x = torch.randn(2, 3, 224, 224)
+    with torch.no_grad():
+        assert torch.allclose(mapped(x), copied(x), atol=1e-6)
+
+
+def test_is_loaded_distinguishes_placeholder(tmp_path, monkeypatch):
+    """Without a checkpoint the loader serves placeholder predictions and reports is_loaded False"""
+    monkeypatch.setattr(app.model_loader, "MODEL_PATH", str(tmp_path / "missing.pth"))
+    placeholder = ModelLoader(backend="eager")
+    assert not placeholder.is_loaded
+    assert placeholder.predict_batch(torch.zeros(2, 3, 224, 224)) == [("healthy", 0.95)] * 2
+
+    path = str(tmp_path / "blade_resnet50.pth")
+    torch.save({"model_state_dict": models.resnet50(weights=None, num_classes=3).state_dict(),
+                "class_names": ["a", "b", "c"]}, path)
+    assert ModelLoader(backend="eager", model_path=path).is_loaded
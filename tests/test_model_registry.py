@@ -0,0 +1,110 @@
+"""
+Unit tests for the model registry: routing and hot swap
+"""
+import json
+import pytest
+import torch
+from app.model_registry import ModelRegistry
+
+
+class FakeLoader:
+    backend = "eager"
+    class_names = ["healthy", "minor_damage", "severe_damage"]
+
+    def __init__(self, path, fail=False):
+        if fail:
+            raise RuntimeError("bad checkpoint")
+        self.path = path
+        self.checkpoint_id = path
+
+    def predict_batch(self, tensor):
+        return [(self.path, 0.9)] * tensor.shape[0]
+
+    def predict_and_explain_batch(self, tensor):
+        return [(self.path, 0.9, None)] * tensor.shape[0]
+
+
+def fake_factory(backend, model_path):
+    return FakeLoader(model_path, fail=model_path.endswith("broken.pth"))
+
+
+def write_registry(tmp_path, manifest):
+    for entry in manifest["models"].values():
+        for path in entry["versions"].values():
+            (tmp_path / path).write_bytes(b"weights")
+    path = tmp_path / "registry.json"
+    path.write_text(json.dumps(manifest))
+    return str(path)
+
+
+def manifest(tmp_path, lm_active="v1", lm_versions=("v1",)):
+    return {
+        "default": "general",
+        "routes": {"lm": "lm"},
+        "models": {
+            "general": {"versions": {"v1": str(tmp_path / "general.pth")}},
+            "lm": {"active": lm_active, "versions": {v: str(tmp_path / f"lm_{v}.pth") for v in lm_versions}},
+        },
+    }
+
+
+def test_routes_by_blade_type_and_explicit_version(tmp_path):
+    """blade_type routes pick the model; "name@version" overrides the route"""
+    path = write_registry(tmp_path, manifest(tmp_path, lm_versions=("v1", "v2")))
+    registry = ModelRegistry(path, loader_factory=fake_factory)
+
+    assert registry.resolve("LM").ref == "lm@v1"
+    assert registry.resolve("TPI").ref == "general@v1"
+    assert registry.resolve("TPI", model_version="lm@v2").ref == "lm@v2"
+    assert registry.resolve(model_version="lm").ref == "lm@v1"
+    with pytest.raises(ValueError):
+        registry.resolve(model_version="lm@v9")
+    with pytest.raises(ValueError):
+        registry.resolve(model_version="unknown")
+
+
+def test_models_load_lazily(tmp_path):
+    """Registering versions loads nothing; warm_up loads only the active ones"""
+    path = write_registry(tmp_path, manifest(tmp_path, lm_versions=("v1", "v2")))
+    registry = ModelRegistry(path, loader_factory=fake_factory)
+    assert not any(v["loaded"] for v in registry.describe()["models"]["lm"]["versions"].values())
+
+    registry.warm_up()
+
+    assert registry.status()["ready"]
+    versions = registry.describe()["models"]["lm"]["versions"]
+    assert versions["v1"]["ready"] and not versions["v2"]["loaded"]
+
+
+def test_reload_warms_new_version_before_cut_over(tmp_path):
+    """The new active version is ready when it becomes visible; the old one keeps working"""
+    path = write_registry(tmp_path, manifest(tmp_path))
+    registry = ModelRegistry(path, loader_factory=fake_factory)
+    registry.warm_up()
+    in_flight = registry.resolve("LM")
+
+    write_registry(tmp_path, manifest(tmp_path, lm_active="v2", lm_versions=("v2",)))
+    registry.reload()
+
+    current = registry.resolve("LM")
+    assert current.ref == "lm@v2" and current.loader.ready
+    assert registry.resolve("TPI").loader.ready  # unchanged model was kept, not reloaded
+    # A request that resolved the old version before the swap still completes on it
+    label, _, _ = in_flight.prediction_batcher.predict(torch.zeros(1, 3, 224, 224))
+    assert label.endswith("lm_v1.pth")
+
+
+def test_failed_warm_up_keeps_current_models(tmp_path):
+    """A new version that cannot be loaded never takes traffic"""
+    path = write_registry(tmp_path, manifest(tmp_path))
+    registry = ModelRegistry(path, loader_factory=fake_factory)
+    registry.warm_up()
+
+    broken = manifest(tmp_path)
+    broken["models"]["lm"] = {"active": "v2", "versions": {"v2": str(tmp_path / "broken.pth")}}
+    write_registry(tmp_path, broken)
+    with pytest.raises(RuntimeError):
+        registry.reload()
+
+    assert registry.resolve("LM").ref == "lm@v1"
+    assert registry.status()["ready"]
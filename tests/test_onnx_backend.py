@@ -0,0 +1,63 @@
+"""
+Unit tests for ONNX export and the ONNX Runtime backend
+"""
+import json
+import numpy as np
+import pytest
+import torch
+from torchvision import models
+from app.backends import ExplainableResNet
+from app.utils.visualization import explain_and_classify
+
+
+def small_model():
+    torch.manual_seed(0)
+    model = models.resnet18(weights=None, num_classes=3).eval()
+    return model
+
+
+def test_closed_form_cams_match_gradcam():
+    """The exported per-class CAMs equal autograd Grad-CAM for the predicted class"""
+    model = small_model()
+    x = torch.randn(2, 3, 224, 224)
+
+    probs, gradcams = explain_and_classify(model, x)
+    with torch.no_grad():
+        logits, cams = ExplainableResNet(model)(x)
+
+    preds = logits.argmax(dim=1)
+    assert torch.equal(preds, probs.argmax(dim=1))
+    for i, p in enumerate(preds.tolist()):
+        assert np.allclose(torch.relu(cams[i, p]).numpy(), gradcams[i], atol=1e-5)
+
+
+def test_onnx_loader_matches_pytorch(tmp_path):
+    """OnnxModelLoader gives the same predictions and CAMs as the PyTorch model"""
+    pytest.importorskip("onnxruntime")
+    onnx = pytest.importorskip("onnx")
+    from app.onnx_backend import OnnxModelLoader
+
+    model = small_model()
+    path = str(tmp_path / "model.onnx")
+    torch.onnx.export(
+        ExplainableResNet(model).eval(), (torch.randn(1, 3, 224, 224),), path,
+        input_names=["input"], output_names=["logits", "cams"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}, "cams": {0: "batch"}},
+        opset_version=17, dynamo=False,
+    )
+    onnx_model = onnx.load(path)
+    entry = onnx_model.metadata_props.add()
+    entry.key, entry.value = "class_names", json.dumps(["healthy", "minor_damage", "severe_damage"])
+    onnx.save(onnx_model, path)
+
+    loader = OnnxModelLoader(model_path=path)
+    assert loader.is_loaded
+    x = torch.randn(3, 3, 224, 224)
+    results = loader.predict_and_explain_batch(x)
+    probs, gradcams = explain_and_classify(model, x)
+
+    assert len(results) == 3
+    for (label, confidence, cam), p, g in zip(results, probs, gradcams):
+        assert label == loader.class_names[int(p.argmax())]
+        assert abs(confidence - float(p.max())) < 1e-4
+        assert np.allclose(cam, g, atol=1e-4)
@@ -0,0 +1,84 @@
+"""
+Unit tests for image decoding and model preprocessing
+"""
+import io
+import tempfile
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+from app.utils.preprocessing import load_image_from_bytes, preprocess_for_model, preprocess_batch, ImageDecodeError
+from app.utils.uploads import upload_buffer, UploadTooLargeError
+
+
+def encode(img, fmt):
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def test_matches_torchvision_pipeline():
+    """Vectorized normalize gives the same tensor as Resize/ToTensor/Normalize"""
+    import torchvision.transforms as T
+
+    rng = np.random.default_rng(0)
+    img = Image.fromarray(rng.integers(0, 255, (224, 224, 3), dtype=np.uint8))
+    reference = T.Compose([
+        T.Resize((224, 224)),
+        T.ToTensor(),
+        T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+    ])(img).unsqueeze(0)
+
+    assert torch.allclose(preprocess_for_model(img), reference, atol=1e-5)
+
+
+def test_draft_decode_downscales_large_jpegs():
+    """With a target size, large JPEGs decode near that size; PNGs keep full size"""
+    img = Image.new("RGB", (2400, 1600), color="gray")
+
+    draft = load_image_from_bytes(encode(img, "JPEG"), target_size=(224, 224))
+    assert draft.size[0] >= 224 and draft.size[1] >= 224
+    assert draft.size[0] <= 600
+
+    assert load_image_from_bytes(encode(img, "JPEG")).size == (2400, 1600)
+    assert load_image_from_bytes(encode(img, "PNG"), target_size=(224, 224)).size == (2400, 1600)
+
+
+def test_preprocess_batch_shape():
+    """Images of different sizes are stacked into one model batch"""
+    images = [Image.new("RGB", (640, 480)), Image.new("RGB", (224, 224)), Image.new("RGBA", (300, 900)).convert("RGB")]
+    batch = preprocess_batch(images)
+    assert batch.shape == (3, 3, 224, 224)
+    assert batch.dtype == torch.float32
+
+
+def test_decodes_from_mapped_spooled_upload():
+    """Uploads spooled to disk are memory-mapped and decoded in place"""
+    data = encode(Image.new("RGB", (64, 48), color="red"), "PNG")
+    spooled = tempfile.SpooledTemporaryFile(max_size=16)
+    spooled.write(data)
+
+    buffer = upload_buffer(spooled)
+
+    assert not isinstance(buffer, bytes)  # mmap, not a copy
+    assert buffer[:] == data
+    assert load_image_from_bytes(buffer).size == (64, 48)
+    with pytest.raises(UploadTooLargeError):
+        upload_buffer(spooled, max_bytes=len(data) - 1)
+
+
+def test_rejects_images_over_pixel_limit_before_decoding():
+    """The pixel limit is checked against the header, so a bomb is never decompressed"""
+    data = encode(Image.new("L", (4000, 4000)), "PNG")  # a few KB encoded, 16 MP decoded
+    with pytest.raises(UploadTooLargeError):
+        load_image_from_bytes(data, max_pixels=1_000_000)
+    assert load_image_from_bytes(data, max_pixels=0).size == (4000, 4000)
+
+
+def test_undecodable_bytes_raise_decode_error():
+    """Garbage and truncated uploads raise ImageDecodeError (a 400 from the API), not a Pillow error"""
+    with pytest.raises(ImageDecodeError):
+        load_image_from_bytes(b"garbage")
+    truncated = encode(Image.new("RGB", (256, 256), (10, 200, 30)), "PNG")[:-40]
+    with pytest.raises(ImageDecodeError):
+        load_image_from_bytes(truncated)
@@ -0,0 +1,94 @@
+"""
+Unit tests for the content-hash result cache
+"""
+import os
+import time
+from app.result_cache import ResultCache
+
+
+def test_key_depends_on_bytes_and_model():
+    """Same bytes + same checkpoint hit the same key; a new checkpoint does not"""
+    key = ResultCache.make_key(b"image", "blade_resnet50.pth:1:1")
+    assert key == ResultCache.make_key(b"image", "blade_resnet50.pth:1:1")
+    assert key != ResultCache.make_key(b"image", "blade_resnet50.pth:1:2")
+    assert key != ResultCache.make_key(b"other", "blade_resnet50.pth:1:1")
+
+
+def test_memory_lru_and_counters():
+    """Hits and misses are counted and the LRU stays within max_entries"""
+    cache = ResultCache(max_entries=2, ttl_seconds=0)
+    cache.put("a", {"severity": "healthy"})
+    cache.put("b", {"severity": "minor_damage"})
+    assert cache.get("a") == {"severity": "healthy"}
+    cache.put("c", {"severity": "severe_damage"})  # evicts b
+
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 2
+
+
+def test_ttl_expiry():
+    """Entries older than the TTL are misses"""
+    cache = ResultCache(max_entries=8, ttl_seconds=0.05)
+    cache.put("a", {"severity": "healthy"})
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+
+def test_validate_rejects_stale_entries():
+    """Entries failing validation (e.g. heatmap deleted) are dropped and count as misses"""
+    cache = ResultCache(max_entries=8)
+    cache.put("a", {"heatmap_path": "results/gone.png"})
+    assert cache.get("a", validate=lambda value: False) is None
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 0
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    """A new cache instance pointed at the same directory sees earlier results"""
+    first = ResultCache(max_entries=8, disk_dir=str(tmp_path))
+    first.put("key", {"severity": "severe_damage", "confidence": 0.91})
+
+    second = ResultCache(max_entries=8, disk_dir=str(tmp_path))
+    assert second.get("key") == {"severity": "severe_damage", "confidence": 0.91}
+    assert second.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_stays_within_caps(tmp_path):
+    """Oldest entries (by mtime) are evicted once the disk tier exceeds its entry or byte cap"""
+    cache = ResultCache(max_entries=8, ttl_seconds=0, disk_dir=str(tmp_path), max_disk_entries=3,
+                        prune_interval_seconds=0)
+    for i in range(6):
+        cache.put(f"key{i}", {"severity": "healthy", "index": i})
+        os.utime(cache._disk_path(f"key{i}"), (1000 + i, 1000 + i))
+
+    assert cache.prune_disk() == 3
+    remaining = sorted(name for _, _, files in os.walk(tmp_path) for name in files)
+    assert remaining == ["key3.json", "key4.json", "key5.json"]
+
+    # Cap at exactly what the two newest entries take (their sizes vary with stored_at)
+    cache.max_disk_bytes = sum(os.path.getsize(cache._disk_path(key)) for key in ("key4", "key5"))
+    assert cache.prune_disk() == 1
+    assert ResultCache(max_entries=8, disk_dir=str(tmp_path)).get("key3") is None
+
+
+def test_disk_pruning_runs_in_background(tmp_path):
+    """put() never scans the disk tier itself; the pruner thread enforces the cap"""
+    cache = ResultCache(max_entries=8, ttl_seconds=0, disk_dir=str(tmp_path), max_disk_entries=2,
+                        prune_interval_seconds=0.05)
+    for i in range(5):
+        cache.put(f"key{i}", {"index": i})
+
+    deadline = time.time() + 5
+    while cache.stats()["disk_evictions"] < 3 and time.time() < deadline:
+        time.sleep(0.02)
+    assert sum(len(files) for _, _, files in os.walk(tmp_path)) == 2
+
+
+def test_disabled_cache():
+    cache = ResultCache(max_entries=0)
+    cache.put("a", {"severity": "healthy"})
+    assert cache.get("a") is None
+    assert cache.stats()["enabled"] is False
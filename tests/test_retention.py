@@ -0,0 +1,15 @@
+"""
+Unit tests for the shared oldest-first retention rules
+"""
+from app.retention import prune_oldest
+
+
+def test_prune_oldest_applies_age_size_and_count_limits():
+    """The oldest files go first, until every limit is met"""
+    entries = [(130, 10, "d"), (100, 10, "a"), (120, 10, "c"), (110, 10, "b")]
+
+    assert prune_oldest(entries) == []
+    assert prune_oldest(entries, max_count=2) == ["a", "b"]
+    assert prune_oldest(entries, max_bytes=30) == ["a"]
+    assert prune_oldest(entries, max_age_seconds=15, now=135) == ["a", "b"]
+    assert prune_oldest(entries, max_age_seconds=100, max_count=3, now=135) == ["a"]
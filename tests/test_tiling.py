@@ -0,0 +1,60 @@
+"""
+Unit tests for tiled (sliding-window) inference
+"""
+import numpy as np
+from PIL import Image, ImageDraw
+from app.tiling import plan_tiles, texture_scores, select_tiles, aggregate, tiled_predict
+
+
+def test_plan_tiles_covers_image_with_overlap():
+    """Tiles overlap by the requested fraction and the last row/column is flush with the edge"""
+    boxes, rows, cols = plan_tiles((1000, 500), tile_size=224, overlap=0.25)
+
+    assert (rows, cols) == (3, 6)
+    assert len(boxes) == rows * cols
+    assert boxes[1][0] - boxes[0][0] == 168
+    assert boxes[:, 2].max() == 1000 and boxes[:, 3].max() == 500
+    assert (boxes[:, 2] - boxes[:, 0] == 224).all()
+
+
+def test_prefilter_skips_sky_tiles():
+    """Flat sky tiles score below the texture threshold; textured blade tiles pass"""
+    rng = np.random.default_rng(0)
+    sky = np.full((448, 896, 3), (135, 185, 235), np.uint8)
+    sky[:, 448:] = rng.integers(0, 255, (448, 448, 3), dtype=np.uint8)  # right half: texture
+    image = Image.fromarray(sky)
+    boxes, _, _ = plan_tiles(image.size, tile_size=224, overlap=0.0)
+
+    scores = texture_scores(image, boxes)
+    kept = select_tiles(scores, min_texture=4.0, max_tiles=0)
+
+    assert sorted(boxes[kept][:, 0].tolist()) == [448, 448, 672, 672]
+    assert len(select_tiles(scores, min_texture=4.0, max_tiles=1)) == 1
+
+
+def test_aggregate_prefers_confident_severe_tile():
+    """One confident damaged tile decides the verdict; low-confidence damage does not"""
+    assert aggregate([("healthy", 0.9), ("minor_damage", 0.7), ("severe_damage", 0.65)], 0.6) == ("severe_damage", 0.65)
+    assert aggregate([("healthy", 0.9), ("healthy", 0.7), ("severe_damage", 0.4)], 0.6)[0] == "healthy"
+
+
+def test_tiled_predict_locates_small_damage():
+    """A small defect on a large image is found on its tile and mapped to original pixels"""
+    image = Image.new("RGB", (4000, 2000), (135, 185, 235))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((3000, 1200, 3600, 1800), fill=(200, 200, 200), outline=(0, 0, 0), width=8)
+    draw.rectangle((3200, 1400, 3260, 1460), fill=(255, 0, 0))
+
+    def predict_batch(tensor):
+        # "Damaged" when a tile contains the red defect (red channel high, green low)
+        red = tensor[:, 0] > 2.0
+        green = tensor[:, 1] < -1.5
+        return [("severe_damage", 0.9) if (r & g).any() else ("healthy", 0.8) for r, g in zip(red, green)]
+
+    severity, confidence, grid, report = tiled_predict(image, predict_batch, max_side=1000, overlap=0.25)
+
+    assert (severity, confidence) == ("severe_damage", 0.9)
+    assert grid.shape == (len(report["grid"]), len(report["grid"][0]))
+    assert 0 < report["tiles_classified"] < report["tiles_total"]
+    x0, y0, x1, y1 = report["damaged_tiles"][0]["box"]
+    assert x0 <= 3200 and 3260 <= x1 and y0 <= 1400 and 1460 <= y1
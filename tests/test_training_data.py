@@ -0,0 +1,127 @@
+"""
+Unit tests for the packed training data pipeline
+"""
+import os
+import numpy as np
+import torch
+from PIL import Image
+from training_data import (
+    open_store, make_loader, set_epoch, augment_batch, to_model_input, open_feature_cache, make_feature_loader,
+    ViewSampler,
+)
+
+
+def _make_split(root, per_class=3):
+    for label, name in enumerate(["healthy", "severe_damage"]):
+        os.makedirs(root / name)
+        for i in range(per_class):
+            Image.new("RGB", (320, 240), (40 * i, 100 * label, 50)).save(root / name / f"{i}.jpg")
+
+
+def test_store_packs_once_and_rebuilds_on_change(tmp_path):
+    """Images are decoded once into a uint8 map; the store is reused until the split changes"""
+    _make_split(tmp_path / "train")
+    (tmp_path / "train" / "healthy" / "broken.jpg").write_bytes(b"not a jpeg")
+
+    store = open_store(str(tmp_path / "train"), str(tmp_path / "packed"))
+    assert store.classes == ["healthy", "severe_damage"]
+    assert len(store) == 6 and store.index["skipped"] == ["healthy/broken.jpg"]
+    assert store.images.shape == (6, 224, 224, 3) and store.images.dtype == np.uint8
+    assert store.labels.tolist() == [0, 0, 0, 1, 1, 1]
+
+    mtime = os.path.getmtime(tmp_path / "packed" / "index.json")
+    assert open_store(str(tmp_path / "train"), str(tmp_path / "packed")).index == store.index
+    assert os.path.getmtime(tmp_path / "packed" / "index.json") == mtime
+
+    Image.new("RGB", (64, 64)).save(tmp_path / "train" / "severe_damage" / "new.jpg")
+    assert len(open_store(str(tmp_path / "train"), str(tmp_path / "packed"))) == 7
+
+
+def test_loader_yields_whole_uint8_batches(tmp_path):
+    """Each loader step is one gathered uint8 batch with its labels"""
+    _make_split(tmp_path / "train", per_class=5)
+    store = open_store(str(tmp_path / "train"), str(tmp_path / "packed"))
+
+    batches = list(make_loader(store, batch_size=4, shuffle=True))
+    assert [len(labels) for _, labels in batches] == [4, 4, 2]
+    images, labels = batches[0]
+    assert images.dtype == torch.uint8 and images.shape == (4, 224, 224, 3)
+    assert sorted(torch.cat([l for _, l in batches]).tolist()) == [0] * 5 + [1] * 5
+
+
+def test_augment_batch_keeps_shape_and_range():
+    """Batched augmentation draws per-image parameters and stays within [0, 1]"""
+    images = torch.rand(6, 3, 224, 224)
+    generator = torch.Generator().manual_seed(0)
+
+    augmented = augment_batch(images, generator=generator)
+    assert augmented.shape == images.shape
+    assert augmented.min() >= 0 and augmented.max() <= 1
+
+    # No-op parameters leave the batch untouched apart from resampling error
+    same = augment_batch(images, rotation=0, translate=0, jitter=0, generator=generator)
+    flipped = same.flip(-1)
+    per_image = torch.minimum((same - images).abs().amax(dim=(1, 2, 3)), (flipped - images).abs().amax(dim=(1, 2, 3)))
+    assert per_image.max() < 1e-4
+
+    batch = to_model_input(torch.full((2, 224, 224, 3), 255, dtype=torch.uint8), "cpu")
+    assert batch.shape == (2, 3, 224, 224)
+    assert torch.allclose(batch[:, 0], torch.tensor((1 - 0.485) / 0.229))
+
+
+def test_feature_cache_is_reused_and_keyed_on_stem(tmp_path):
+    """Stem activations are cached per view; a different stem gets its own cache"""
+    _make_split(tmp_path / "train")
+    store = open_store(str(tmp_path / "train"), str(tmp_path / "packed"))
+    torch.manual_seed(0)
+    stem = torch.nn.Sequential(torch.nn.Conv2d(3, 4, 8, stride=8), torch.nn.BatchNorm2d(4))
+
+    cache = open_feature_cache(store, stem, views=2)
+    assert len(cache) == 12 and cache.shape == (4, 28, 28)
+    with torch.no_grad():
+        expected = stem.eval()(to_model_input(store[[0]][0], "cpu"))
+    assert torch.allclose(cache[[0]][0].float(), expected, atol=1e-2)
+    # View 1 is augmented, so it differs from the plain view of the same image
+    assert not torch.allclose(cache[[6]][0].float(), expected, atol=1e-2)
+
+    assert open_feature_cache(store, stem, views=2).cache_dir == cache.cache_dir
+    with torch.no_grad():
+        stem[0].weight.mul_(2)
+    assert open_feature_cache(store, stem, views=2).cache_dir != cache.cache_dir
+
+    features, labels = next(iter(make_feature_loader(cache, batch_size=12, shuffle=True)))
+    assert features.dtype == torch.float16 and len(features) == 6
+    assert sorted(labels.tolist()) == [0, 0, 0, 1, 1, 1]
+
+
+def test_rank_shards_cover_every_sample(tmp_path):
+    """Data-parallel ranks split evaluation exactly and train on equal-sized shards"""
+    _make_split(tmp_path / "train", per_class=5)
+    store = open_store(str(tmp_path / "train"), str(tmp_path / "packed"))
+
+    shards = [make_loader(store, batch_size=2, rank=r, world_size=3) for r in range(3)]
+    labels = [l for loader in shards for _, batch in loader for l in batch.tolist()]
+    assert sorted(labels) == [0] * 5 + [1] * 5
+
+    train = [make_loader(store, batch_size=2, shuffle=True, rank=r, world_size=3) for r in range(3)]
+    assert len({len(loader) for loader in train}) == 1
+
+    samplers = [ViewSampler(10, views=2, seed=7, rank=r, world_size=3) for r in range(3)]
+    drawn = [list(sampler) for sampler in samplers]
+    assert [len(d) for d in drawn] == [4, 4, 4]
+    assert {i % 10 for d in drawn for i in d} == set(range(10))
+
+
+def test_resumed_epoch_replays_remaining_batches(tmp_path):
+    """Skipping batches of an epoch yields exactly what the uninterrupted epoch would have"""
+    _make_split(tmp_path / "train", per_class=5)
+    store = open_store(str(tmp_path / "train"), str(tmp_path / "packed"))
+    loader = make_loader(store, batch_size=3, shuffle=True, seed=3)
+
+    set_epoch(loader, 2)
+    full = [labels.tolist() for _, labels in loader]
+    set_epoch(loader, 2, skip=2)
+    assert len(loader) == 4 and [labels.tolist() for _, labels in loader] == full[2:]
+
+    set_epoch(loader, 3)
+    assert [labels.tolist() for _, labels in loader] != full
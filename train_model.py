@@ -1,48 +1,65 @@
+"""
+Fine-tune the ResNet50 blade classifier on data/train, validating on data/val
+
+Each split is decoded and resized once into a packed uint8 store (see
+training_data.py) that is reused across epochs and runs; batches are
+gathered by DataLoader workers and augmented as tensors on the device.
+
+With --cache-features the frozen conv1..layer2 activations are computed
+once per image (and per augmented view) and memory-mapped, so each epoch
+only runs layer3, layer4 and fc; useful for sweeps and retrains on CPU.
+--cache-through layer3 also freezes and caches layer3 and trains only
+layer4 and fc, which is several times faster again.
+
+Usage:
+    python train_model.py
+    python train_model.py --workers 8 --batch-size 32 --epochs 20
+    python train_model.py --rebuild-store
+    python train_model.py --cache-features --feature-views 4
+    python train_model.py --cache-features --cache-through layer3
+    python train_model.py --precision bf16 --batch-size 16 --accumulate 4
+    OMP_NUM_THREADS=4 torchrun --nproc_per_node 4 train_model.py --precision bf16
+    python train_model.py --resume
+
+Under torchrun each process trains on its shard of every epoch with
+DistributedDataParallel (gloo backend by default, so it runs on plain CPU
+boxes and across nodes); rank 0 logs and writes the checkpoint.
+
+The full training state (weights, optimizer, LR scheduler, position in the
+epoch, RNG states) is written to <checkpoint-dir>/last.pt after every epoch
+and every --checkpoint-minutes, in the background and atomically (see
+checkpointing.py); SIGTERM/SIGINT saves it at the next optimizer step and
+exits. --resume continues from it with the same batches the uninterrupted
+run would have drawn.
+"""
+import argparse
+import os
+import signal
+import time
+from contextlib import nullcontext
+
 import torch
+import torch.distributed as dist
 import torch.nn as nn
-from torch.utils.data import DataLoader
-from torchvision import datasets, models, transforms
+from torchvision import models
 from sklearn.metrics import classification_report, confusion_matrix
 import numpy as np
 
+from checkpointing import (
+    TRAIN_STATE_FORMAT, TRAIN_STATE_VERSION, AsyncCheckpointer, capture_rng_state, restore_rng_state, load_train_state,
+)
+from training_data import open_store, make_loader, set_epoch, to_model_input, open_feature_cache, make_feature_loader
+
 DATA_DIR = "data"
 BATCH_SIZE = 16
 NUM_EPOCHS = 15  # Increased from 5
 NUM_CLASSES = 3  # healthy, minor_damage, severe_damage
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
-# Enhanced data augmentation
-train_transforms = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.RandomHorizontalFlip(),
-    transforms.RandomRotation(15),
-    transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2),
-    transforms.RandomAffine(degrees=0, translate=(0.1, 0.1)),
-    transforms.ToTensor(),
-    transforms.Normalize(
-        mean=[0.485, 0.456, 0.406],
-        std=[0.229, 0.224, 0.225],
-    ),
-])
-
-val_transforms = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize(
-        mean=[0.485, 0.456, 0.406],
-        std=[0.229, 0.224, 0.225],
-    ),
-])
-
-train_dataset = datasets.ImageFolder(f"{DATA_DIR}/train", transform=train_transforms)
-val_dataset = datasets.ImageFolder(f"{DATA_DIR}/val", transform=val_transforms)
-
-train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True)
-val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False)
-
-class_names = train_dataset.classes
-
-def build_model():
+# Augmentation (flip, rotation 15, colour jitter 0.2, translate 0.1) is
+# applied per batch on the device: see training_data.augment_batch
+
+def build_model(num_classes=NUM_CLASSES):
     model = models.resnet50(weights=models.ResNet50_Weights.IMAGENET1K_V2)
     
     # Freeze early layers, unfreeze last 2 blocks for fine-tuning
@@ -56,12 +73,211 @@ def build_model():
         param.requires_grad = True
 
     num_ftrs = model.fc.in_features
-    model.fc = nn.Linear(num_ftrs, NUM_CLASSES)
+    model.fc = nn.Linear(num_ftrs, num_classes)
     return model
 
-def train():
-    model = build_model().to(DEVICE)
-    criterion = nn.CrossEntropyLoss()
+# Backbone stages in forward order; frozen_stem/forward_head split the model after one of them
+STAGES = ["layer1", "layer2", "layer3", "layer4"]
+
+def frozen_stem(model, through="layer2"):
+    """conv1 up to and including `through`, sharing the model's modules (build_model freezes through layer2)"""
+    layers = [model.conv1, model.bn1, model.relu, model.maxpool]
+    layers += [getattr(model, name) for name in STAGES[:STAGES.index(through) + 1]]
+    return nn.Sequential(*layers)
+
+def forward_head(model, features, after="layer2"):
+    """Finish the forward pass from the activations of stage `after` (see frozen_stem)"""
+    x = features
+    for name in STAGES[STAGES.index(after) + 1:]:
+        x = getattr(model, name)(x)
+    return model.fc(torch.flatten(model.avgpool(x), 1))
+
+class HeadModel(nn.Module):
+    """forward_head as a module, so DistributedDataParallel can wrap training from cached features"""
+
+    def __init__(self, model, after):
+        super().__init__()
+        self.model = model
+        self.after = after
+
+    def forward(self, features):
+        return forward_head(self.model, features, self.after)
+
+def init_distributed(args):
+    """
+    (rank, local_rank, world_size, device) for this process
+
+    Under torchrun (WORLD_SIZE > 1) the process joins the --dist-backend
+    group (gloo runs on CPU and across nodes; nccl for GPUs), one process per
+    GPU or per group of CPU cores.
+    """
+    world_size = int(os.environ.get("WORLD_SIZE", "1"))
+    local_rank = int(os.environ.get("LOCAL_RANK", "0"))
+    if world_size == 1:
+        return 0, 0, 1, torch.device(DEVICE)
+    dist.init_process_group(backend=args.dist_backend)
+    if DEVICE == "cuda":
+        torch.cuda.set_device(local_rank)
+        return dist.get_rank(), local_rank, world_size, torch.device("cuda", local_rank)
+    return dist.get_rank(), local_rank, world_size, torch.device("cpu")
+
+def local_rank_zero_first(local_rank, world_size, fn):
+    """
+    Run fn(primary=True) on each node's first process, then fn(primary=False) on the rest
+
+    Stores and feature caches are built once per node while the other ranks
+    wait, and then found up to date. --store-dir should be node-local (or
+    built beforehand with a single-process run) on multi-node jobs.
+    """
+    result = fn(True) if local_rank == 0 else None
+    if world_size > 1:
+        dist.barrier()
+    return result if local_rank == 0 else fn(False)
+
+def load_stores(args, local_rank=0, world_size=1):
+    """Packed train/val stores, (re)built from the image folders when needed"""
+    store_dir = args.store_dir or os.path.join(args.data_dir, "packed")
+
+    def open_stores(primary):
+        rebuild = args.rebuild_store and primary
+        return (
+            open_store(os.path.join(args.data_dir, "train"), os.path.join(store_dir, "train"),
+                       workers=args.workers, rebuild=rebuild),
+            open_store(os.path.join(args.data_dir, "val"), os.path.join(store_dir, "val"),
+                       workers=args.workers, rebuild=rebuild),
+        )
+
+    train_store, val_store = local_rank_zero_first(local_rank, world_size, open_stores)
+    if val_store.classes != train_store.classes:
+        raise SystemExit(f"Class folders differ: train {train_store.classes}, val {val_store.classes}")
+    return train_store, val_store
+
+def make_loaders(args, model, train_store, val_store, device, rank=0, local_rank=0, world_size=1):
+    """
+    Train/val loaders (this rank's shard) plus the network to train and its forward function
+
+    Batches are uint8 images by default, or cached float16 layer2 features
+    with --cache-features; forward(batch, train) maps either to logits
+    through the (possibly DistributedDataParallel-wrapped) network.
+    """
+    pin_memory = device.type == "cuda"
+    loader_args = dict(workers=args.workers, prefetch=args.prefetch, pin_memory=pin_memory,
+                       rank=rank, world_size=world_size)
+
+    if args.cache_features:
+        stem = frozen_stem(model, args.cache_through)
+
+        def open_caches(primary):
+            rebuild = args.rebuild_store and primary
+            return (
+                open_feature_cache(train_store, stem, views=args.feature_views, seed=args.seed,
+                                   device=device, rebuild=rebuild),
+                open_feature_cache(val_store, stem, views=1, device=device, rebuild=rebuild),
+            )
+
+        train_cache, val_cache = local_rank_zero_first(local_rank, world_size, open_caches)
+        train_loader = make_feature_loader(train_cache, args.batch_size, shuffle=True, seed=args.seed, **loader_args)
+        val_loader = make_feature_loader(val_cache, args.batch_size, **loader_args)
+        net = HeadModel(model, args.cache_through)
+    else:
+        train_loader = make_loader(train_store, args.batch_size, shuffle=True, seed=args.seed, **loader_args)
+        val_loader = make_loader(val_store, args.batch_size, **loader_args)
+        net = model
+
+    if world_size > 1:
+        # Frozen parameters are not synchronized; only layer3/layer4/fc gradients are all-reduced
+        net = nn.parallel.DistributedDataParallel(net, device_ids=[local_rank] if device.type == "cuda" else None)
+
+    if args.cache_features:
+        def forward(features, train):
+            return net(features.to(device, non_blocking=True).float())
+    else:
+        def forward(images, train):
+            return net(to_model_input(images, device, augment=train))
+
+    return train_loader, val_loader, net, forward
+
+def _all_reduce_sum(values, device, world_size):
+    """Sum a list of numbers across ranks"""
+    if world_size == 1:
+        return values
+    tensor = torch.tensor(values, dtype=torch.float64, device=device)
+    dist.all_reduce(tensor)
+    return tensor.tolist()
+
+# Settings that fix which samples each optimizer step sees; an interrupted
+# epoch is only continued mid-way when they match the checkpoint
+POSITION_SETTINGS = ["batch_size", "accumulate", "seed", "cache_features", "cache_through", "feature_views"]
+
+def resume_state(args, log):
+    """The training state to continue from with --resume, or None to start fresh"""
+    if args.resume is None:
+        return None
+    path = os.path.join(args.checkpoint_dir, "last.pt") if args.resume == "auto" else args.resume
+    if not os.path.exists(path):
+        if args.resume != "auto":
+            raise SystemExit(f"Checkpoint not found: {path}")
+        log(f"No checkpoint at {path}, starting from scratch")
+        return None
+    state = load_train_state(path)
+    log(f"Resuming from {path}: epoch {state['epoch'] + 1}, step {state['step']}")
+    return state
+
+class StopRequest:
+    """Records SIGTERM/SIGINT so the loop can checkpoint at the next optimizer step and exit"""
+
+    def __init__(self):
+        self.requested = False
+        self._previous = {}
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            self._previous[signum] = signal.signal(signum, self._handle)
+
+    def _handle(self, signum, frame):
+        self.requested = True
+
+    def restore(self):
+        for signum, handler in self._previous.items():
+            signal.signal(signum, handler)
+
+def _broadcast_flags(flags, device, world_size):
+    """Rank 0's booleans on every rank, so all ranks take the same checkpoint/stop decision"""
+    if world_size == 1:
+        return flags
+    tensor = torch.tensor([int(flag) for flag in flags], device=device)
+    dist.broadcast(tensor, 0)
+    return [bool(flag) for flag in tensor.tolist()]
+
+def _gather_rng_states(world_size):
+    """Every rank's RNG states (a collective call), indexed by rank"""
+    state = capture_rng_state()
+    if world_size == 1:
+        return [state]
+    states = [None] * world_size
+    dist.all_gather_object(states, state)
+    return states
+
+def train(args):
+    rank, local_rank, world_size, device = init_distributed(args)
+    # Every exit, including resuming a finished run or a config mismatch, tears the process group down
+    try:
+        _train(args, rank, local_rank, world_size, device)
+    finally:
+        if world_size > 1:
+            dist.destroy_process_group()
+
+def _train(args, rank, local_rank, world_size, device):
+    log = print if rank == 0 else (lambda *a, **k: None)
+    # Each rank draws its own augmentation parameters
+    torch.manual_seed(args.seed + rank)
+
+    train_store, val_store = load_stores(args, local_rank, world_size)
+    class_names = train_store.classes
+
+    model = build_model(len(class_names)).to(device)
+    if args.cache_features:
+        # Cached stages are fixed; their parameters get no gradients and Adam skips them
+        for param in frozen_stem(model, args.cache_through).parameters():
+            param.requires_grad = False
     
     # Different learning rates for different layers
     optimizer = torch.optim.Adam([
@@ -71,66 +287,218 @@ def train():
     ])
     
     # Learning rate scheduler
-    scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=3, verbose=True)
+    scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=3)
     
     best_val_acc = 0.0
     patience_counter = 0
     early_stop_patience = 5
+    start_epoch, start_step = 0, 0
+    running_loss, seen = 0.0, 0
 
-    for epoch in range(NUM_EPOCHS):
-        model.train()
-        running_loss = 0.0
-
-        for inputs, labels in train_loader:
-            inputs, labels = inputs.to(DEVICE), labels.to(DEVICE)
-            optimizer.zero_grad()
-            outputs = model(inputs)
-            loss = criterion(outputs, labels)
-            loss.backward()
-            optimizer.step()
-            running_loss += loss.item() * inputs.size(0)
-
-        epoch_loss = running_loss / len(train_dataset)
-
-        # Validation
-        model.eval()
-        correct = 0
-        total = 0
-        with torch.no_grad():
-            for inputs, labels in val_loader:
-                inputs, labels = inputs.to(DEVICE), labels.to(DEVICE)
-                outputs = model(inputs)
-                _, preds = torch.max(outputs, 1)
-                correct += torch.sum(preds == labels).item()
-                total += labels.size(0)
-        val_acc = correct / total
-
-        # Learning rate scheduling
-        scheduler.step(epoch_loss)
-
-        print(f"Epoch {epoch+1}/{NUM_EPOCHS} - loss: {epoch_loss:.4f}, val_acc: {val_acc:.4f}")
-
-        # Early stopping and best model saving
-        if val_acc > best_val_acc:
-            best_val_acc = val_acc
-            patience_counter = 0
-            # Save best model
-            torch.save(
-                {
-                    "model_state_dict": model.state_dict(),
-                    "class_names": class_names,
-                },
-                "models/blade_resnet50.pth",
-            )
-            print(f"  → New best validation accuracy: {best_val_acc:.4f}, model saved!")
+    # Restored before the loaders are built, so the feature cache and DDP see the resumed weights
+    state = resume_state(args, log)
+    if state is not None:
+        if state["class_names"] != class_names:
+            raise SystemExit(f"Checkpoint classes {state['class_names']} differ from the data's {class_names}")
+        if state.get("finished"):
+            log("That run already finished (early stopping); nothing to resume")
+            return
+        model.load_state_dict(state["model_state_dict"])
+        optimizer.load_state_dict(state["optimizer"])
+        scheduler.load_state_dict(state["scheduler"])
+        best_val_acc, patience_counter = state["best_val_acc"], state["patience_counter"]
+        start_epoch, start_step = state["epoch"], state["step"]
+        saved = state["config"]
+        same_position = saved["world_size"] == world_size and all(
+            saved[name] == getattr(args, name) for name in POSITION_SETTINGS
+        )
+        if start_step and not same_position:
+            log(f"Batching settings changed since the checkpoint; restarting epoch {start_epoch + 1} from its start")
+            start_step = 0
+        elif start_step and rank == 0:
+            # The interrupted epoch's loss so far (summed over ranks) is kept on rank 0
+            running_loss, seen = state["running_loss"], state["seen"]
+        if len(state["rng"]) == world_size:
+            restore_rng_state(state["rng"][rank])
         else:
-            patience_counter += 1
-            if patience_counter >= early_stop_patience:
-                print(f"Early stopping at epoch {epoch+1} (no improvement for {early_stop_patience} epochs)")
+            torch.manual_seed(args.seed + rank + world_size * start_epoch)
+
+    train_loader, val_loader, net, forward = make_loaders(
+        args, model, train_store, val_store, device, rank, local_rank, world_size
+    )
+    criterion = nn.CrossEntropyLoss()
+
+    # bf16 autocast runs convolutions and matmuls in bfloat16 (weights and the
+    # optimizer stay fp32; bf16 keeps fp32's range, so no loss scaling is needed)
+    autocast = lambda: torch.autocast(device.type, dtype=torch.bfloat16, enabled=args.precision == "bf16")
+
+    log(f"Training on {world_size} process(es), {device.type}, {args.precision}: "
+        f"effective batch {args.batch_size * args.accumulate * world_size} "
+        f"({args.batch_size} x {args.accumulate} accumulation steps x {world_size})")
+
+    # Rank 0 writes all checkpoints on a background thread, atomically
+    checkpointer = AsyncCheckpointer() if rank == 0 else None
+    last_path = os.path.join(args.checkpoint_dir, "last.pt")
+    config = {name: getattr(args, name) for name in POSITION_SETTINGS}
+    config.update(world_size=world_size, precision=args.precision)
+
+    def save_state(epoch, step, loss_sum, count, finished=False):
+        """Full training state after `step` micro-batches of `epoch` (collective under DDP)"""
+        rng = _gather_rng_states(world_size)
+        if rank == 0:
+            checkpointer.save({
+                "format": TRAIN_STATE_FORMAT,
+                "version": TRAIN_STATE_VERSION,
+                "model_state_dict": model.state_dict(),
+                "class_names": class_names,
+                "optimizer": optimizer.state_dict(),
+                "scheduler": scheduler.state_dict(),
+                "epoch": epoch,
+                "step": step,
+                "finished": finished,
+                "best_val_acc": best_val_acc,
+                "patience_counter": patience_counter,
+                "running_loss": loss_sum,
+                "seen": count,
+                "rng": rng,
+                "config": config,
+            }, last_path)
+
+    stop = StopRequest()
+    last_save = time.monotonic()
+    try:
+        for epoch in range(start_epoch, args.epochs):
+            net.train()
+            skip = start_step if epoch == start_epoch else 0
+            set_epoch(train_loader, epoch, skip)
+            if epoch != start_epoch:
+                running_loss, seen = 0.0, 0
+            steps = len(train_loader)
+
+            optimizer.zero_grad(set_to_none=True)
+            for step, (inputs, labels) in enumerate(train_loader, start=skip):
+                labels = labels.to(device, non_blocking=True)
+                # Micro-batches of one optimizer step; the last one of an epoch may be short
+                window = min(args.accumulate, steps - step // args.accumulate * args.accumulate)
+                apply = (step + 1) % args.accumulate == 0 or step + 1 == steps
+                # Gradients are all-reduced only on the micro-batch that applies them
+                sync = net.no_sync() if world_size > 1 and not apply else nullcontext()
+                with sync:
+                    with autocast():
+                        outputs = forward(inputs, True)
+                    loss = criterion(outputs.float(), labels)
+                    (loss / window).backward()
+                running_loss += loss.item() * inputs.size(0)
+                seen += inputs.size(0)
+                if not apply:
+                    continue
+                optimizer.step()
+                optimizer.zero_grad(set_to_none=True)
+
+                # Mid-epoch snapshots, taken between optimizer steps when due or on a stop signal
+                if step + 1 == steps:
+                    continue
+                due = args.checkpoint_minutes > 0 and time.monotonic() - last_save >= args.checkpoint_minutes * 60
+                due, stopping = _broadcast_flags([due or stop.requested, stop.requested], device, world_size)
+                if due:
+                    loss_sum, count = _all_reduce_sum([running_loss, seen], device, world_size)
+                    save_state(epoch, step + 1, loss_sum if rank == 0 else 0.0, count if rank == 0 else 0)
+                    last_save = time.monotonic()
+                if stopping:
+                    log(f"Stopped at epoch {epoch+1}, step {step+1}; continue with --resume")
+                    return
+
+            running_loss, seen = _all_reduce_sum([running_loss, seen], device, world_size)
+            epoch_loss = running_loss / seen
+
+            # Validation
+            net.eval()
+            correct = 0
+            total = 0
+            with torch.no_grad(), autocast():
+                for inputs, labels in val_loader:
+                    labels = labels.to(device, non_blocking=True)
+                    outputs = forward(inputs, False)
+                    _, preds = torch.max(outputs, 1)
+                    correct += torch.sum(preds == labels).item()
+                    total += labels.size(0)
+            correct, total = _all_reduce_sum([correct, total], device, world_size)
+            val_acc = correct / total
+
+            # Learning rate scheduling
+            scheduler.step(epoch_loss)
+
+            log(f"Epoch {epoch+1}/{args.epochs} - loss: {epoch_loss:.4f}, val_acc: {val_acc:.4f}, "
+                f"lr: {optimizer.param_groups[0]['lr']:.1e}")
+
+            # Early stopping and best model saving (every rank sees the same reduced val_acc)
+            finished = False
+            if val_acc > best_val_acc:
+                best_val_acc = val_acc
+                patience_counter = 0
+                # Save best model: the plain ResNet50 state dict (no DDP "module." prefix)
+                # and class names, as ModelLoader expects; written atomically, so a
+                # crash mid-save never leaves a truncated serving checkpoint
+                if rank == 0:
+                    checkpointer.save({"model_state_dict": model.state_dict(), "class_names": class_names},
+                                      args.output)
+                log(f"  → New best validation accuracy: {best_val_acc:.4f}, model saved!")
+            else:
+                patience_counter += 1
+                finished = patience_counter >= early_stop_patience
+
+            save_state(epoch + 1, 0, 0.0, 0, finished=finished)
+            last_save = time.monotonic()
+            if finished:
+                log(f"Early stopping at epoch {epoch+1} (no improvement for {early_stop_patience} epochs)")
                 break
+            if _broadcast_flags([stop.requested], device, world_size)[0]:
+                log(f"Stopped after epoch {epoch+1}; continue with --resume")
+                return
+
+        log(f"\nTraining complete! Best validation accuracy: {best_val_acc:.4f}")
+        log(f"Model saved to {args.output}")
+    finally:
+        stop.restore()
+        if checkpointer is not None:
+            checkpointer.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fine-tune the ResNet50 blade damage classifier")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Directory with train/ and val/ class folders")
+    parser.add_argument("--store-dir", default=None,
+                        help="Where the packed uint8 stores are kept (default: <data-dir>/packed)")
+    parser.add_argument("--rebuild-store", action="store_true",
+                        help="Re-decode the images even if the packed stores are up to date")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Images per micro-batch (per process)")
+    parser.add_argument("--accumulate", type=int, default=1,
+                        help="Micro-batches per optimizer step; effective batch = batch size x accumulate x processes")
+    parser.add_argument("--precision", choices=["fp32", "bf16"], default="fp32",
+                        help="bf16 autocast; fastest on CPUs with AVX512-BF16/AMX and on Ampere+ GPUs")
+    parser.add_argument("--dist-backend", default="gloo",
+                        help="torch.distributed backend when launched with torchrun (gloo, or nccl for GPUs)")
+    parser.add_argument("--output", default=os.path.join("models", "blade_resnet50.pth"),
+                        help="Where the best checkpoint is saved")
+    parser.add_argument("--epochs", type=int, default=NUM_EPOCHS)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="DataLoader worker processes for packing and batch loading (0 = in-process)")
+    parser.add_argument("--prefetch", type=int, default=2, help="Batches each worker loads ahead")
+    parser.add_argument("--cache-features", action="store_true",
+                        help="Train layer3/layer4/fc from cached conv1..layer2 activations")
+    parser.add_argument("--cache-through", choices=["layer2", "layer3"], default="layer2",
+                        help="Last cached (and frozen) stage; layer3 trains only layer4 and fc")
+    parser.add_argument("--feature-views", type=int, default=4,
+                        help="Cached views per training image (1 plain + augmented ones); each costs "
+                             "~0.8 MB per image on disk through layer2, ~0.4 MB through layer3")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for shuffling, the cached augmentations and view sampling")
+    parser.add_argument("--checkpoint-dir", default="checkpoints",
+                        help="Where the resumable training state (last.pt) is written")
+    parser.add_argument("--checkpoint-minutes", type=float, default=10.0,
+                        help="Also snapshot the training state mid-epoch this often (0 = only at epoch ends)")
+    parser.add_argument("--resume", nargs="?", const="auto", default=None, metavar="PATH",
+                        help="Continue from a training-state checkpoint (default: <checkpoint-dir>/last.pt if present)")
+    return parser.parse_args(argv)
 
-    print(f"\nTraining complete! Best validation accuracy: {best_val_acc:.4f}")
-    print("Model saved to models/blade_resnet50.pth")
 
 if __name__ == "__main__":
-    train()
+    train(parse_args())
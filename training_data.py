@@ -0,0 +1,544 @@
+"""
+Training input pipeline: decode once, train from a memory-mapped uint8 store
+
+ImageFolder re-decoded every JPEG and re-ran the PIL resize on every epoch,
+so with a ResNet50 on a few CPU cores most of an epoch went to libjpeg.
+Here each split (data/train, data/val, ...) is decoded and resized once,
+with the same draft decode and resize as the API (so training sees exactly
+the pixels serving will), into a packed store:
+
+    <store_dir>/images.u8    raw (N, 224, 224, 3) uint8, memory-mapped
+    <store_dir>/index.json   class names, per-image labels and source files
+
+The store is rebuilt automatically when files under the split change.
+Batches are gathered from the memory map by DataLoader workers (one slice
+copy per batch, prefetched and pinned), and augmentation runs on whole
+batches as tensor ops on the training device instead of per image in PIL.
+"""
+import hashlib
+import itertools
+import json
+import os
+
+import numpy as np
+
+from app.utils.archives import IMAGE_EXTENSIONS
+from app.utils.preprocessing import IMAGENET_MEAN, IMAGENET_STD, MODEL_INPUT_SIZE, load_image_from_bytes, model_pixels
+
+STORE_VERSION = 1
+
+IMAGES_FILE = "images.u8"
+
+INDEX_FILE = "index.json"
+
+FRAME_SHAPE = (MODEL_INPUT_SIZE[1], MODEL_INPUT_SIZE[0], 3)
+
+
+def scan_image_folder(root):
+    """
+    (classes, [(relative path, label), ...]) for an ImageFolder layout (root/<class>/<image>)
+
+    Classes are the sorted subdirectory names, as torchvision's ImageFolder
+    assigns them, so label indices match checkpoints trained before.
+    """
+    classes = sorted(entry.name for entry in os.scandir(root) if entry.is_dir() and not entry.name.startswith("."))
+    samples = []
+    for label, name in enumerate(classes):
+        for dirpath, dirnames, filenames in os.walk(os.path.join(root, name)):
+            dirnames.sort()
+            samples.extend(
+                (os.path.relpath(os.path.join(dirpath, f), root), label) for f in sorted(filenames)
+                if f.lower().endswith(IMAGE_EXTENSIONS) and not f.startswith(".")
+            )
+    return classes, samples
+
+
+def _fingerprint(root, samples):
+    """Changes whenever an image is added, removed, relabelled or rewritten"""
+    digest = hashlib.sha256()
+    for path, label in samples:
+        stat = os.stat(os.path.join(root, path))
+        digest.update(f"{path}\0{label}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+class _DecodeDataset:
+    """Model-sized uint8 pixels of each source image; None for files that cannot be decoded"""
+
+    def __init__(self, root, samples):
+        self.root = root
+        self.samples = samples
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, index):
+        try:
+            with open(os.path.join(self.root, self.samples[index][0]), "rb") as f:
+                return index, model_pixels(load_image_from_bytes(f.read(), target_size=MODEL_INPUT_SIZE))
+        except Exception as e:
+            print(f"Skipping {self.samples[index][0]}: {e}")
+            return index, None
+
+
+def _collate_decoded(items):
+    return items
+
+
+def build_store(image_dir, store_dir, workers=0, batch_size=64):
+    """
+    Decode and resize every image under image_dir once into a packed store in store_dir
+
+    Undecodable files are skipped and listed in the index. The images file is
+    written first and the index last, both via a rename, so an interrupted
+    build never leaves a store that looks complete.
+
+    Returns:
+        The PackedImageStore
+    """
+    from torch.utils.data import DataLoader
+
+    classes, samples = scan_image_folder(image_dir)
+    if not samples:
+        raise ValueError(f"No images found under {image_dir}")
+    fingerprint = _fingerprint(image_dir, samples)
+
+    os.makedirs(store_dir, exist_ok=True)
+    images_path = os.path.join(store_dir, IMAGES_FILE)
+    frame_bytes = int(np.prod(FRAME_SHAPE))
+    images = np.memmap(images_path + ".tmp", dtype=np.uint8, mode="w+", shape=(len(samples), *FRAME_SHAPE))
+
+    loader = DataLoader(
+        _DecodeDataset(image_dir, samples),
+        batch_size=batch_size,
+        num_workers=workers,
+        collate_fn=_collate_decoded,
+    )
+    files, labels, skipped = [], [], []
+    for batch in loader:
+        for index, pixels in batch:
+            path, label = samples[index]
+            if pixels is None:
+                skipped.append(path)
+                continue
+            images[len(files)] = pixels
+            files.append(path)
+            labels.append(label)
+    images.flush()
+    del images
+    # Drop the rows reserved for skipped files
+    os.truncate(images_path + ".tmp", len(files) * frame_bytes)
+    os.replace(images_path + ".tmp", images_path)
+
+    index = {
+        "version": STORE_VERSION,
+        "source": os.path.abspath(image_dir),
+        "fingerprint": fingerprint,
+        "shape": list(FRAME_SHAPE),
+        "classes": classes,
+        "files": files,
+        "labels": labels,
+        "skipped": skipped,
+    }
+    index_path = os.path.join(store_dir, INDEX_FILE)
+    with open(index_path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(index_path + ".tmp", index_path)
+    print(f"Packed {len(files)} images from {image_dir} into {store_dir} ({len(skipped)} skipped)")
+    return PackedImageStore(store_dir)
+
+
+def open_store(image_dir, store_dir, workers=0, rebuild=False):
+    """The packed store for image_dir, (re)building it when missing or out of date"""
+    if not rebuild:
+        try:
+            store = PackedImageStore(store_dir)
+        except (OSError, ValueError):
+            store = None
+        if store is not None and store.index["fingerprint"] == _fingerprint(image_dir, scan_image_folder(image_dir)[1]):
+            return store
+    return build_store(image_dir, store_dir, workers=workers)
+
+
+class PackedImageStore:
+    """
+    Batch-indexed dataset over a packed store
+
+    Indexed with a list of sample indices (use it with an EpochBatchSampler and
+    batch_size=None); returns (uint8 (N, 224, 224, 3) tensor, int64 labels).
+    The memory map is opened on first access in each process, so DataLoader
+    workers share the page cache instead of copying the store.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        if self.index.get("version") != STORE_VERSION or tuple(self.index["shape"]) != FRAME_SHAPE:
+            raise ValueError(f"{store_dir} holds an incompatible store; rebuild it")
+        size = os.path.getsize(os.path.join(store_dir, IMAGES_FILE))
+        if size != len(self.index["labels"]) * int(np.prod(FRAME_SHAPE)):
+            raise ValueError(f"{store_dir}/{IMAGES_FILE} does not match its index; rebuild it")
+        self.classes = self.index["classes"]
+        self.labels = np.asarray(self.index["labels"], dtype=np.int64)
+        self._images = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def images(self):
+        if self._images is None:
+            self._images = np.memmap(
+                os.path.join(self.store_dir, IMAGES_FILE), dtype=np.uint8, mode="r", shape=(len(self), *FRAME_SHAPE)
+            )
+        return self._images
+
+    def __getstate__(self):
+        # Workers re-open the map instead of pickling it
+        return {**self.__dict__, "_images": None}
+
+    def __getitem__(self, indices):
+        import torch
+
+        # Ascending order reads the map sequentially; order within a batch does not matter
+        indices = np.sort(np.asarray(indices, dtype=np.int64))
+        return torch.from_numpy(self.images[indices]), torch.from_numpy(self.labels[indices])
+
+
+def _shard_sampler(dataset, shuffle, rank, world_size, seed):
+    """
+    Sample indices for one data-parallel rank
+
+    Shuffled (training) samplers are a pure function of (seed, epoch), so an
+    interrupted epoch can be replayed in the same order; they give every rank
+    the same number of samples (DistributedSampler pads by repeating a few),
+    so all ranks run the same number of steps. Unshuffled (evaluation)
+    samplers split the indices exactly, so metrics summed across ranks count
+    every sample once.
+    """
+    from torch.utils.data import DistributedSampler
+
+    if shuffle:
+        return DistributedSampler(dataset, num_replicas=world_size, rank=rank, shuffle=True, seed=seed)
+    return range(rank, len(dataset), world_size)
+
+
+class EpochBatchSampler:
+    """
+    Batches of a sampler, with set_epoch(epoch, skip) to reshuffle and to skip
+    the batches an interrupted epoch already trained on (without loading them)
+    """
+
+    def __init__(self, sampler, batch_size, drop_last=False):
+        from torch.utils.data import BatchSampler
+
+        self.sampler = sampler
+        self._batches = BatchSampler(sampler, batch_size, drop_last)
+        self._skip = 0
+
+    def set_epoch(self, epoch, skip=0):
+        if hasattr(self.sampler, "set_epoch"):
+            self.sampler.set_epoch(epoch)
+        self._skip = skip
+
+    def __len__(self):
+        return len(self._batches)
+
+    def __iter__(self):
+        skip, self._skip = self._skip, 0
+        return itertools.islice(iter(self._batches), skip, None)
+
+
+def set_epoch(loader, epoch, skip=0):
+    """Reshuffle a training loader for epoch and start it after its first skip batches"""
+    loader.sampler.set_epoch(epoch, skip)
+
+
+def make_loader(store, batch_size, shuffle=False, workers=0, prefetch=2, pin_memory=False, drop_last=False,
+                rank=0, world_size=1, seed=0):
+    """DataLoader yielding whole uint8 batches from a PackedImageStore (this rank's share of them)"""
+    import torch
+    from torch.utils.data import DataLoader
+
+    sampler = _shard_sampler(store, shuffle, rank, world_size, seed)
+    return DataLoader(
+        store,
+        sampler=EpochBatchSampler(sampler, batch_size, drop_last),
+        batch_size=None,
+        num_workers=workers,
+        prefetch_factor=prefetch if workers else None,
+        persistent_workers=workers > 0,
+        pin_memory=pin_memory,
+        # Worker seeds come from here, not the global RNG, so a resumed run draws the same augmentations
+        generator=torch.Generator().manual_seed(seed),
+    )
+
+
+def _grayscale(images):
+    return (0.299 * images[:, 0:1] + 0.587 * images[:, 1:2] + 0.114 * images[:, 2:3])
+
+
+def augment_batch(images, rotation=15.0, translate=0.1, jitter=0.2, generator=None):
+    """
+    Random flip, rotation, translation and colour jitter for a whole batch at once
+
+    The batched equivalent of the per-image torchvision pipeline the script
+    used (RandomHorizontalFlip, RandomRotation(15), ColorJitter(0.2, 0.2,
+    0.2), RandomAffine(translate=(0.1, 0.1))): each image draws its own
+    parameters, and flip, rotation and translation are applied as a single
+    affine resample.
+
+    Args:
+        images: (N, 3, H, W) float tensor in [0, 1], on any device
+        rotation: Maximum rotation in degrees
+        translate: Maximum shift as a fraction of the image size
+        jitter: Maximum relative change of brightness, contrast and saturation
+        generator: Optional CPU torch.Generator for reproducible draws
+
+    Returns:
+        Augmented (N, 3, H, W) float tensor in [0, 1]
+    """
+    import math
+    import torch
+    import torch.nn.functional as F
+
+    n = images.shape[0]
+
+    def uniform(low, high):
+        return (torch.rand(n, generator=generator) * (high - low) + low).to(images.device)
+
+    # Colour jitter: brightness, contrast (around each image's mean grey), saturation
+    view = (n, 1, 1, 1)
+    images = (images * uniform(1 - jitter, 1 + jitter).view(view)).clamp_(0, 1)
+    mean = _grayscale(images).mean(dim=(2, 3), keepdim=True)
+    images = ((images - mean) * uniform(1 - jitter, 1 + jitter).view(view) + mean).clamp_(0, 1)
+    gray = _grayscale(images)
+    images = ((images - gray) * uniform(1 - jitter, 1 + jitter).view(view) + gray).clamp_(0, 1)
+
+    # Output -> input sampling grid: rotate, mirror x for flipped images, shift
+    angle = uniform(-rotation, rotation) * (math.pi / 180)
+    flip = torch.where(torch.rand(n, generator=generator) < 0.5, -1.0, 1.0).to(images.device)
+    cos, sin = torch.cos(angle), torch.sin(angle)
+    theta = torch.stack([
+        torch.stack([cos * flip, -sin, uniform(-translate, translate) * 2], dim=1),
+        torch.stack([sin * flip, cos, uniform(-translate, translate) * 2], dim=1),
+    ], dim=1)
+    grid = F.affine_grid(theta, list(images.shape), align_corners=False)
+    # Zero padding leaves black corners, as torchvision's rotation does
+    return F.grid_sample(images, grid, mode="bilinear", padding_mode="zeros", align_corners=False)
+
+
+def to_model_input(images, device, augment=False, generator=None):
+    """
+    uint8 (N, H, W, 3) batch -> normalized (N, 3, H, W) float tensor on device
+
+    The uint8 batch is moved first, so only a quarter of the float bytes
+    cross to the GPU, and augmentation runs there.
+    """
+    import torch
+
+    images = images.to(device, non_blocking=True).permute(0, 3, 1, 2).float().div_(255)
+    if augment:
+        images = augment_batch(images, generator=generator)
+    mean = torch.tensor(IMAGENET_MEAN, device=images.device).view(1, 3, 1, 1)
+    std = torch.tensor(IMAGENET_STD, device=images.device).view(1, 3, 1, 1)
+    return images.sub_(mean).div_(std).contiguous()
+
+
+# Frozen-backbone feature cache
+#
+# build_model freezes conv1 through layer2, so for a fixed input their output
+# never changes. With --cache-features those activations are computed once
+# per (image, augmented view) and stored as float16; training then runs only
+# layer3, layer4 and fc. The stem runs in eval mode (ImageNet BatchNorm
+# statistics), which is what makes its output cacheable.
+
+FEATURES_FILE = "features.f16"
+
+FEATURE_BATCH_SIZE = 32
+
+
+def _stem_digest(stem):
+    digest = hashlib.sha256()
+    for name, tensor in stem.state_dict().items():
+        digest.update(name.encode())
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()
+
+
+def feature_cache_key(store, stem, views, seed):
+    """Identifies a feature cache: store contents, stem weights and augmentation settings"""
+    digest = hashlib.sha256(f"{STORE_VERSION}\0{store.index['fingerprint']}\0{views}\0{seed}\0{FEATURE_BATCH_SIZE}".encode())
+    digest.update(_stem_digest(stem).encode())
+    return digest.hexdigest()
+
+
+def build_feature_cache(store, stem, cache_dir, views=1, seed=0, device="cpu", key=None):
+    """
+    Run the frozen stem over every image of a store and memory-map the activations
+
+    View 0 is the plain image; views 1.. are augmented (see augment_batch)
+    with draws seeded by (seed, view, batch), so a rebuild reproduces them.
+
+    Args:
+        store: PackedImageStore
+        stem: Module mapping a normalized (N, 3, 224, 224) batch to activations
+        cache_dir: Directory for features.f16 and index.json
+        views: Feature maps per image, including the unaugmented one
+        seed: Base seed for the augmented views
+        device: Where the stem runs
+        key: feature_cache_key of these inputs, recorded in the index
+
+    Returns:
+        The FeatureCache
+    """
+    import torch
+
+    stem = stem.to(device).eval()
+    count = len(store)
+    with torch.no_grad():
+        shape = tuple(stem(torch.zeros(1, 3, *MODEL_INPUT_SIZE[::-1], device=device)).shape[1:])
+
+    os.makedirs(cache_dir, exist_ok=True)
+    features_path = os.path.join(cache_dir, FEATURES_FILE)
+    features = np.memmap(features_path + ".tmp", dtype=np.float16, mode="w+", shape=(views * count, *shape))
+    for view in range(views):
+        for start in range(0, count, FEATURE_BATCH_SIZE):
+            images, _ = store[np.arange(start, min(start + FEATURE_BATCH_SIZE, count))]
+            generator = torch.Generator().manual_seed(seed * 1_000_003 + view * 10_007 + start)
+            with torch.no_grad():
+                batch = stem(to_model_input(images, device, augment=view > 0, generator=generator))
+            offset = view * count + start
+            features[offset:offset + len(batch)] = batch.cpu().numpy().astype(np.float16)
+    features.flush()
+    del features
+    os.replace(features_path + ".tmp", features_path)
+
+    index = {"version": STORE_VERSION, "key": key, "views": views, "count": count, "shape": list(shape)}
+    index_path = os.path.join(cache_dir, INDEX_FILE)
+    with open(index_path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(index_path + ".tmp", index_path)
+    print(f"Cached {views} x {count} feature maps of shape {shape} in {cache_dir}")
+    return FeatureCache(cache_dir, store.labels)
+
+
+def open_feature_cache(store, stem, views=1, seed=0, device="cpu", rebuild=False):
+    """
+    The feature cache for a store (under <store_dir>/features/), building it when missing
+
+    Caches are keyed on the store contents, stem weights, views and seed, so
+    a changed dataset or backbone gets a fresh cache instead of stale features.
+    """
+    key = feature_cache_key(store, stem, views, seed)
+    cache_dir = os.path.join(store.store_dir, "features", key[:16])
+    if not rebuild:
+        try:
+            cache = FeatureCache(cache_dir, store.labels)
+        except (OSError, ValueError):
+            cache = None
+        if cache is not None and cache.index["key"] == key:
+            return cache
+    return build_feature_cache(store, stem, cache_dir, views=views, seed=seed, device=device, key=key)
+
+
+class FeatureCache:
+    """
+    Batch-indexed dataset over cached stem activations
+
+    Flat index view * N + image; returns (float16 (B, C, H, W) tensor, int64
+    labels). Use ViewSampler to draw one view of every image per epoch.
+    """
+
+    def __init__(self, cache_dir, labels):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self.views = self.index["views"]
+        self.count = self.index["count"]
+        self.shape = tuple(self.index["shape"])
+        if len(labels) != self.count or self.index.get("version") != STORE_VERSION:
+            raise ValueError(f"{cache_dir} does not match its store; rebuild it")
+        size = os.path.getsize(os.path.join(cache_dir, FEATURES_FILE))
+        if size != self.views * self.count * int(np.prod(self.shape)) * 2:
+            raise ValueError(f"{cache_dir}/{FEATURES_FILE} does not match its index; rebuild it")
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self._features = None
+
+    def __len__(self):
+        return self.views * self.count
+
+    @property
+    def features(self):
+        if self._features is None:
+            self._features = np.memmap(
+                os.path.join(self.cache_dir, FEATURES_FILE), dtype=np.float16, mode="r",
+                shape=(len(self), *self.shape),
+            )
+        return self._features
+
+    def __getstate__(self):
+        return {**self.__dict__, "_features": None}
+
+    def __getitem__(self, indices):
+        import torch
+
+        indices = np.sort(np.asarray(indices, dtype=np.int64))
+        return torch.from_numpy(self.features[indices]), torch.from_numpy(self.labels[indices % self.count])
+
+
+class ViewSampler:
+    """
+    Every image once per epoch, in random order, each as a randomly chosen cached view
+
+    The draw is a pure function of (seed, epoch); see set_epoch. With
+    world_size > 1 every rank draws the same permutation and takes every
+    world_size-th entry, padded by wrapping so ranks run the same number of
+    steps.
+    """
+
+    def __init__(self, count, views, seed=0, rank=0, world_size=1):
+        self.count = count
+        self.views = views
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return -(-self.count // self.world_size)
+
+    def __iter__(self):
+        rng = np.random.default_rng([self.seed, self.epoch])
+        order = rng.permutation(self.count)
+        view = rng.integers(0, self.views, self.count)
+        flat = view * self.count + order
+        flat = np.resize(flat, len(self) * self.world_size)  # pads by repeating from the start
+        return iter(flat[self.rank::self.world_size].tolist())
+
+
+def make_feature_loader(cache, batch_size, shuffle=False, workers=0, prefetch=2, pin_memory=False, seed=0,
+                        rank=0, world_size=1):
+    """DataLoader yielding float16 feature batches; shuffled loaders draw one view per image per epoch"""
+    import torch
+    from torch.utils.data import DataLoader
+
+    # Unshuffled (validation) loaders read view 0, the unaugmented features
+    if shuffle:
+        sampler = ViewSampler(cache.count, cache.views, seed, rank, world_size)
+    else:
+        sampler = range(rank, cache.count, world_size)
+    return DataLoader(
+        cache,
+        sampler=EpochBatchSampler(sampler, batch_size),
+        batch_size=None,
+        num_workers=workers,
+        prefetch_factor=prefetch if workers else None,
+        persistent_workers=workers > 0,
+        pin_memory=pin_memory,
+        generator=torch.Generator().manual_seed(seed),
+    )